@@ -0,0 +1,57 @@
+import hashlib
+import json
+import timeit
+
+from utils import create_signature, get_random_string, logger
+
+### run :: python benchmark_signature.py
+
+
+def create_signature_baseline(data, secret_key):
+    # create_signature exactly as it was before, the f-strings format the whole payload even when INFO is off
+    logger.info(f"getting signature data >>>>>>>>>>>>>>>> {data}")
+    logger.info(f"getting merchant secret key >>>>>>>>>>>>>>>> {secret_key}")
+    params = json.dumps(data, separators=(',', ':'))
+    logger.info(f"getting seperator data >>>>>>>>>>>>>> {params}")
+    final_string = '%s%s' % (params, secret_key)
+    signature = hashlib.sha256(final_string.encode()).hexdigest()
+    logger.info(f"getting signature {signature}")
+    # add this signature to the request body and post
+    return signature
+
+
+def benchmark_signature(sizes=(1, 100, 1000), number=100):
+    secret_key = get_random_string()
+    results = {}
+    for size in sizes:
+        data = {
+            "requestId": get_random_string(8),
+            "sellerGst": "27AAAPL1234C1ZV",
+            "ledgerData": [
+                {
+                    "invoiceNo": f"INV/{index:06d}",
+                    "invoiceDate": "01/04/2024",
+                    "invoiceAmt": f"{1000 + index}.50",
+                    "verifyGSTNFlag": False,
+                    "invoiceDueDate": "30/04/2024",
+                    "selleridentifierdata": [{"sellerIdType": "GSTIN", "sellerIdNo": "27AAAPL1234C1ZV"}],
+                    "buyeridentifierdata": [{"buyerIdType": "GSTIN", "buyerIdNo": "29AAACB5678D1Z2"}]
+                }
+                for index in range(size)
+            ]
+        }
+        if create_signature(data, secret_key) != create_signature_baseline(data, secret_key):
+            raise ValueError(f"signature mismatch for {size} invoices")
+        baseline_time = timeit.timeit(lambda: create_signature_baseline(data, secret_key), number=number)
+        engine_time = timeit.timeit(lambda: create_signature(data, secret_key), number=number)
+        results[size] = {
+            "baseline_ms": round(baseline_time / number * 1000, 4),
+            "engine_ms": round(engine_time / number * 1000, 4),
+            "speedup": round(baseline_time / engine_time, 2)
+        }
+    return results
+
+
+if __name__ == '__main__':
+    for invoice_count, result in benchmark_signature().items():
+        print(invoice_count, result)
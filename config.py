@@ -19,6 +19,7 @@ from celery.app import Celery
 from fastapi import Depends
 from sqlalchemy.orm import Session, joinedload
 from celery.schedules import crontab
+from celery.exceptions import Retry
 import config
 from aes_encryption_decryption import AESCipher
 from cygnet_api import CygnetApi
@@ -32,12 +33,16 @@ from enquiry_view import AsyncValidationServiceWithCode, AsyncValidationServiceW
 
 from status_check_view import LedgerStatusCheck, InvoiceStatusCheckWithCode, InvoiceStatusCheckWithoutCode
 from utils import days_to_past_date
+from webhooks import WebhookDispatcher, WebhookStatusBuffer, WebhookQueue, WEBHOOK_WORKER_MODE
 from decouple import config as dconfig
 from gspi_api import get_token, verify_ewb, download, get_status
 from routers.send_mail import SUCCESS_BODY_TEXT, CORPORATE_GENERATE_OTP_BODY_TEXT
 
 logger = logging.getLogger(__name__)
 DAYS_TO_TRANSFER_INV = config('DAYS_TO_TRANSFER_INV')
+# invoices moved to old_invoice per transaction, progress is checkpointed in redis after every batch
+INVOICE_ARCHIVE_BATCH_SIZE = dconfig('INVOICE_ARCHIVE_BATCH_SIZE', default=1000, cast=int)
+INVOICE_ARCHIVE_CHECKPOINT_KEY = 'move_invoice_data:checkpoint'
 IBDIC_RBIH_WEBHOOK_STATUS_URL = config('IBDIC_RBIH_WEBHOOK_STATUS_URL')
 IBDIC_RBIH_WEBHOOK_STATUS_API_KEY = config('IBDIC_RBIH_WEBHOOK_STATUS_API_KEY')
 HUB_WEBHOOK = dconfig('HUB_WEBHOOK', default=False, cast=bool)
@@ -118,11 +123,19 @@ celery.conf.beat_schedule = {
         'task': 'config.vayana_status_enquiry_task',
         'schedule': crontab(minute="*/1"),  # Run every 10 minute
     },
+    'webhook_status': {
+        'task': 'config.flush_webhook_status_task',
+        'schedule': crontab(minute="*/1"),  # Run every minute
+    },
     'mis_report': {
         'task': 'config.async_mis_report',
         # 'schedule': crontab(hour='0', minute='0'),  # Run daily at 12:00 PM
         'schedule': crontab(minute="*/15"),  # Run every at three minute
     },
+    'mis_facts_reconcile': {
+        'task': 'config.mis_facts_reconcile_task',
+        'schedule': crontab(hour='1', minute='30'),  # Run daily at 01:30 AM
+    },
 }
 
 
@@ -229,7 +242,7 @@ def run_transfer_invoice_task():
     release_lock = lambda: r.delete(lock_key)
     if acquire_lock():
         try:
-            transfer_invoice_to_old_invoice_table()
+            transfer_invoice_to_old_invoice_table(heartbeat=lambda: r.expire(lock_key, lock_expire))
         except Exception as e:
             logger.error("Exception while acquiring lock for move_invoice_to_old_table {}".format(str(e)))
             logger.error(traceback.format_exc())
@@ -341,107 +354,205 @@ def async_mis_report():
     logger.info("End Task prepare_mis_report")
 
 
-def transfer_invoice_to_old_invoice_table():
-    logger.info(f"inside tasks transfer_invoice_to_old_invoice_table ")
+@celery.task
+def mis_facts_reconcile_task():
+    logger.info("Starting Task mis_facts_reconcile_task")
+    # same lock as async_mis_report, a fold saving its watermark would undo the reset done by the reconcile
+    lock_key = 'prep_mis_report'
+    if r.set(lock_key, '1', nx=True, ex=300):
+        try:
+            from routers.mis_report import MisReport
+            MisReport().reconcile_api_request_log_facts()
+        except Exception as e:
+            logger.error(f"Exception mis_facts_reconcile_task {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            r.delete(lock_key)
+    else:
+        logger.info("Other task of prepare_mis_report is running, skipping")
+    logger.info("End Task mis_facts_reconcile_task")
+
+
+@celery.task
+def async_report_export(export_id, run_id):
+    logger.info(f"Starting Task async_report_export {export_id} {run_id}")
+    from routers.mis_report import MisReportExportJob
+    MisReportExportJob.run(export_id, run_id)
+    logger.info(f"End Task async_report_export {export_id}")
+
+
+@celery.task
+def invoice_partition_migrate_task():
+    logger.info(f"Starting Task invoice_partition_migrate_task")
     db = next(get_db())
     try:
-        days = int(DAYS_TO_TRANSFER_INV) or 365
+        models.InvoicePartitions.migrate(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Exception invoice_partition_migrate_task {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        db.close()
+    logger.info(f"End Task invoice_partition_migrate_task")
 
-        delta_date = days_to_past_date(days)
 
-        inv_objs = db.query(
-            models.Invoice
-        ).filter(
-            models.Invoice.updated_at <= delta_date
-        ).all()
+@celery.task
+def invoice_gstin_backfill_task():
+    logger.info(f"Starting Task invoice_gstin_backfill_task")
+    db = next(get_db())
+    try:
+        models.Invoice.create_gstin_columns(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Exception invoice_gstin_backfill_task {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        db.close()
+    logger.info(f"End Task invoice_gstin_backfill_task")
 
-        for inv_obj in inv_objs:
-            old_inv_obj = models.OldInvoice(
-                invoice_no=inv_obj.invoice_no,
-                invoice_date=inv_obj.invoice_date,
-                invoice_due_date=inv_obj.invoice_due_date,
-                invoice_amt=inv_obj.invoice_amt,
-                invoice_hash=inv_obj.invoice_hash,
-                funded_amt=inv_obj.funded_amt,
-                gst_status=bool(inv_obj.gst_status),
-                fund_status=inv_obj.fund_status,
-                financial_year=inv_obj.financial_year,
-                status=inv_obj.status,
-                extra_data=inv_obj.extra_data,
-                is_active=inv_obj.is_active,
-                created_at=inv_obj.created_at,
-                updated_at=inv_obj.updated_at
-            )
-            db.add(old_inv_obj)
-            db.commit()
-            db.refresh(old_inv_obj)
 
-            for led_obj in inv_obj.ledger:
-                # create old_invoice_ledger_association
-                old_inv_obj.ledger.append(led_obj)
-                db.commit()
-                db.refresh(old_inv_obj)
+@celery.task
+def post_processing_request_id_backfill_task():
+    logger.info(f"Starting Task post_processing_request_id_backfill_task")
+    db = next(get_db())
+    try:
+        models.PostProcessingRequest.create_request_id_column(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Exception post_processing_request_id_backfill_task {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        db.close()
+    logger.info(f"End Task post_processing_request_id_backfill_task")
 
-            # delink inv, link old inv
-            inv_enc_data_obj = db.query(
-                models.InvoiceEncryptedData
-            ).filter(
-                models.InvoiceEncryptedData.invoice_id == inv_obj.id
-            ).first()
 
-            if inv_enc_data_obj:
-                inv_enc_data_obj.invoice_id = None
-                inv_enc_data_obj.old_invoice_id = old_inv_obj.id
-                db.commit()
-                db.refresh(inv_enc_data_obj)
+@celery.task
+def mis_index_migration_task():
+    logger.info(f"Starting Task mis_index_migration_task")
+    from routers.mis_report import MisReport
+    db = next(get_db())
+    try:
+        MisReport.create_mis_indexes(db)
+    finally:
+        db.close()
+    logger.info(f"End Task mis_index_migration_task")
 
-            try:
-                dis_hist_obj = db.query(
-                    models.DisbursedHistory
-                ).filter(
-                    models.DisbursedHistory.id == inv_obj.id
-                ).order_by(
-                    desc(models.DisbursedHistory.id)
-                ).first()
-                if dis_hist_obj:
-                    dis_hist_obj.invoice_id = None
-                    dis_hist_obj.old_invoice_id = old_inv_obj.id
-                    db.commit()
-                    db.refresh(dis_hist_obj)
-
-                repay_hist_obj = db.query(
-                    models.RepaymentHistory
-                ).filter(
-                    models.RepaymentHistory.id == inv_obj.id
-                ).first()
-                if repay_hist_obj:
-                    repay_hist_obj.invoice_id = None
-                    repay_hist_obj.old_invoice_id = old_inv_obj.id
-                    db.commit()
-                    db.refresh(repay_hist_obj)
-
-                # delink inv, link old inv to lenInvAss
-                len_inv_ass_obj = db.query(
-                    models.LenderInvoiceAssociation
-                ).filter(
-                    models.LenderInvoiceAssociation.invoice_id == inv_obj.id
-                ).first()
-                if len_inv_ass_obj:
-                    len_inv_ass_obj.invoice_id = None
-                    len_inv_ass_obj.old_invoice_id = old_inv_obj.id
-                    db.commit()
-                    db.refresh(len_inv_ass_obj)
-            except Exception as e:
-                logger.error(f"Error transfer_invoice_to_old_invoice_table LenderInvoiceAssociation")
-                pass
-
-            # after moved, delete inv obj from invoice table
-            db.delete(inv_obj)
-            db.commit()
-            # db.refresh(inv_obj)
 
-        logger.info(f"Successfully task transfer_invoice_to_old_invoice_table completed")
+INVOICE_ARCHIVE_COLUMNS = (
+    'invoice_no', 'invoice_date', 'invoice_due_date', 'invoice_amt', 'seller_gstin', 'buyer_gstin', 'invoice_hash',
+    'funded_amt', 'gst_status', 'fund_status', 'financial_year', 'status', 'extra_data', 'is_active', 'created_at',
+    'updated_at'
+)
+
+
+def archive_invoice_batch(db, delta_date, batch_size, keep_ids=False):
+    # one transaction: pick a batch, copy it with pre-allocated old_invoice ids, repoint the
+    # dependent rows through the id map and delete the live rows. partitioned tables share
+    # one id sequence, ids are kept unless an invoice from before partitioning shares it with old_invoice
+    if keep_ids:
+        old_invoice_id = (
+            f"case when exists (select 1 from old_invoice o where o.id = i.id) "
+            f"then nextval('{models.InvoicePartitions.SEQUENCE}') else i.id end"
+        )
+    else:
+        old_invoice_id = "nextval(pg_get_serial_sequence('old_invoice', 'id'))"
+    db.execute(text(f"""
+        create temp table invoice_archive_map on commit drop as
+        select
+            i.id as invoice_id,
+            {old_invoice_id} as old_invoice_id
+        from
+            invoice i
+        where
+            i.updated_at <= :delta_date
+        order by i.id
+        limit :batch_size
+        for update skip locked
+    """), [{'delta_date': delta_date, 'batch_size': batch_size}])
+    columns = ', '.join(INVOICE_ARCHIVE_COLUMNS)
+    select_columns = ', '.join(
+        'coalesce(i.gst_status, false)' if column == 'gst_status' else f"i.{column}"
+        for column in INVOICE_ARCHIVE_COLUMNS
+    )
+    moved = db.execute(text(f"""
+        insert into old_invoice (id, {columns})
+        select m.old_invoice_id, {select_columns}
+        from invoice_archive_map m
+        inner join invoice i on i.id = m.invoice_id
+        returning id
+    """)).scalars().all()
+    if not moved:
+        db.commit()
+        return 0, None
+
+    db.execute(text("""
+        insert into old_invoice_ledger_association (invoice_id, ledger_id)
+        select m.old_invoice_id, ila.ledger_id
+        from invoice_ledger_association ila
+        inner join invoice_archive_map m on m.invoice_id = ila.invoice_id
+    """))
+    db.execute(text("""
+        delete from invoice_ledger_association ila
+        using invoice_archive_map m
+        where ila.invoice_id = m.invoice_id
+    """))
+    for table_name in ('invoice_encrypted_data', 'disbursed_history', 'repayment_history',
+                       'lender_invoice_association'):
+        db.execute(text(f"""
+            update {table_name} t
+            set invoice_id = null, old_invoice_id = m.old_invoice_id
+            from invoice_archive_map m
+            where t.invoice_id = m.invoice_id
+        """))
+    last_id = db.execute(text("""
+        delete from invoice i
+        using invoice_archive_map m
+        where i.id = m.invoice_id
+        returning i.id
+    """)).scalars().all()
+    db.commit()
+    return len(moved), max(last_id)
+
+
+def transfer_invoice_to_old_invoice_table(heartbeat=None):
+    logger.info(f"inside tasks transfer_invoice_to_old_invoice_table ")
+    db = next(get_db())
+    try:
+        days = int(DAYS_TO_TRANSFER_INV) or 365
+
+        delta_date = days_to_past_date(days)
+        partitioned = models.InvoicePartitions.is_partitioned(db)
+        if partitioned:
+            # whole months are moved by detach/attach, the batches below only pick up the rest
+            models.InvoicePartitions.ensure_partitions(db)
+            archived = models.InvoicePartitions.archive_partitions(db, delta_date)
+            logger.info(f"transfer_invoice_to_old_invoice_table :: archived partitions {archived}")
+        total_moved = 0
+        started_at = datetime.datetime.now().isoformat()
+        while True:
+            moved, last_id = archive_invoice_batch(db, delta_date, INVOICE_ARCHIVE_BATCH_SIZE, keep_ids=partitioned)
+            if not moved:
+                break
+            total_moved += moved
+            r.hset(INVOICE_ARCHIVE_CHECKPOINT_KEY, mapping={
+                'started_at': started_at,
+                'last_invoice_id': last_id,
+                'moved': total_moved,
+                'checkpoint_at': datetime.datetime.now().isoformat()
+            })
+            logger.info(f"transfer_invoice_to_old_invoice_table :: moved {total_moved} till invoice id {last_id}")
+            if heartbeat:
+                heartbeat()
+            if moved < INVOICE_ARCHIVE_BATCH_SIZE:
+                break
+
+        if partitioned:
+            orphaned = models.InvoicePartitions.orphaned_references(db)
+            if orphaned:
+                logger.error(f"transfer_invoice_to_old_invoice_table :: rows referencing missing invoices {orphaned}")
+        logger.info(f"Successfully task transfer_invoice_to_old_invoice_table completed, moved {total_moved}")
     except Exception as e:
+        db.rollback()
         logger.error(f"Error transfer_invoice_to_old_invoice_table. {traceback.format_exc()}")
         pass
 
@@ -494,76 +605,47 @@ def post_async_hub_resp_to_rbi():
         pass
 
 
-@celery.task
-def post_webhook_data(merchant_key, webhook_data):
-    import utils
+@celery.task(bind=True, max_retries=None)
+def post_webhook_data(self, merchant_key, webhook_data, attempt=0, throttled=0):
+    dispatch_webhook(self, 'post_processing_request', merchant_key, webhook_data, attempt, throttled)
 
-    db = next(get_db())
-    full_webhook_url = utils.get_webhook_url(db, merchant_key)
-    logger.info(f"merchant full webhook url >>>>>>>>> {full_webhook_url}")
 
+def dispatch_webhook(task, table, merchant_key, webhook_data, attempt, throttled=0):
+    import utils
+
+    if WEBHOOK_WORKER_MODE == 'async':
+        # delivered by webhooks.run_async_worker
+        WebhookQueue.push(table, merchant_key, webhook_data, attempt)
+        return
     try:
+        db = next(get_db())
+        full_webhook_url = utils.get_webhook_url(db, merchant_key)
+        logger.info(f"merchant full webhook url >>>>>>>>> {full_webhook_url}")
         request_id = webhook_data.get('requestId')
-        post_pro_req_obj = (
-            db.query(
-                models.PostProcessingRequest
-            ).filter(
-                models.PostProcessingRequest.request_extra_data.contains({"requestId": request_id})
-            ).first()
-        )
-        logger.info(f"post_pro_req_obj object :: {post_pro_req_obj.id}")
 
-        try:
-            resp = requests.post(full_webhook_url, data=json.dumps(webhook_data),
-                                 headers={"content-type": "application/json"}, timeout=120)
-            logger.info(f"Webhook url response {resp.status_code} :: data {resp.content}")
-            if int(resp.status_code) == 200:
-                if post_pro_req_obj:
-                    logger.info(f"PostProcessingRequest object :: {post_pro_req_obj.id}")
-                    if post_pro_req_obj.extra_data:
-                        data = copy.deepcopy(post_pro_req_obj.extra_data)
-                        data.update({
-                            "webhook_status": 'Sent'
-                        })
-                    else:
-                        data = {
-                            "webhook_status": 'Sent'
-                        }
-                    post_pro_req_obj.extra_data = data
-                    db.commit()
-                    db.refresh(post_pro_req_obj)
+        outcome, countdown = WebhookDispatcher.deliver(
+            merchant_key, full_webhook_url, attempt, throttled, **WebhookDispatcher.request_kwargs(table, webhook_data)
+        )
+        if outcome in (WebhookDispatcher.RETRY, WebhookDispatcher.THROTTLED):
+            if outcome == WebhookDispatcher.RETRY:
+                attempt += 1
             else:
-                if post_pro_req_obj:
-                    logger.info(f"PostProcessingRequest object :: {post_pro_req_obj.id}")
-                    if post_pro_req_obj.extra_data:
-                        data = copy.deepcopy(post_pro_req_obj.extra_data)
-                        data.update({
-                            "webhook_status": 'Failed'
-                        })
-                    else:
-                        data = {
-                            "webhook_status": 'Failed'
-                        }
-                    post_pro_req_obj.extra_data = data
-                    db.commit()
-                    db.refresh(post_pro_req_obj)
-        except Exception as e:
-            if post_pro_req_obj:
-                logger.info(f"PostProcessingRequest object :: {post_pro_req_obj.id}")
-                if post_pro_req_obj.extra_data:
-                    data = copy.deepcopy(post_pro_req_obj.extra_data)
-                    data.update({
-                        "webhook_status": 'Failed'
-                    })
-                else:
-                    data = {
-                        "webhook_status": 'Failed'
-                    }
-                post_pro_req_obj.extra_data = data
-                db.commit()
-                db.refresh(post_pro_req_obj)
+                throttled += 1
+            logger.info(f"webhook {request_id} {outcome.lower()} :: attempt {attempt} in {countdown:.1f}s")
+            raise task.retry(
+                args=(merchant_key, webhook_data), kwargs={'attempt': attempt, 'throttled': throttled},
+                countdown=countdown
+            )
+        WebhookStatusBuffer.add(table, request_id, outcome)
+    except Retry:
+        raise
     except Exception as e:
-        logger.exception(f"Exception post_webhook_data")
+        logger.exception(f"Exception {task.name}")
+
+
+@celery.task
+def flush_webhook_status_task():
+    WebhookStatusBuffer.flush()
 
 
 def async_sftp_task():
@@ -580,79 +662,17 @@ def async_sftp_idp_process(merchant_dir):
 
 def prepare_mis_report():
     logger.info(f"inside tasks : async_mis_report ")
-    from routers.mis_report import MisReport
-    MisReport().create_all_materialized_view()
+    from routers.mis_report import MisReport, MIS_REPORT_MODE
+    if MIS_REPORT_MODE == 'incremental':
+        MisReport().refresh_rollups()
+    else:
+        MisReport().create_all_materialized_view()
     logger.info(f"async_mis_report :: MisReport...Refreshed...")
 
 
-@celery.task
-def bulk_post_webhook_data(merchant_key, webhook_data):
-    import utils
-
-    db = next(get_db())
-    full_webhook_url = utils.get_webhook_url(db, merchant_key)
-    logger.info(f"merchant full webhook url >>>>>>>>> {full_webhook_url}")
-
-    try:
-        request_id = webhook_data.get('requestId')
-
-        req_obj = db.query(
-            models.BulkAPIRequestLog
-        ).filter(
-            models.BulkAPIRequestLog.invoice_id == request_id
-        ).first()
-
-        logger.info(f"post_pro_req_obj object :: {req_obj.id}")
-
-        try:
-            resp = requests.post(full_webhook_url, data=webhook_data, timeout=120)
-            if resp.status_code == 200:
-                if req_obj:
-                    logger.info(f"PostProcessingRequest object :: {req_obj.id}")
-                    if req_obj.extra_data:
-                        data = copy.deepcopy(req_obj.extra_data)
-                        data.update({
-                            "webhook_status": 'Sent'
-                        })
-                    else:
-                        data = {
-                            "webhook_status": 'Sent'
-                        }
-                    req_obj.extra_data = data
-                    db.commit()
-                    db.refresh(req_obj)
-            else:
-                if req_obj:
-                    logger.info(f"PostProcessingRequest object :: {req_obj.id}")
-                    if req_obj.extra_data:
-                        data = copy.deepcopy(req_obj.extra_data)
-                        data.update({
-                            "webhook_status": 'Failed'
-                        })
-                    else:
-                        data = {
-                            "webhook_status": 'Failed'
-                        }
-                    req_obj.extra_data = data
-                    db.commit()
-                    db.refresh(req_obj)
-        except Exception as e:
-            if req_obj:
-                logger.info(f"PostProcessingRequest object :: {req_obj.id}")
-                if req_obj.extra_data:
-                    data = copy.deepcopy(req_obj.extra_data)
-                    data.update({
-                        "webhook_status": 'Failed'
-                    })
-                else:
-                    data = {
-                        "webhook_status": 'Failed'
-                    }
-                req_obj.extra_data = data
-                db.commit()
-                db.refresh(req_obj)
-    except Exception as e:
-        logger.exception(f"Exception post_webhook_data")
+@celery.task(bind=True, max_retries=None)
+def bulk_post_webhook_data(self, merchant_key, webhook_data, attempt=0, throttled=0):
+    dispatch_webhook(self, 'bulk_api_request_log', merchant_key, webhook_data, attempt, throttled)
 
 
 def create_auth_org(gsp_user_details):
@@ -175,4 +175,6 @@ class ErrorCodes:
         1152: ('1152: Entity can not have multiple pan', 'Entity can not have multiple pan'),
         1153: ('1053: Entity can not have multiple CIN', 'Entity can not have multiple CIN'),
         1154: ('1054: Entity can not have multiple LEI', 'Entity can not have multiple LEI'),
+        1155: ('1155: Export job not found', 'Export job not found'),
+        1156: ('1156: Export job is not ready', 'Export job is not ready'),
     }
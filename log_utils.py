@@ -0,0 +1,60 @@
+import logging
+import random
+import reprlib
+
+from decouple import config as dconfig
+
+# payload arguments are cut to LOG_PAYLOAD_MAX_CHARS when a record is actually emitted
+LOG_PAYLOAD_MAX_CHARS = dconfig('LOG_PAYLOAD_MAX_CHARS', default=1000, cast=int)
+# INFO/DEBUG sampling per logger name, e.g. "views:0.1,utils:0.25", WARNING and above are always kept
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split(':', 1) for item in dconfig('LOG_SAMPLE_RATES', default='').split(',') if ':' in item
+    )
+}
+
+payload_repr = reprlib.Repr()
+payload_repr.maxlevel = 4
+payload_repr.maxdict = 25
+payload_repr.maxlist = 25
+payload_repr.maxtuple = 25
+payload_repr.maxset = 25
+payload_repr.maxstring = LOG_PAYLOAD_MAX_CHARS
+payload_repr.maxother = LOG_PAYLOAD_MAX_CHARS
+
+
+class Payload:
+    # logging argument rendered lazily, only when a handler formats the record
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        if isinstance(self.value, (dict, list, tuple, set)):
+            text = payload_repr.repr(self.value)
+        else:
+            text = str(self.value)
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            return f"{text[:LOG_PAYLOAD_MAX_CHARS]}...<{len(text)} chars>"
+        return text
+
+    __repr__ = __str__
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def get_logger(name):
+    logger = logging.getLogger(name)
+    rate = LOG_SAMPLE_RATES.get(name)
+    if rate is not None and rate < 1 and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(rate))
+    return logger
@@ -1,7 +1,15 @@
 import logging
+import os
 import time
 import copy
 import json
+import hashlib
+import hmac
+import secrets
+import base64
+import tempfile
+import threading
+import xlsxwriter
 from itertools import chain
 import redis
 import ast
@@ -10,15 +18,16 @@ import datetime
 import traceback
 import pytz
 import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Annotated
-from io import BytesIO
 from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime as dt
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header
 from fastapi.encoders import jsonable_encoder
 from decouple import config as dconfig
 from sqlalchemy import text, desc, create_engine
-from dateutil.relativedelta import relativedelta
 import config
 import models
 
@@ -49,39 +58,511 @@ router = APIRouter()
 r = redis.Redis(host=dconfig('REDIS_HOST'), port=6379, decode_responses=True)
 asia_kolkata = pytz.timezone('Asia/Kolkata')
 
+# 'incremental' folds changed rows into the *_rollup tables, the full rebuild is the admin /create-materialized-view
+# call. 'materialized' drops and recreates every view on each run
+MIS_REPORT_MODE = dconfig('MIS_REPORT_MODE', default='incremental')
+# days re-aggregated behind the watermark on every fold, also the slack on updated_at (app and database clocks both write it)
+MIS_ROLLUP_LOOKBACK_DAYS = dconfig('MIS_ROLLUP_LOOKBACK_DAYS', default=2, cast=int)
+# connections used by the concurrent refresh, each view refreshes on its own session
+MIS_REFRESH_WORKERS = dconfig('MIS_REFRESH_WORKERS', default=3, cast=int)
+MIS_REFRESH_CONCURRENTLY = dconfig('MIS_REFRESH_CONCURRENTLY', default=True, cast=bool)
+# views built in parallel by create_all_materialized_view, each on its own connection
+MIS_BUILD_WORKERS = dconfig('MIS_BUILD_WORKERS', default=4, cast=int)
+# filterType 'all' summaries are aggregated in postgres, the pandas rollup is only the fallback
+MIS_SQL_CUMULATIVE = dconfig('MIS_SQL_CUMULATIVE', default=True, cast=bool)
+# get_invoice_hub_mis_report responses cached in redis per view generation, oldest used evicted past the limit
+MIS_REPORT_CACHE = dconfig('MIS_REPORT_CACHE', default=True, cast=bool)
+MIS_REPORT_CACHE_MAX_ENTRIES = dconfig('MIS_REPORT_CACHE_MAX_ENTRIES', default=500, cast=int)
+MIS_REPORT_CACHE_TTL = dconfig('MIS_REPORT_CACHE_TTL', default=3600, cast=int)
+# xlsx exports stay in memory up to this size before spilling to a temp file, streamed back in chunks
+MIS_EXPORT_SPOOL_BYTES = dconfig('MIS_EXPORT_SPOOL_BYTES', default=8 * 1024 * 1024, cast=int)
+MIS_EXPORT_CHUNK_BYTES = dconfig('MIS_EXPORT_CHUNK_BYTES', default=256 * 1024, cast=int)
+# export jobs run on celery and leave their workbook here, job state and artifacts live for MIS_EXPORT_JOB_TTL
+MIS_EXPORT_DIR = dconfig('MIS_EXPORT_DIR', default='/tmp/mis_exports')
+MIS_EXPORT_JOB_TTL = dconfig('MIS_EXPORT_JOB_TTL', default=6 * 3600, cast=int)
+# a running export refreshes heartbeatAt this often, a queued / running export whose heartbeat is older than
+# MIS_EXPORT_STALE_SECONDS is taken as lost (worker died, task dropped) and enqueued again
+MIS_EXPORT_HEARTBEAT_SECONDS = dconfig('MIS_EXPORT_HEARTBEAT_SECONDS', default=60, cast=int)
+MIS_EXPORT_STALE_SECONDS = dconfig('MIS_EXPORT_STALE_SECONDS', default=600, cast=int)
+# user MIS keyset page size when the request has none, also the server side cursor batch size
+MIS_USER_REPORT_PAGE_SIZE = dconfig('MIS_USER_REPORT_PAGE_SIZE', default=1000, cast=int)
+MIS_USER_REPORT_MAX_PAGE_SIZE = dconfig('MIS_USER_REPORT_MAX_PAGE_SIZE', default=5000, cast=int)
+
+
 class MisReport:
 
-    def __init__(self, from_date=False, to_date=False):
+    # source tables (and the column the view derives period from) driving the rollup watermark of the api log views.
+    # rows are picked up by updated_at, period has to come from created_at so an updated row never changes period
+    API_WATERMARK = (('api_request_log', 'created_at'), ('post_processing_request', 'created_at'))
+
+    # view -> tables it reads, watermark sources and views that have to be built before it.
+    # every view is built by the method of the same name. watermark None keeps the view on full refresh
+    # in incremental mode as well: its period or counts move with rows no watermark can see
+    VIEW_GRAPH = {
+        'api_request_log_facts': {
+            'inputs': ('api_request_log',),
+            'watermark': (('api_request_log', 'created_at'),),
+            'depends_on': (),
+        },
+        'financing_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'registration_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'disbursement_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'cancellation_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'merchant_details', 'ledger', 'invoice_ledger_association', 'invoice'),
+            # counts follow the invoice / ledger status, which changes without touching the api log row
+            'watermark': None,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'repayment_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'invoice_repayment_percent_materialized_view': {
+            'inputs': ('repayment_history', 'invoice', 'invoice_ledger_association', 'ledger', 'merchant_details'),
+            # period is ist_day(updated_at), an update moves the row to another period
+            'watermark': None,
+            'depends_on': (),
+        },
+        'status_check_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+        'total_calls_for_all_api_materialized_view': {
+            'inputs': ('api_request_log_facts', 'post_processing_request', 'merchant_details'),
+            'watermark': API_WATERMARK,
+            'depends_on': ('api_request_log_facts',),
+        },
+    }
+
+    # api_url values read by the report views, only these rows are copied into api_request_log_facts
+    FACTS_API_URLS = (
+        'sync-entity-registration', 'sync-registration-without-code', 'sync-invoice-registration-with-code',
+        'syncFinancing', 'Financing API with Entity Code', 'Financing API without Entity Code',
+        'cancel', 'Ledger Cancellation API', 'Invoice Cancellation API',
+        'syncDisbursement', 'syncRepayment', 'asyncRepayment',
+        'sync-invoice-status-check-with-code', 'sync-invoice-status-check-without-code', 'sync-ledger-status-check',
+    )
+    FACTS_FINANCING_URLS = ('syncFinancing', 'Financing API with Entity Code', 'Financing API without Entity Code')
+
+    # unique key of every view, refresh materialized view concurrently needs a unique index on it
+    VIEW_UNIQUE_KEYS = {
+        'financing_api_materialized_view': ('idp_name', 'idp_code', 'period', 'api_url', 'source'),
+        'registration_api_materialized_view': ('idp_name', 'idp_code', 'period', 'api_url', 'source'),
+        'disbursement_api_materialized_view': ('category', 'idp_name', 'idp_code', 'period', 'api_url'),
+        'cancellation_api_materialized_view': ('category', 'idp_name', 'idp_code', 'period', 'api_url'),
+        'repayment_api_materialized_view': ('idp_name', 'idp_code', 'period', 'api_url', 'source'),
+        'invoice_repayment_percent_materialized_view': ('idp_name', 'idp_code', 'period'),
+        'status_check_api_materialized_view': ('idp_name', 'idp_code', 'period', 'api_url', 'source'),
+        'total_calls_for_all_api_materialized_view': ('idp_name', 'idp_code', 'period', 'api_url', 'source'),
+    }
+
+    def __init__(self, from_date=False, to_date=False, mode='materialized', full_rebuild=False):
         self.from_date = from_date
         self.to_date = to_date
         self.view_query = ''
+        self.mode = mode
+        self.full_rebuild = full_rebuild
+
+    def refresh_rollups(self):
+        # periodic job, only rows created since the last watermark (plus the lookback window) are re-aggregated
+        self.mode = 'incremental'
+        self.full_rebuild = False
+        return self.create_all_materialized_view()
+
+    def rebuild_rollups(self):
+        # admin operation, truncates every rollup and folds the whole history again
+        self.mode = 'incremental'
+        self.full_rebuild = True
+        return self.create_all_materialized_view()
 
     def create_all_materialized_view(self):
         try:
-            logger.info(f"::: create_all_materialized_view....in one go..:::")
-            self.financing_api_materialized_view()
-            self.registration_api_materialized_view()
-            self.disbursement_api_materialized_view()
-            self.cancellation_api_materialized_view()
-            self.repayment_api_materialized_view()
-            self.status_check_api_materialized_view()
-            self.total_calls_for_all_api_materialized_view()
-            return True
+            logger.info(f"::: create_all_materialized_view....{self.mode}..:::")
+            # shared bookkeeping tables are created once, before the parallel builds race on them
+            self.prepare_mis_tables()
+
+            pending = {view_name: set(node['depends_on']) for view_name, node in self.VIEW_GRAPH.items()}
+            results, running = {}, {}
+            with ThreadPoolExecutor(max_workers=MIS_BUILD_WORKERS) as executor:
+                while pending or running:
+                    for view_name, depends_on in list(pending.items()):
+                        if any(results.get(dependency) is False for dependency in depends_on):
+                            logger.error(f"create_all_materialized_view :: {view_name} skipped, dependency failed")
+                            pending.pop(view_name)
+                            results[view_name] = False
+                        elif all(results.get(dependency) for dependency in depends_on):
+                            running[executor.submit(self.build_view, view_name)] = pending.pop(view_name)
+                    if not running:
+                        logger.error(f"create_all_materialized_view :: unresolved dependencies {pending}")
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        results[running.pop(future)] = future.result()
+            logger.info(f"create_all_materialized_view :: {results}")
+            MisReportCache.invalidate()
+            return all(results.get(view_name) for view_name in self.VIEW_GRAPH)
         except Exception as e:
             logger.error(f"Error while creating Materialized View : {e}")
             return False
 
-    def create_materialized_view(self):
+    def build_view(self, view_name):
+        # separate instance per build, view_query is per instance state and create_materialized_view
+        # opens its own session, so independent views run on separate connections
+        report = MisReport(self.from_date, self.to_date, mode=self.mode, full_rebuild=self.full_rebuild)
+        started = time.monotonic()
+        built = bool(getattr(report, view_name)())
+        duration_ms = int((time.monotonic() - started) * 1000)
+        logger.info(f"build_view :: {view_name} built {built} in {duration_ms} ms")
         db = next(get_db())
         try:
-            db.execute(text(self.view_query))
+            self.record_view_refresh(db, view_name, duration_ms, None if built else 'build failed')
+        except Exception as e:
+            logger.error(f"Error recording build of {view_name} : {e}")
+        finally:
+            db.close()
+        return built
+
+    def create_materialized_view(self, view_name):
+        if self.mode == 'incremental' and self.VIEW_GRAPH[view_name]['watermark']:
+            return self.fold_rollup(view_name)
+        db = next(get_db())
+        try:
+            self.drop_relation(db, view_name)
+            db.execute(text(f"drop table if exists {self.rollup_table(view_name)}"))
+            db.execute(text(f"create materialized view {view_name} as {self.view_select()}"),
+                       [{'since': '-infinity'}])
+            self.create_unique_index(db, view_name)
             db.commit()
         except Exception as e:
             logger.error(f"Error Generating Materialized View : {e}")
             return False
         return True
 
-    def refresh_materialized_view(self):
+    def view_select(self):
+        return self.view_query.strip().rstrip(';')
+
+    @staticmethod
+    def relation_kind(db, relation_name):
+        # 'm' materialized view, 'v' plain view, 'r' table, None when missing
+        return db.execute(text("""
+            select relkind from pg_class where relname = :relation_name and relkind in ('r', 'v', 'm')
+        """), [{'relation_name': relation_name}]).scalar()
+
+    @staticmethod
+    def drop_relation(db, relation_name):
+        kind = MisReport.relation_kind(db, relation_name)
+        if kind == 'm':
+            db.execute(text(f"drop materialized view if exists {relation_name}"))
+        elif kind == 'v':
+            db.execute(text(f"drop view if exists {relation_name}"))
+
+    @staticmethod
+    def rollup_table(view_name):
+        return view_name.replace('_materialized_view', '_rollup')
+
+    def prepare_mis_tables(self):
+        db = next(get_db())
+        try:
+            if not db.execute(text("select to_regprocedure('ist_day(timestamp with time zone)')")).scalar():
+                # first build on a fresh database, afterwards the indexes belong to mis_index_migration_task
+                self.create_mis_indexes(db)
+            self.create_refresh_log_table(db)
+            self.create_watermark_table(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def create_mis_indexes(db):
+        # one time migration (mis_index_migration_task), safe to run again: only missing or invalid indexes are built.
+        # created_at holds the IST wall clock (server default now() AT TIME ZONE 'Asia/Kolkata') stored through a
+        # UTC session, so reading it back in UTC gives the IST day. the zone is fixed in the function body, the
+        # function is immutable and the indexes on it would silently go stale if the zone could change
+        db.execute(text("""
+            create or replace function ist_day(ts timestamp with time zone) returns date
+                language sql immutable parallel safe
+                as $$ select (ts AT TIME ZONE 'UTC')::date $$
+        """))
+        db.commit()
+        # concurrently can't run inside a transaction block, the indexes are built on an autocommit connection
+        with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for table_name in ('api_request_log', 'post_processing_request', 'invoice'):
+                models.create_index(connection, f"ix_{table_name}_ist_day", table_name, 'ist_day(created_at)')
+            # the rollup watermark scans its sources by updated_at
+            for table_name in ('api_request_log', 'post_processing_request'):
+                models.create_index(connection, f"ix_{table_name}_updated_at", table_name, 'updated_at')
+
+    @staticmethod
+    def create_watermark_table(db):
+        db.execute(text("""
+            create table if not exists mis_rollup_watermark (
+                view_name varchar not null,
+                source_table varchar not null,
+                last_updated_at timestamp with time zone,
+                last_folded_at timestamp with time zone,
+                primary key (view_name, source_table)
+            );
+            alter table mis_rollup_watermark add column if not exists last_updated_at timestamp with time zone;
+        """))
+        db.commit()
+
+    def create_rollup_table(self, db, view_name):
+        # rollup has the exact shape of the view select, the report view then becomes a plain view over it
+        rollup_table = self.rollup_table(view_name)
+        if self.full_rebuild and self.relation_kind(db, rollup_table) == 'r':
+            # the select may have changed shape, a full rebuild recreates the rollup table as well
+            self.drop_relation(db, view_name)
+            db.execute(text(f"drop table {rollup_table}"))
+        if self.relation_kind(db, rollup_table) is None:
+            db.execute(text(f"create table {rollup_table} as {self.view_select()} with no data"),
+                       [{'since': '-infinity'}])
+            key_columns = 'idp_code, period' if view_name == 'invoice_repayment_percent_materialized_view' \
+                else 'idp_code, period, api_url'
+            db.execute(text(f"create index if not exists ix_{rollup_table}_key on {rollup_table} ({key_columns})"))
+        if self.relation_kind(db, view_name) != 'v':
+            self.drop_relation(db, view_name)
+            db.execute(text(f"create view {view_name} as select * from {rollup_table}"))
+        return rollup_table
+
+    def rollup_watermark(self, db, view_name):
+        since_dates, high_marks = [], {}
+        for source_table, period_column in self.VIEW_GRAPH[view_name]['watermark']:
+            last_updated_at = db.execute(text("""
+                select last_updated_at from mis_rollup_watermark
+                where view_name = :view_name and source_table = :source_table
+            """), [{'view_name': view_name, 'source_table': source_table}]).scalar()
+            # updated_at range scan, rows inserted or updated since the last fold give the oldest period to fold
+            # again. the period comes from created_at, so an updated row is re-counted in the period it always had
+            max_updated_at, since_date = db.execute(text(f"""
+                select
+                    max(updated_at),
+                    coalesce(ist_day(min({period_column})), (now() AT TIME ZONE 'Asia/Kolkata')::date) - (:lookback)::int
+                from {source_table}
+                where updated_at > (:last_updated_at)::timestamptz - make_interval(days => (:lookback)::int)
+            """), [{'last_updated_at': last_updated_at, 'lookback': MIS_ROLLUP_LOOKBACK_DAYS}]).fetchone()
+            high_marks[source_table] = max(filter(None, (max_updated_at, last_updated_at)), default=None)
+            since_dates.append(since_date if last_updated_at is not None else None)
+        if self.full_rebuild or not since_dates or None in since_dates:
+            return '-infinity', high_marks
+        return min(since_dates).isoformat(), high_marks
+
+    @staticmethod
+    def save_watermark(db, view_name, high_marks):
+        for source_table, last_updated_at in high_marks.items():
+            db.execute(text("""
+                insert into mis_rollup_watermark (view_name, source_table, last_updated_at, last_folded_at)
+                values (:view_name, :source_table, :last_updated_at, now())
+                on conflict (view_name, source_table)
+                do update set last_updated_at = excluded.last_updated_at, last_folded_at = excluded.last_folded_at
+            """), [{'view_name': view_name, 'source_table': source_table, 'last_updated_at': last_updated_at}])
+
+    def fold_rollup(self, view_name):
+        db = next(get_db())
+        try:
+            rollup_table = self.create_rollup_table(db, view_name)
+            since, high_marks = self.rollup_watermark(db, view_name)
+            logger.info(f"fold_rollup :: {view_name} since {since} high marks {high_marks}")
+            # delete + insert of the affected periods runs in one transaction, readers keep the old rows till commit
+            db.execute(text(f"delete from {rollup_table} where period >= (:since)::date"), [{'since': since}])
+            db.execute(text(f"insert into {rollup_table} {self.view_select()}"), [{'since': since}])
+            self.save_watermark(db, view_name, high_marks)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error Folding Rollup {view_name} : {e}")
+            return False
+        return True
+
+    @staticmethod
+    def create_unique_index(db, view_name):
+        key_columns = ', '.join(MisReport.VIEW_UNIQUE_KEYS[view_name])
+        db.execute(text(f"create unique index if not exists ux_{view_name} on {view_name} ({key_columns})"))
+
+    @staticmethod
+    def create_refresh_log_table(db):
+        db.execute(text("""
+            create table if not exists mis_view_refresh_log (
+                view_name varchar primary key,
+                last_duration_ms bigint,
+                last_attempt_at timestamp with time zone,
+                last_success_at timestamp with time zone,
+                last_error text
+            )
+        """))
+        db.commit()
+
+    @staticmethod
+    def record_view_refresh(db, view_name, duration_ms, error=None):
+        # last_success_at is only moved on success, a failed refresh keeps the previous data and timestamp
+        db.execute(text("""
+            insert into mis_view_refresh_log (view_name, last_duration_ms, last_attempt_at, last_success_at, last_error)
+            values (:view_name, :duration_ms, now(), case when (:error)::text is null then now() end, :error)
+            on conflict (view_name)
+            do update set
+                last_duration_ms = excluded.last_duration_ms,
+                last_attempt_at = excluded.last_attempt_at,
+                last_success_at = coalesce(excluded.last_success_at, mis_view_refresh_log.last_success_at),
+                last_error = excluded.last_error
+        """), [{'view_name': view_name, 'duration_ms': duration_ms, 'error': error}])
+        db.commit()
+
+    def refresh_view_concurrently(self, view_name):
+        db = next(get_db())
+        started = time.monotonic()
+        try:
+            if self.relation_kind(db, view_name) != 'm':
+                logger.info(f"refresh_view_concurrently :: {view_name} is not a materialized view, skipped")
+                return True
+            self.create_unique_index(db, view_name)
+            db.commit()
+            # concurrently keeps the view readable, report endpoints serve the previous data meanwhile
+            db.execute(text(f"refresh materialized view concurrently {view_name}"))
+            db.commit()
+            duration_ms = int((time.monotonic() - started) * 1000)
+            self.record_view_refresh(db, view_name, duration_ms)
+            logger.info(f"refresh_view_concurrently :: {view_name} refreshed in {duration_ms} ms")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error Refreshing Materialized View {view_name} : {e}")
+            self.record_view_refresh(db, view_name, int((time.monotonic() - started) * 1000), str(e))
+            return False
+        finally:
+            db.close()
+        return True
+
+    def api_request_log_facts(self):
+        # narrow staging copy of api_request_log, the request / response jsonb is parsed here once per row
+        # and every report view aggregates the typed columns instead
+        logger.info(f"....api_request_log_facts....")
+        db = next(get_db())
+        try:
+            db.execute(text("""
+                create table if not exists api_request_log_facts (
+                    id bigint primary key,
+                    merchant_id varchar,
+                    api_url varchar,
+                    period date,
+                    response_code varchar,
+                    request_code varchar,
+                    response_empty boolean,
+                    ledger_no varchar,
+                    ledger_count integer,
+                    invoice_amount numeric,
+                    invoice_nos text[]
+                );
+                create index if not exists ix_api_request_log_facts_period on api_request_log_facts (period, api_url);
+            """))
+            db.commit()
+            # same watermark as the rollups, late responses bump updated_at and re-copy the row
+            since, high_marks = self.rollup_watermark(db, 'api_request_log_facts')
+            db.execute(text("""
+                insert into api_request_log_facts (
+                    id, merchant_id, api_url, period, response_code, request_code, response_empty,
+                    ledger_no, ledger_count, invoice_amount, invoice_nos
+                )
+                select
+                    arl.id,
+                    arl.merchant_id,
+                    arl.api_url,
+                    ist_day(arl.created_at),
+                    arl.response_data->>'code',
+                    arl.request_data->>'code',
+                    arl.response_data = '{}'::jsonb,
+                    arl.request_data->>'ledgerNo',
+                    case when jsonb_typeof(arl.request_data->'ledgerData') = 'array'
+                         then jsonb_array_length(arl.request_data->'ledgerData') end,
+                    case when jsonb_typeof(arl.request_data->'ledgerData') = 'array' and arl.api_url = ANY(:financing_urls)
+                         then ( SELECT SUM((item->>'invoiceAmt')::numeric) FROM jsonb_array_elements(arl.request_data->'ledgerData') AS item ) end,
+                    case when jsonb_typeof(arl.request_data->'ledgerData') = 'array' and arl.api_url = 'syncDisbursement'
+                         then array( select (item->>'invoiceNo')::text from jsonb_array_elements(arl.request_data->'ledgerData') AS item ) end
+                from
+                    api_request_log arl
+                where
+                    arl.api_url = ANY(:api_urls)
+                    and ist_day(arl.created_at) >= (:since)::date
+                on conflict (id) do update set
+                    response_code = excluded.response_code,
+                    request_code = excluded.request_code,
+                    response_empty = excluded.response_empty,
+                    ledger_no = excluded.ledger_no,
+                    ledger_count = excluded.ledger_count,
+                    invoice_amount = excluded.invoice_amount,
+                    invoice_nos = excluded.invoice_nos
+            """), [{
+                'since': since,
+                'api_urls': list(self.FACTS_API_URLS),
+                'financing_urls': list(self.FACTS_FINANCING_URLS)
+            }])
+            # log rows deleted inside the folded window, older deletes are left to reconcile_api_request_log_facts
+            db.execute(text("""
+                delete from api_request_log_facts f
+                where f.period >= (:since)::date
+                    and not exists (select 1 from api_request_log arl where arl.id = f.id)
+            """), [{'since': since}])
+            self.save_watermark(db, 'api_request_log_facts', high_marks)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Exception api_request_log_facts :: {e}")
+            return False
+        finally:
+            db.close()
+        return True
+
+    def reconcile_api_request_log_facts(self):
+        # rows deleted or archived from api_request_log never move a watermark. the whole facts table is checked
+        # against the log and, when anything was removed, the rollups reading it are folded again from scratch
+        logger.info(f"....reconcile_api_request_log_facts....")
+        db = next(get_db())
+        try:
+            removed = db.execute(text("""
+                delete from api_request_log_facts f
+                where not exists (select 1 from api_request_log arl where arl.id = f.id)
+            """)).rowcount
+            if removed:
+                view_names = [
+                    view_name for view_name, node in self.VIEW_GRAPH.items()
+                    if 'api_request_log_facts' in node['depends_on']
+                ]
+                db.execute(text("""
+                    update mis_rollup_watermark set last_updated_at = null where view_name = ANY(:view_names)
+                """), [{'view_names': view_names}])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Exception reconcile_api_request_log_facts :: {e}")
+            return False
+        finally:
+            db.close()
+        logger.info(f"reconcile_api_request_log_facts :: removed {removed} rows")
+        return True
+
+    def refresh_materialized_view(self, concurrently=MIS_REFRESH_CONCURRENTLY):
+        # bookkeeping tables and indexes come from prepare_mis_tables in create_all_materialized_view,
+        # a view can't be refreshed before it was built once
+        # the views read the facts table, it has to be current before they refresh
+        self.api_request_log_facts()
+        if concurrently:
+            logger.info(f"::: refresh_materialized_view....concurrently..:::")
+            view_names = list(self.VIEW_UNIQUE_KEYS)
+            with ThreadPoolExecutor(max_workers=MIS_REFRESH_WORKERS) as executor:
+                results = dict(zip(view_names, executor.map(self.refresh_view_concurrently, view_names)))
+            logger.info(f"refresh_materialized_view :: {results}")
+            MisReportCache.invalidate()
+            return all(results.values())
         db = next(get_db())
         logger.info(f"::: refresh_materialized_view....in one go..:::")
         self.view_query = (
@@ -100,6 +581,7 @@ class MisReport:
         except Exception as e:
             logger.error(f"Error Refreshing Materialized View : {e}")
             return False
+        MisReportCache.invalidate()
         return True
 
     def registration_api_materialized_view(self):
@@ -109,17 +591,13 @@ class MisReport:
         # -- drop materialized view if exists registration_api_materialized_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists registration_api_materialized_view ;
-
-                CREATE Materialized VIEW 
-                    registration_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
                     data.idp_code,
                     data.period,
                     data.api_url,
+                    data.source,
                     data.total_incoming_ping,
                     data.entity_reg_incoming_ping,
                     data.inv_reg_with_ec_incoming_ping,
@@ -162,26 +640,27 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
+                    'api'::text as source,
 
                     COUNT(arl.id) as total_incoming_ping,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ) AS entity_reg_incoming_ping,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ) AS inv_reg_with_ec_incoming_ping,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ) AS inv_reg_without_ec_incoming_ping,
 
-                    COUNT(arl.id) Filter ( WHERE arl.response_data->>'code'::text in ('200') ) as total_pass,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-entity-registration') and arl.response_data->>'code'::text in ('200') ) as entity_reg_pass,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and arl.response_data->>'code'::text in ('200') ) as inv_reg_with_ec_pass,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-registration-without-code') and arl.response_data->>'code'::text in ('200') ) as inv_reg_without_ec_pass,
+                    COUNT(arl.id) Filter ( WHERE arl.response_code in ('200') ) as total_pass,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-entity-registration') and arl.response_code in ('200') ) as entity_reg_pass,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and arl.response_code in ('200') ) as inv_reg_with_ec_pass,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-registration-without-code') and arl.response_code in ('200') ) as inv_reg_without_ec_pass,
 
-                    COUNT(arl.id) Filter ( WHERE arl.response_data = '{}'::jsonb or arl.response_data->>'code'::text not in ('200') ) as total_fail,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-entity-registration') and ( arl.response_data = '{}'::jsonb or arl.response_data->>'code'::text not in ('200') ) ) as entity_reg_fail,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and (arl.response_data = '{}'::jsonb or arl.response_data->>'code'::text not in ('200') ) ) as inv_reg_with_ec_fail,
-                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-registration-without-code') and (arl.response_data = '{}'::jsonb or arl.response_data->>'code'::text not in ('200')) ) as inv_reg_without_ec_fail,
+                    COUNT(arl.id) Filter ( WHERE arl.response_empty or arl.response_code not in ('200') ) as total_fail,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-entity-registration') and ( arl.response_empty or arl.response_code not in ('200') ) ) as entity_reg_fail,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and (arl.response_empty or arl.response_code not in ('200') ) ) as inv_reg_with_ec_fail,
+                    COUNT(arl.id) Filter ( WHERE arl.api_url in ('sync-registration-without-code') and (arl.response_empty or arl.response_code not in ('200')) ) as inv_reg_without_ec_fail,
                     
                     Round( ( case when count(arl.id)  != 0
-                                  then ( count( case when arl.response_data->>'code'::TEXT = '200' then 1 end )::FLOAT 
+                                  then ( count( case when arl.response_code = '200' then 1 end )::FLOAT 
                                        / 
                                        count(arl.id) 
                                        ) * 100 
@@ -190,7 +669,7 @@ class MisReport:
                     ) AS total_pass_perc,
                     
                     Round( ( case when count(arl.id) FILTER (WHERE arl.api_url = 'sync-entity-registration') != 0
-                                  then ( count( case when arl.api_url = 'sync-entity-registration' AND arl.response_data->>'code'::TEXT = '200' then 1 end )::FLOAT 
+                                  then ( count( case when arl.api_url = 'sync-entity-registration' AND arl.response_code = '200' then 1 end )::FLOAT 
                                          / 
                                          count(arl.id) FILTER (WHERE arl.api_url = 'sync-entity-registration')
                                         ) * 100
@@ -199,7 +678,7 @@ class MisReport:
                     ) AS entity_reg_pass_perc,
                     
                     Round( ( case when count(arl.id) FILTER (WHERE arl.api_url = 'sync-invoice-registration-with-code') != 0
-                                  then ( count( case when arl.api_url = 'sync-invoice-registration-with-code' AND arl.response_data->>'code'::TEXT = '200' then 1 end )::FLOAT 
+                                  then ( count( case when arl.api_url = 'sync-invoice-registration-with-code' AND arl.response_code = '200' then 1 end )::FLOAT 
                                          / 
                                          count(arl.id) FILTER (WHERE arl.api_url = 'sync-invoice-registration-with-code')
                                         ) * 100
@@ -208,7 +687,7 @@ class MisReport:
                     ) AS inv_reg_with_ec_pass_perc,
                     
                     Round( ( case when count(arl.id) FILTER (WHERE arl.api_url = 'sync-registration-without-code') != 0
-                                  then ( count( case when arl.api_url = 'sync-registration-without-code' AND arl.response_data->>'code'::TEXT = '200' then 1 end )::FLOAT 
+                                  then ( count( case when arl.api_url = 'sync-registration-without-code' AND arl.response_code = '200' then 1 end )::FLOAT 
                                        / 
                                        count(arl.id) FILTER (WHERE arl.api_url = 'sync-registration-without-code')
                                        ) * 100
@@ -219,36 +698,37 @@ class MisReport:
                     -- ''::text AS "% Duplicate",
                     -- ''::text AS "% Repeat", 
 
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')), 0) AS total_invoice_req,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ), 0) AS entity_reg_invoice_req,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ), 0) AS inv_reg_with_ec_invoice_req,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ), 0) AS inv_reg_without_ec_invoice_req,
+                    coalesce( sum(arl.ledger_count), 0) AS total_invoice_req,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ), 0) AS entity_reg_invoice_req,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ), 0) AS inv_reg_with_ec_invoice_req,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ), 0) AS inv_reg_without_ec_invoice_req,
 
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')), 0) AS total_invoice_pass,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-entity-registration') and arl.response_data->>'code'::text in ('200') ), 0) AS entity_reg_invoice_pass,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and arl.response_data->>'code'::text in ('200') ), 0) AS inv_reg_with_ec_invoice_pass,
-                    coalesce( sum(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') and arl.response_data->>'code'::text in ('200') ), 0) AS inv_reg_without_ec_invoice_pass,
+                    coalesce( sum(arl.ledger_count), 0) AS total_invoice_pass,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-entity-registration') and arl.response_code in ('200') ), 0) AS entity_reg_invoice_pass,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') and arl.response_code in ('200') ), 0) AS inv_reg_with_ec_invoice_pass,
+                    coalesce( sum(arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') and arl.response_code in ('200') ), 0) AS inv_reg_without_ec_invoice_pass,
 
-                    Round( ( sum( jsonb_array_length(arl.request_data->'ledgerData') )
+                    Round( ( sum( arl.ledger_count )
                              / COUNT(arl.id) )::numeric, 2
                     ) AS total_avg_inv_ping,
-                    Round( ( sum( jsonb_array_length(arl.request_data->'ledgerData') ) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ) 
+                    Round( ( sum( arl.ledger_count ) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ) 
                              / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-entity-registration') ) )::numeric, 2
                     ) AS entity_reg_avg_inv_ping,
-                    Round( ( sum( jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ) 
+                    Round( ( sum( arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ) 
                             / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-invoice-registration-with-code') ) )::numeric, 2
                     ) AS inv_reg_with_ec_avg_inv_ping,
-                    Round( ( sum( jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ) 
+                    Round( ( sum( arl.ledger_count) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ) 
                             / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('sync-registration-without-code') ) )::numeric, 2
                     ) AS inv_reg_without_ec_avg_inv_ping
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ( 'sync-entity-registration', 
                                      'sync-registration-without-code', 
                                      'sync-invoice-registration-with-code'
                                     ) 
+                    and arl.period >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, arl.api_url
 
@@ -258,8 +738,9 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
+                    'webhook'::text as source,
 
                     COUNT(ppr.id) as total_incoming_ping,
                     COUNT(ppr.id) FILTER ( WHERE ppr.type in ('async_entity_registration') ) AS entity_reg_incoming_ping,
@@ -347,6 +828,7 @@ class MisReport:
                                   'async_bulk_registration_with_code',  
                                   'async_bulk_registration_without_codes'
                                 ) 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, ppr.type
                 ) AS data 
@@ -356,10 +838,10 @@ class MisReport:
             # 'Entity Registration',
             # 'Invoice Registration with Entity Code',
             # 'Invoice Registration without Entity Code'
-            self.create_materialized_view()
+            return self.create_materialized_view('registration_api_materialized_view')
         except Exception as e:
             logger.error(f"Exception registration_api_materialized_view :: {e}")
-            pass
+            return False
 
     def financing_api_materialized_view(self):
         logger.info(f"....financing_api_materialized_view....")
@@ -372,17 +854,13 @@ class MisReport:
         # -- drop materialized view if exists financing_materialized_api_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists financing_api_materialized_view ;
-                                
-                create materialized view 
-                    financing_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
                     data.idp_code,
                     data.period,
                     data.api_url,
+                    data.source,
                     data.total_of_request,
                     data.f_with_ec_of_request,
                     data.f_without_ec_of_request,
@@ -418,87 +896,89 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
+                    'api'::text as source,
                     COUNT(arl.id) as total_of_request,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) AS f_with_ec_of_request,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) AS f_without_ec_of_request,
 
-                    COUNT(arl.id) FILTER ( WHERE arl.response_data->>'code' in ('200', '1013') ) AS total_successful,
-                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_data->>'code' in ('200', '1013') ) AS f_with_ec_successful,
-                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_data->>'code' in ('200', '1013') ) AS f_without_ec_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.response_code in ('200', '1013') ) AS total_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_code in ('200', '1013') ) AS f_with_ec_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_code in ('200', '1013') ) AS f_without_ec_successful,
                     
-                    Round( ( case when SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') ) != 0
-                                 then (  SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') )
+                    Round( ( case when SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') ) != 0
+                                 then (  SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') )
                                         / 
-                                        SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') )
+                                        SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') )
                                        ) * 100
                             else 0
                             END)::numeric, 2
                     ) AS funding_ok_perc,
                     
                     case when ( COUNT(arl.id) ) != 0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.response_data->>'code' not in ('200', '1013') ) / COUNT(arl.id) ) * 100
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.response_code not in ('200', '1013') ) / COUNT(arl.id) ) * 100
                          else 0
                     end AS total_repeat_perc,
                     
                     case when ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) != 0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_data->>'code' not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) * 100
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_code not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) * 100
                          else 0
                     end  AS f_with_ec_repeat_perc,
                     
                     case when ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) !=0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_data->>'code' not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) * 100
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_code not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) * 100
                          else 0
                     end AS f_without_ec_repeat_perc,
                     
                     case when ( COUNT(arl.id) ) != 0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.response_data->>'code' not in ('200', '1013') ) /  COUNT(arl.id) ) * 100
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.response_code not in ('200', '1013') ) /  COUNT(arl.id) ) * 100
                          else 0 
                     end AS total_duplicate_perc,
                     
                     case when ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) != 0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_data->>'code' not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) * 100 
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') and arl.response_code not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) ) * 100 
                          else 0
                     end AS f_with_ec_duplicate_perc,
                     
                     case when ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) !=0
-                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_data->>'code' not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) * 100  
+                         then ( COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') and arl.response_code not in ('200', '1013') ) / COUNT(arl.id) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) ) * 100  
                          else 0
                     end AS f_without_ec_duplicate_perc,
                     
-                    coalesce( sum( ( SELECT SUM((item->>'invoiceAmt')::numeric) FROM jsonb_array_elements(arl.request_data->'ledgerData') AS item ) ), 0) AS total_amount_of_request,
-                    coalesce( sum( ( SELECT SUM((item->>'invoiceAmt')::numeric) FROM jsonb_array_elements(arl.request_data->'ledgerData') AS item )) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) , 0) AS f_with_ec_amount_of_request,
-                    coalesce( sum( ( SELECT SUM((item->>'invoiceAmt')::numeric) FROM jsonb_array_elements(arl.request_data->'ledgerData') AS item )) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ), 0) AS f_without_ec_amount_of_request,
+                    coalesce( sum( arl.invoice_amount ), 0) AS total_amount_of_request,
+                    coalesce( sum( arl.invoice_amount) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) , 0) AS f_with_ec_amount_of_request,
+                    coalesce( sum( arl.invoice_amount) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ), 0) AS f_without_ec_amount_of_request,
                      
-                    SUM(jsonb_array_length(arl.request_data->'ledgerData')) AS total_invoices_request,
-                    SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) AS f_with_ec_invoices_request,
-                    SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) AS f_without_ec_invoices_request,
+                    SUM(arl.ledger_count) AS total_invoices_request,
+                    SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('Financing API with Entity Code', 'syncFinancing') ) AS f_with_ec_invoices_request,
+                    SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('Financing API without Entity Code', 'syncFinancing') ) AS f_without_ec_invoices_request,
                     
-                    Round( ( case when SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') ) != 0
-                                 then (  SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') )
+                    Round( ( case when SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') ) != 0
+                                 then (  SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') )
                                         / 
-                                        SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') )
+                                        SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') )
                                        ) * 100
                             else 0
                             END)::numeric, 2
                     ) AS "% of Invoices Ok", 
-                    coalesce( sum( ( SELECT SUM((item->>'invoiceAmt')::numeric) FROM jsonb_array_elements(arl.request_data->'ledgerData') AS item ) ), 0) AS "Amount Ok for funding",
-                    Round( ( case when SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') ) != 0
-                                 then (  SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_data->>'code' in ('200', '1013') )
+                    coalesce( sum( arl.invoice_amount ), 0) AS "Amount Ok for funding",
+                    Round( ( case when SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') ) != 0
+                                 then (  SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') and arl.response_code in ('200', '1013') )
                                         / 
-                                        SUM(jsonb_array_length(arl.request_data->'ledgerData')) FILTER ( WHERE arl.api_url in ('syncFinancing') )
+                                        SUM(arl.ledger_count) FILTER ( WHERE arl.api_url in ('syncFinancing') )
                                        ) * 100
                             else 0
                             END)::numeric, 2
                     ) AS "% Funding Value"
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ( 'syncFinancing', 
                                      'Financing API with Entity Code', 'Financing API without Entity Code'
                                     ) 
+                    and arl.period >= (:since)::date
                 group by 
                     md.id, md.name, md.unique_id, period, arl.api_url
                 
@@ -508,8 +988,9 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
+                    'webhook'::text as source,
                     COUNT(ppr.id) as total_of_request,
                     COUNT(ppr.id) FILTER ( WHERE ppr.type in ('Financing API with Entity Code', 'asyncFinancing') ) AS f_with_ec_of_request,
                     COUNT(ppr.id) FILTER ( WHERE ppr.type in ('Financing API without Entity Code', 'asyncFinancing') ) AS f_without_ec_of_request,
@@ -587,6 +1068,7 @@ class MisReport:
                 inner join merchant_details md on md.id::text = ppr.merchant_id
                 where
                     ppr.type in ( 'asyncFinancing', 'Financing API with Entity Code', 'Financing API without Entity Code') 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.id, md.name, md.unique_id, period, ppr.type
                 
@@ -595,7 +1077,7 @@ class MisReport:
                 ;
             """
 
-            self.create_materialized_view()
+            return self.create_materialized_view('financing_api_materialized_view')
             # '''
             # create materialized view
             #         financing_api_materialized_view
@@ -820,7 +1302,7 @@ class MisReport:
             # '''
         except Exception as e:
             logger.error(f"Exception financing_api_materialized_view :: {e}")
-            pass
+            return False
 
     def cancellation_api_materialized_view(self):
         logger.info(f"....cancellation_api_materialized_view....")
@@ -829,11 +1311,6 @@ class MisReport:
         # -- drop materialized view if exists cancellation_api_materialized_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists cancellation_api_materialized_view ;
-                
-                create materialized view 
-                    cancellation_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
@@ -863,19 +1340,19 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
                     
                     COUNT(arl.id) as total_request,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') ) AS ledger_cancel_total_request,
                     COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') ) AS inv_cancel_total_request,
                      
-                    COUNT(arl.id) FILTER ( WHERE arl.response_data->>'code' in ('200')) as total_successful,
-                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') and arl.response_data->>'code' in ('200') ) AS ledger_cancel_successful,
-                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') and arl.response_data->>'code' in ('200') ) AS inv_cancel_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.response_code in ('200')) as total_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') and arl.response_code in ('200') ) AS ledger_cancel_successful,
+                    COUNT(arl.id) FILTER ( WHERE arl.api_url in ('cancel', 'Ledger Cancellation API') and arl.response_code in ('200') ) AS inv_cancel_successful,
                     
                     Round( ( case when count(arl.id)  != 0
-                                 then ( count( case when arl.response_data->>'code'::TEXT in ('200') then 1 end )::FLOAT 
+                                 then ( count( case when arl.response_code in ('200') then 1 end )::FLOAT 
                                         / 
                                         count(arl.id) 
                                        ) * 100
@@ -892,7 +1369,7 @@ class MisReport:
                             inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                     ) as total_invoice_requested,
                     
                     (   select
@@ -904,7 +1381,7 @@ class MisReport:
                             inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                     ) as ledger_cancel_invoice_requested,
                     
                     (   select
@@ -916,7 +1393,7 @@ class MisReport:
                             inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                     ) as inv_cancel_invoice_requested,
                     
                     (   select
@@ -928,8 +1405,8 @@ class MisReport:
                         inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
-                            and arl.response_data->>'code' in ('200')
+                            and l.ledger_id = arl.ledger_no
+                            and arl.response_code in ('200')
                     ) as total_inv_cancelled,
                     
                     (   select
@@ -941,9 +1418,9 @@ class MisReport:
                             inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                             and arl.api_url in ('cancel', 'Ledger Cancellation API')
-                            and arl.response_data->>'code' in ('200')
+                            and arl.response_code in ('200')
                     ) as ledger_cancel_inv_cancelled,
                     
                     (   select
@@ -955,17 +1432,18 @@ class MisReport:
                             inner join invoice i ON i.id = ila.invoice_id
                         where
                             md_inner.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                             and arl.api_url in ('cancel', 'Invoice Cancellation API')
-                            and arl.response_data->>'code' in ('200')
+                            and arl.response_code in ('200')
                     ) as inv_cancel_inv_cancelled
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ('cancel', 'Ledger Cancellation API', 'Invoice Cancellation API') 
+                    and arl.period >= (:since)::date
                 group by 
-                    md.name, md.unique_id, period, arl.api_url, arl.merchant_id, arl.request_data, arl.response_data
+                    md.name, md.unique_id, period, arl.api_url, arl.merchant_id, arl.id
                 ) AS data
                 group by 
                     data.category, data.idp_name, data.idp_code, data.period, data.api_url
@@ -974,10 +1452,10 @@ class MisReport:
                 ;
                 """
             # 'Cancellation API', 'Ledger Cancellation API', 'Invoice Cancellation API'
-            self.create_materialized_view()
+            return self.create_materialized_view('cancellation_api_materialized_view')
         except Exception as e:
             logger.error(f"Exception cancellation_api_materialized_view :: {e}")
-            pass
+            return False
 
     def disbursement_api_materialized_view(self):
         logger.info(f"....disbursement_api_materialized_view....")
@@ -986,11 +1464,6 @@ class MisReport:
         # -- drop materialized view if exists disbursement_api_materialized_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists disbursement_api_materialized_view ;
-                
-                CREATE Materialized VIEW 
-                    disbursement_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
@@ -1008,10 +1481,10 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char( arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
                     COUNT(arl.id) as "# of Request", 
-                    count(arl.id) Filter ( where arl.response_data->>'code'::text in ('200', '1027') ) AS "# of Updated", 
+                    count(arl.id) Filter ( where arl.response_code in ('200', '1027') ) AS "# of Updated", 
                     (   select
                             count(i.id)
                         from
@@ -1021,24 +1494,20 @@ class MisReport:
                         inner join invoice i ON i.id = ila.invoice_id
                         where
                             md.id::text = arl.merchant_id
-                            and l.ledger_id = arl.request_data->>'ledgerNo'
+                            and l.ledger_id = arl.ledger_no
                             and i.status in ('funded', 'partial_funded')
-                            and i.invoice_no in (
-                                                    select 
-                                                        (item->>'invoiceNo')::text
-                                                    from
-                                                        jsonb_array_elements( arl.request_data->'ledgerData') AS item
-                                                )
+                            and i.invoice_no = any(arl.invoice_nos)
                     ) AS "# finance but not disb",
-                    ( count(arl.id) Filter (where arl.request_data->>'code'::text in ('1030')) / count(arl.id) ) * 100 AS "% Unfunded",
-                    ( count(arl.id) Filter (where arl.request_data->>'code'::text in ('200', '1013')) / count(arl.id) ) * 100 AS "% Success"
+                    ( count(arl.id) Filter (where arl.request_code in ('1030')) / count(arl.id) ) * 100 AS "% Unfunded",
+                    ( count(arl.id) Filter (where arl.request_code in ('200', '1013')) / count(arl.id) ) * 100 AS "% Success"
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ('syncDisbursement') 
+                    and arl.period >= (:since)::date
                 group by 
-                    md.name, md.unique_id, period, arl.api_url, arl.merchant_id, arl.request_data
+                    md.name, md.unique_id, period, arl.api_url, arl.merchant_id, arl.id
                 
                 union all
                 
@@ -1046,7 +1515,7 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char( ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
                     count(ppr.id) as "# of Request", 
                     count(ppr.id) Filter ( where ppr.webhook_response->>'code'::text in ('200', '1027') ) AS "# of Updated", 
@@ -1075,6 +1544,7 @@ class MisReport:
                 inner join merchant_details md on md.id::text = ppr.merchant_id
                 where
                     ppr.type in ('asyncDisbursement') 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, ppr.type, ppr.merchant_id, ppr.webhook_response
                 ) AS data
@@ -1084,10 +1554,10 @@ class MisReport:
                     data.period       
                 ;
             """
-            self.create_materialized_view()
+            return self.create_materialized_view('disbursement_api_materialized_view')
         except Exception as e:
             logger.error(f"Exception disbursement_api_view :: {e}")
-            pass
+            return False
 
     def repayment_api_materialized_view(self):
         logger.info(f"....repayment_api_materialized_view....")
@@ -1096,16 +1566,13 @@ class MisReport:
         # -- drop materialized view if exists repayment_api_materialized_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists repayment_api_materialized_view ;
-                CREATE Materialized VIEW 
-                    repayment_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
                     data.idp_code,
                     data.period,
                     data.api_url,
+                    data.source,
                     data."# of Request",
                     data."# of Updated",
                     data."# Repaid but not Disb",
@@ -1116,17 +1583,19 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
+                    'api'::text as source,
                     COUNT(arl.id) as "# of Request",
-                    count(arl.id) Filter ( where arl.response_data->>'code'::text in ('200', '1031') ) AS "# of Updated",
-                    count(arl.id) Filter ( where arl.response_data->>'code'::text in ('1032') ) AS "# Repaid but not Disb",
-                    ( count(arl.id) Filter (where arl.request_data->>'code'::text in ('200', '1031')) / count(arl.id) ) * 100 AS "% Success" 
+                    count(arl.id) Filter ( where arl.response_code in ('200', '1031') ) AS "# of Updated",
+                    count(arl.id) Filter ( where arl.response_code in ('1032') ) AS "# Repaid but not Disb",
+                    ( count(arl.id) Filter (where arl.request_code in ('200', '1031')) / count(arl.id) ) * 100 AS "% Success" 
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ('syncRepayment', 'asyncRepayment') 
+                    and arl.period >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, arl.api_url
                 
@@ -1136,8 +1605,9 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
+                    'webhook'::text as source,
                     COUNT(ppr.id) as "# of Request",
                     count(ppr.id) Filter ( where ppr.webhook_response->>'code'::text in ('200', '1031') ) AS "# of Updated", 
                     count(ppr.id) Filter ( where ppr.webhook_response->>'code'::text in ('1032') ) AS "# Repaid but not Disb",
@@ -1147,6 +1617,7 @@ class MisReport:
                 inner join merchant_details md on md.id::text = ppr.merchant_id
                 where
                     ppr.type in ('asyncRepayment') 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, ppr.type
                 ) AS data  
@@ -1154,13 +1625,15 @@ class MisReport:
                     data.period desc   
                 ;
             """
-            self.create_materialized_view()
+            return self.create_materialized_view('repayment_api_materialized_view')
+        except Exception as e:
+            logger.error(f"Exception repayment_api_materialized_view :: {e}")
+            return False
 
+    def invoice_repayment_percent_materialized_view(self):
+        logger.info(f"....invoice_repayment_percent_materialized_view....")
+        try:
             self.view_query = """ 
-                drop materialized view if exists invoice_repayment_percent_materialized_view ;
-                CREATE Materialized VIEW 
-                    invoice_repayment_percent_materialized_view
-                as
                 select 
                     data.category,
                     data.idp_name,
@@ -1178,7 +1651,7 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(rh.updated_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(rh.updated_at) as period,
                     COUNT(i.id) FILTER (WHERE to_date(rh.extra_data->>'dueDate', 'DD/MM/YYYY') > to_date(rh.extra_data->>'repaymentDate', 'DD/MM/YYYY')) AS "Paid before Time",
                     COUNT(i.id) FILTER (WHERE to_date(rh.extra_data->>'dueDate', 'DD/MM/YYYY') = to_date(rh.extra_data->>'repaymentDate', 'DD/MM/YYYY')) AS "On Time",
                     COUNT(i.id) FILTER (WHERE to_date(rh.extra_data->>'repaymentDate', 'DD/MM/YYYY') > to_date(rh.extra_data->>'dueDate', 'DD/MM/YYYY') AND to_date(rh.extra_data->>'repaymentDate', 'DD/MM/YYYY') <= (to_date(rh.extra_data->>'dueDate', 'DD/MM/YYYY') + INTERVAL '7 DAY')) AS "Less than 7 days Delay",
@@ -1198,15 +1671,16 @@ class MisReport:
                 where 
                     i.status in ('partial_repaid', 'repaid')
                     and rh.extra_data ->'dueDate' is not null and rh.extra_data ->'repaymentDate' is not null
+                    and ist_day(rh.updated_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period
                 ) AS data       
                 ;
             """
-            self.create_materialized_view()
+            return self.create_materialized_view('invoice_repayment_percent_materialized_view')
         except Exception as e:
-            logger.error(f"Exception repayment_api_materialized_view :: {e}")
-            pass
+            logger.error(f"Exception invoice_repayment_percent_materialized_view :: {e}")
+            return False
 
     def status_check_api_materialized_view(self):
         logger.info(f"....status_check_api_materialized_view....")
@@ -1215,17 +1689,13 @@ class MisReport:
         # -- DROP materialized VIEW IF EXISTS status_check_api_materialized_view ;
         try:
             self.view_query = """ 
-                DROP materialized VIEW IF EXISTS status_check_api_materialized_view ;
-                
-                CREATE Materialized VIEW
-                    status_check_api_materialized_view  
-                as
                 select 
                     data.category,
                     data.idp_name,
                     data.idp_code,
                     data.period,
                     data.api_url,
+                    data.source,
                     data."# of Request",
                     data."% Success"
                 from 
@@ -1234,18 +1704,20 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char( arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
+                    'api'::text as source,
                     COUNT(arl.id) as "# of Request",
-                    count(arl.id) Filter ( where arl.response_data->>'code'::text in ('200') ) AS "% Success"
+                    count(arl.id) Filter ( where arl.response_code in ('200') ) AS "% Success"
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ( 'sync-invoice-status-check-with-code',  
                                      'sync-invoice-status-check-without-code', 
                                      'sync-ledger-status-check'
                                    ) 
+                    and arl.period >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, arl.api_url
                 
@@ -1255,8 +1727,9 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char( ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
+                    'webhook'::text as source,
                     COUNT(ppr.id) as "# of Request",
                     count(ppr.id) Filter ( where ppr.webhook_response->>'code'::text in ('200') ) AS "% Success"
                 from
@@ -1267,16 +1740,17 @@ class MisReport:
                                   'invoice_status_check_without_code', 
                                   'ledger_status_check'
                                  ) 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, ppr.type
                 ) AS data
                 order by data.period   
                 ;
             """
-            self.create_materialized_view()
+            return self.create_materialized_view('status_check_api_materialized_view')
         except Exception as e:
             logger.error(f"Exception status_check_api_view :: {e}")
-            pass
+            return False
 
     def total_calls_for_all_api_materialized_view(self):
         logger.info(f"....total_calls_for_all_api_materialized_view....")
@@ -1285,17 +1759,13 @@ class MisReport:
         # -- drop materialized view if exists registration_api_materialized_view ;
         try:
             self.view_query = """ 
-                drop materialized view if exists total_calls_for_all_api_materialized_view ;
-
-                CREATE Materialized VIEW 
-                    total_calls_for_all_api_materialized_view 
-                as
                 select 
                     data.category,
                     data.idp_name,
                     data.idp_code,
                     data.period,
                     data.api_url,
+                    data.source,
                     data.total_incoming_ping,
                     data.total_successful,
                     data.total_success_perc
@@ -1305,12 +1775,13 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(arl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    arl.period as period,
                     arl.api_url,
+                    'api'::text as source,
                     COUNT(arl.id) as total_incoming_ping,
-                    COUNT(arl.id) Filter ( WHERE arl.response_data->>'code'::text in ('200', '1013', '1027', '1031') ) as total_successful,
+                    COUNT(arl.id) Filter ( WHERE arl.response_code in ('200', '1013', '1027', '1031') ) as total_successful,
                     Round( ( case when count(arl.id)  != 0
-                                  then ( count( case when arl.response_data->>'code'::TEXT in ('200', '1013', '1027', '1031') then 1 end )::FLOAT 
+                                  then ( count( case when arl.response_code in ('200', '1013', '1027', '1031') then 1 end )::FLOAT 
                                        / 
                                        count(arl.id) 
                                        ) * 100 
@@ -1318,7 +1789,7 @@ class MisReport:
                                   END)::numeric, 2
                     ) AS total_success_perc
                 from
-                    api_request_log arl
+                    api_request_log_facts arl
                 inner join merchant_details md on md.id::text = arl.merchant_id
                 where
                     arl.api_url in ( 'sync-entity-registration', 
@@ -1333,6 +1804,7 @@ class MisReport:
                                      'sync-ledger-status-check'
                                      
                                     ) 
+                    and arl.period >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, arl.api_url
 
@@ -1342,8 +1814,9 @@ class MisReport:
                     '-'::text as category,
                     md.name as idp_name,
                     md.unique_id as idp_code,
-                    to_date(to_char(ppr.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as period,
+                    ist_day(ppr.created_at) as period,
                     ppr.type as api_url,
+                    'webhook'::text as source,
                     COUNT(ppr.id) as total_incoming_ping,
                     COUNT(ppr.id) Filter ( WHERE ppr.webhook_response->>'code'::text in ('200', '1013', '1027', '1031') ) as total_successful,
                     Round( ( case when count(ppr.id)  != 0
@@ -1370,24 +1843,29 @@ class MisReport:
                                   'invoice_status_check_without_code', 
                                   'ledger_status_check'
                                 ) 
+                    and ist_day(ppr.created_at) >= (:since)::date
                 group by 
                     md.name, md.unique_id, period, ppr.type
                 ) AS data 
                 order by data.period desc
             """
 
-            self.create_materialized_view()
+            return self.create_materialized_view('total_calls_for_all_api_materialized_view')
         except Exception as e:
             logger.error(f"Exception total_calls_for_all_api_materialized_view :: {e}")
-            pass
+            return False
 
 
 @router.post("/create-materialized-view")
 def create_materialized_view():
     try:
         logger.info(f"/create-materialized-view")
-        resp = MisReport().create_all_materialized_view()
-        resp = MisReport().refresh_materialized_view()
+        if MIS_REPORT_MODE == 'incremental':
+            # full rebuild of the rollups, the periodic task only folds new rows
+            resp = MisReport().rebuild_rollups()
+        else:
+            resp = MisReport().create_all_materialized_view()
+            resp = MisReport().refresh_materialized_view()
         logger.info(f"create_materialized_view :: response {resp}")
         return {
             **ErrorCodes.get_error_response(200)
@@ -1399,6 +1877,29 @@ def create_materialized_view():
         }
 
 
+@router.get("/mis-view-refresh-status")
+def mis_view_refresh_status():
+    db = next(get_db())
+    try:
+        result = db.execute(text("""
+            select view_name, last_duration_ms, last_attempt_at, last_success_at, last_error
+            from mis_view_refresh_log
+            order by view_name
+        """))
+        columns = result.keys()
+        data = [dict(zip(columns, row)) for row in result.fetchall()]
+        return {
+            **ErrorCodes.get_error_response(200),
+            "data": jsonable_encoder(data),
+            "cache": MisReportCache.stats()
+        }
+    except Exception as e:
+        logger.exception(f"Exception mis_view_refresh_status :: {e}")
+        return {
+            **ErrorCodes.get_error_response(500)
+        }
+
+
 def mis_report_query(request_data):
     db = next(get_db())
     financing_materialized_api_view = """
@@ -1467,111 +1968,253 @@ def mis_report_query(request_data):
         return 'invalid reportType'
 
 
+# declarative column spec of every FTD / MTD / YTD / LMST summary: how each column is aggregated,
+# which columns are rounded and which come back from the views as text and need coercion
+CUMULATIVE_GROUP_KEYS = ['category', 'idp_name', 'idp_code']
+CUMULATIVE_HUB_REGISTRATION = {
+    'agg': {'Incoming Ping': 'sum', 'Pass': 'sum', 'Fail': 'sum', '% Pass': 'mean', '# Invoice Req': 'sum',
+            '# Inv Pass': 'sum', 'Avg. Inv/Ping': 'sum'},
+    'round': ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping'],
+}
+CUMULATIVE_HUB_REQUEST = {'agg': {'# of Request': 'sum', '# of Updated': 'sum'}}
+CUMULATIVE_HUB = {
+    'registration': CUMULATIVE_HUB_REGISTRATION,
+    'finance': {
+        'agg': {'# Of Request': 'sum', '# Successful': 'sum', 'Funding Ok %': 'mean', '# Invoices Request': 'sum',
+                '% of Invoices Ok': 'mean'},
+        'round': ['# Of Request', '# Successful', 'Funding Ok %', '# Invoices Request', '% of Invoices Ok'],
+        'to_numeric': ['# Invoices Request'],
+    },
+    'cancellation': {'agg': {'# Request': 'sum', '# Successful': 'sum'}},
+    'disburse': CUMULATIVE_HUB_REQUEST,
+    'repayment': CUMULATIVE_HUB_REQUEST,
+    'statusCheck': {'agg': {'# of Request': 'sum', '% Success': 'sum'}},
+}
+CUMULATIVE_REGISTRATION_AGG = {'Incoming Ping': 'sum', 'Pass': 'sum', 'Fail': 'sum', '% Pass': 'mean',
+                               '% Duplicate': 'sum', '% Repeat': 'sum'}
+CUMULATIVE_INVOICE_REGISTRATION = {
+    'agg': {**CUMULATIVE_REGISTRATION_AGG, '# Invoice Req': 'sum', '# Inv Pass': 'sum', 'Avg. Inv/Ping': 'sum'},
+    'round': ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping',
+              '% Duplicate', '% Repeat'],
+}
+CUMULATIVE_SPECS = {
+    'finance': {
+        'agg': {'# Of Request': 'sum', '# Successful': 'sum', 'Funding Ok %': 'mean', 'Repeat %': 'mean',
+                'Duplicate%': 'mean', 'Amount of Request': 'sum', '# Invoices Request': 'sum',
+                '% of Invoices Ok': 'mean', 'Amount Ok for funding': 'sum', '% Funding Value': 'mean'},
+        'round': ['Funding Ok %', 'Repeat %', 'Duplicate%', 'Amount of Request', '% of Invoices Ok',
+                  'Amount Ok for funding', '% Funding Value'],
+        'to_numeric': ['# Invoices Request'],
+    },
+    'registration': {
+        'registrationAPI': CUMULATIVE_INVOICE_REGISTRATION,
+        'invoiceRegWithEC': CUMULATIVE_INVOICE_REGISTRATION,
+        'invoiceRegWithoutEC': CUMULATIVE_INVOICE_REGISTRATION,
+        'entityRegistration': {
+            'agg': {**CUMULATIVE_REGISTRATION_AGG, 'Entity Req': 'sum', 'Entity Pass': 'sum', 'Avg. Inv/Ping': 'sum'},
+            'round': ['Incoming Ping', 'Pass', 'Fail', '% Pass', '% Duplicate', '% Repeat', 'Entity Req',
+                      'Entity Pass', 'Avg. Inv/Ping'],
+        },
+    },
+    'cancellation': {
+        'agg': {'# Request': 'sum', '# Successful': 'sum', '# of Invoices Requested': 'sum', '# Inv. Cancelled': 'sum'},
+        'round': ['# Request', '# Successful', '# of Invoices Requested', '# Inv. Cancelled'],
+    },
+    'disbursement': {
+        'agg': {'# of Request': 'sum', '# of Updated': 'sum', '# Financed but not Disb': 'sum', '% Unfunded': 'mean'},
+        'round': ['# of Request', '# of Updated', '# Financed but not Disb', '% Unfunded'],
+    },
+    'repayment': {
+        'repaymentAPI': {
+            'agg': {'# of Request': 'sum', '# of Updated': 'sum', '# Repaid but not Disb': 'sum'},
+            'round': ['# of Request', '# of Updated', '# Repaid but not Disb'],
+        },
+        'invoiceRepayment%': {
+            'agg': {'Paid before Time': 'sum', 'On Time': 'sum', 'Less than 7 days Delay': 'sum',
+                    '7-30 days delay': 'sum', '> 30 days delay': 'sum'},
+            'round': ['Paid before Time', 'On Time', 'Less than 7 days Delay', '7-30 days delay', '> 30 days delay'],
+        },
+    },
+    'statusCheck': {
+        'agg': {'# of Request': 'sum', '% Success': 'mean'},
+        'round': ['# of Request', '% Success'],
+    },
+    'misHub': CUMULATIVE_HUB,
+    'totalBusiness': CUMULATIVE_HUB,
+    'directIBDIC': {
+        **CUMULATIVE_HUB,
+        'finance': {
+            'agg': {'# Successful': 'sum', 'Funding Ok %': 'mean', '# Invoices Request': 'sum', '% of Invoices Ok': 'mean'},
+            'round': ['# Successful', 'Funding Ok %', '# Invoices Request', '% of Invoices Ok'],
+            'to_numeric': ['# Invoices Request'],
+        },
+    },
+    'IdpWise': {
+        'all_api_calls': {
+            'agg': {'incoming': 'sum', 'successful': 'sum', '% Success': 'mean'},
+            'round': ['incoming', 'successful', '% Success'],
+        },
+        'registration': {
+            'agg': {'enquiry': 'sum', 'successful': 'sum', 'No of Inv': 'sum', 'Avg Inc/Ping': 'sum'},
+            'round': ['enquiry', 'successful', 'Avg Inc/Ping'],
+        },
+        'finance': {
+            'agg': {'# of Request': 'sum', '# Successful': 'sum', '# of Invoices': 'sum'},
+            'round': ['# of Request', '# Successful', '# of Invoices'],
+        },
+        'cancellation': {'agg': {'# Request': 'sum', '% Successful': 'mean'}},
+        'disburse': {'agg': {'# of Request': 'sum', '% Success': 'mean'}},
+        'repayment': {'agg': {'# of Request': 'sum', '% Success': 'mean'}},
+        'statusCheck': {'agg': {'# of Request': 'sum', '% Success': 'mean'}},
+    },
+    'IdpWiseDailyTrend': {
+        'all_api_calls': {
+            'agg': {'# Request': 'sum', '# Success': 'sum', '% Success': 'mean', '% Time Outliers': 'sum'},
+            'round': ['# Request', '# Success', '% Success', '% Time Outliers'],
+        },
+        'registration': {
+            'agg': {'# Request': 'sum', '# Success': 'sum', 'No of Inv': 'sum', 'Avg Inc/Ping': 'sum',
+                    '% Time Outliers': 'sum'},
+            'round': ['# Request', '# Success', 'Avg Inc/Ping', '% Time Outliers'],
+        },
+        'finance': {
+            'agg': {'# of Request': 'sum', '# Successful': 'sum', '# of Invoices': 'sum', '% Time Outliers': 'sum'},
+            'round': ['# of Request', '# Successful', '# of Invoices', '% Time Outliers'],
+        },
+        'cancellation': {
+            'agg': {'# Request': 'sum', '% Successful': 'sum', '% Time Outliers': 'sum'},
+            'round': ['# Request', '% Successful', '% Time Outliers'],
+        },
+        'disburse': {
+            'agg': {'# of Request': 'sum', '# of Updated': 'sum', '% Time Outliers': 'sum'},
+            'round': ['# of Request', '# of Updated', '% Time Outliers'],
+        },
+        'repayment': {
+            'agg': {'# of Request': 'sum', '# of Updated': 'sum', '% Time Outliers': 'sum'},
+            'round': ['# of Request', '# of Updated', '% Time Outliers'],
+        },
+        'statusCheck': {
+            'agg': {'# of Request': 'sum', '% Success': 'sum', '% Time Outliers': 'sum'},
+            'round': ['# of Request', '% Success', '% Time Outliers'],
+        },
+    },
+}
+
+
 class GetInvoiceHubMisReport:
 
     @staticmethod
-    def cumulative_finance_data(query_data):
-        from datetime import datetime
-
+    def cumulative_rollup(query_data, spec):
+        # FTD / MTD / YTD / LMST in one pass: period is parsed once, every row is tagged with the
+        # buckets it falls in and all buckets are aggregated by a single groupby
         df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-
-        ftd_df = df
-        ftd_df = ftd_df[ftd_df.period == curr_date]
-        ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-        finance_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            '# Of Request': 'sum',
-            '# Successful': 'sum',
-            'Funding Ok %': 'mean',
-            'Repeat %': 'mean',
-            'Duplicate%': 'mean',
-            'Amount of Request': 'sum',
-            '# Invoices Request': 'sum',
-            '% of Invoices Ok': 'mean',
-            'Amount Ok for funding': 'sum',
-            '% Funding Value': 'mean'
-        }).reset_index()
-        # Round numeric columns to two decimal places
-        numeric_cols = ['Funding Ok %', 'Repeat %', 'Duplicate%', 'Amount of Request', '% of Invoices Ok', 'Amount Ok for funding', '% Funding Value']
-        finance_df[numeric_cols] = finance_df[numeric_cols].astype(float).round(2)
-        finance_df['period'] = 'FTD'
-
-        mtd_df = df
-        curr_month = now_time.date().month
-        mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-        mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        mtd_finance_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            '# Of Request': 'sum',
-            '# Successful': 'sum',
-            'Funding Ok %': 'mean',
-            'Repeat %': 'mean',
-            'Duplicate%': 'mean',
-            'Amount of Request': 'sum',
-            '# Invoices Request': 'sum',
-            '% of Invoices Ok': 'mean',
-            'Amount Ok for funding': 'sum',
-            '% Funding Value': 'mean'
-        }).reset_index()
-        mtd_finance_df[numeric_cols] = mtd_finance_df[numeric_cols].astype(float).round(2)
-        mtd_finance_df['period'] = 'MTD'
-
-        ytd_df = df
-        curr_year = now_time.date().year
-        ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year] # '2024'
-        ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        ytd_finance_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            '# Of Request': 'sum',
-            '# Successful': 'sum',
-            'Funding Ok %': 'mean',
-            'Repeat %': 'mean',
-            'Duplicate%': 'mean',
-            'Amount of Request': 'sum',
-            '# Invoices Request': 'sum',
-            "% of Invoices Ok": 'mean',
-            "Amount Ok for funding": 'sum',
-            "% Funding Value": 'mean'
-        }).reset_index()
-        ytd_finance_df[numeric_cols] = ytd_finance_df[numeric_cols].astype(float).round(2)
-        ytd_finance_df['period'] = 'YTD'
-
-        lmst_df = df
-        lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-        lmst_month = lmst_date.month
-        lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-        lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        lmst_finance_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            '# Of Request': 'sum',
-            '# Successful': 'sum',
-            'Funding Ok %': 'mean',
-            'Repeat %': 'mean',
-            'Duplicate%': 'mean',
-            'Amount of Request': 'sum',
-            '# Invoices Request': 'sum',
-            '% of Invoices Ok': 'mean',
-            'Amount Ok for funding': 'sum',
-            '% Funding Value': 'mean'
-        }).reset_index()
-        lmst_finance_df[numeric_cols] = lmst_finance_df[numeric_cols].astype(float).round(2)
-        lmst_finance_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([finance_df, mtd_finance_df, ytd_finance_df, lmst_finance_df])
-        cumulative_list.reset_index(drop=True)
-        # cumulative_list = cumulative_list.sort_values(by='idp_code')
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')# Remove 'period' from its current position
-        cols.insert(3, 'period') # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
+        if df.empty:
+            return []
+        for column in spec.get('to_numeric', ()):
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(float)
+
+        now_time = dt.now(asia_kolkata)
+        period = pd.to_datetime(df['period'])
+        month_key = (period.dt.year * 12 + period.dt.month).to_numpy()
+        curr_month_key = now_time.year * 12 + now_time.month
+        bucket_masks = {
+            'FTD': (period.dt.normalize() == pd.Timestamp(now_time.date())).to_numpy(),
+            'MTD': month_key == curr_month_key,
+            'YTD': (period.dt.year == now_time.year).to_numpy(),
+            'LMST': month_key == curr_month_key - 1,
+        }
+        positions = [np.flatnonzero(mask) for mask in bucket_masks.values()]
+        bucketed = df.take(np.concatenate(positions))
+        bucketed['period'] = np.repeat(list(bucket_masks), [len(position) for position in positions])
+
+        # sort=False keeps the FTD, MTD, YTD, LMST order the rows were tagged in
+        cumulative_list = bucketed.groupby(CUMULATIVE_GROUP_KEYS + ['period'], sort=False).agg(spec['agg']).reset_index()
+        round_cols = spec.get('round', [])
+        cumulative_list[round_cols] = cumulative_list[round_cols].astype(float).round(2)
+        cumulative_list.sort_values('idp_name', ascending=True, inplace=True, kind='stable')
         cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-
         return cumulative_list
 
     @staticmethod
-    def get_finance_data(request_data, db):
+    def cumulative_query(db, query, params, spec):
+        # same buckets as cumulative_rollup but aggregated in postgres, every view row is joined to the
+        # buckets its period falls in so only one row per idp and bucket comes back
+        round_cols = spec.get('round', [])
+        to_numeric_cols = spec.get('to_numeric', [])
+        aggregates = []
+        for column, func in spec['agg'].items():
+            value = f'"{column}"'
+            if column in to_numeric_cols:
+                value = f'coalesce(({value})::numeric, 0)'
+            elif column in round_cols:
+                value = f'({value})::numeric'
+            aggregate = f'coalesce(sum({value}), 0)' if func == 'sum' else f'avg({value})'
+            if column in round_cols:
+                aggregate = f'round({aggregate}, 2)'
+            aggregates.append(f'{aggregate} as "{column}"')
+        cumulative_query = f"""
+            with base as ({query}),
+            bucketed as (
+                select
+                    base.*,
+                    bucket.name as bucket_name,
+                    bucket.ord as bucket_ord
+                from
+                    base
+                    join (values ('FTD', 1), ('MTD', 2), ('YTD', 3), ('LMST', 4)) as bucket(name, ord) on
+                    case bucket.name
+                        when 'FTD' then base.period::date = (:today)::date
+                        when 'MTD' then date_trunc('month', base.period::date) = date_trunc('month', (:today)::date)
+                        when 'YTD' then date_trunc('year', base.period::date) = date_trunc('year', (:today)::date)
+                        else date_trunc('month', base.period::date) = date_trunc('month', (:today)::date) - interval '1 month'
+                    end
+            )
+            select
+                category,
+                idp_name,
+                idp_code,
+                bucket_name as period,
+                {', '.join(aggregates)}
+            from
+                bucketed
+            group by
+                category, idp_name, idp_code, bucket_name, bucket_ord
+            order by
+                idp_name, bucket_ord, category, idp_code
+        """
+        result = db.execute(text(cumulative_query), [{**params, 'today': dt.now(asia_kolkata).date()}])
+        columns = result.keys()
+        return jsonable_encoder([dict(zip(columns, row)) for row in result.fetchall()])
+
+    @staticmethod
+    def result_rows(result, mode='list'):
+        # 'list' the row dicts the report endpoint serialises, 'stream' the open result itself so the export
+        # reads it from the server side cursor while writing the sheet
+        if mode == 'stream':
+            return result
+        columns = result.keys()
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+
+    @staticmethod
+    def cumulative_sheets(db, sheet_queries, params):
+        # sheet_queries maps each sheet to its (view query, cumulative spec)
+        sheets = {}
+        for sheet, (query, spec) in sheet_queries.items():
+            if MIS_SQL_CUMULATIVE:
+                try:
+                    sheets[sheet] = GetInvoiceHubMisReport.cumulative_query(db, query, params, spec)
+                    continue
+                except Exception as e:
+                    logger.exception(f"sql cumulative aggregation failed for {sheet}, falling back to pandas {e}")
+                    db.rollback()
+            result = db.execute(text(query), [params])
+            columns = result.keys()
+            query_data = [dict(zip(columns, row)) for row in result.fetchall()]
+            sheets[sheet] = GetInvoiceHubMisReport.cumulative_rollup(query_data, spec)
+        return sheets
+
+    @staticmethod
+    def get_finance_data(request_data, db, mode='list'):
         query1 = """
         select 
             category, 
@@ -1647,7 +2290,9 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            query1_result = db.execute(text(query1), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'financingAPI': (query1, CUMULATIVE_SPECS['finance']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             from_date = dt.strptime(from_date, "%d/%m/%Y").strftime("%Y-%m-%d")
@@ -1658,190 +2303,15 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
 
         data = {
             'financingAPI': data1
         }
-        if request_data.get('filterType', '') == 'all':
-            finance_data = GetInvoiceHubMisReport.cumulative_finance_data(data['financingAPI'])
-            data = {
-                'financingAPI': finance_data
-            }
         return data
 
     @staticmethod
-    def cumulative_registration_data(query_data, type):
-        from datetime import datetime
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping', '% Duplicate', '% Repeat']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type =='entityRegistration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "Entity Req": 'sum',
-                "Entity Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['Incoming Ping', 'Pass', 'Fail', '% Pass', '% Duplicate', '% Repeat', 'Entity Req', 'Entity Pass', 'Avg. Inv/Ping']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "Entity Req": 'sum',
-                "Entity Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "Entity Req": 'sum',
-                "Entity Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                "% Duplicate": 'sum',
-                "% Repeat": 'sum',
-                "Entity Req": 'sum',
-                "Entity Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_registration_data(request_data, db):
+    def get_registration_data(request_data, db, mode='list'):
 
         query1 = """
             select 
@@ -1943,10 +2413,12 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            query1_result = db.execute(text(query1), [{'idp_id': idp_id}])
-            query2_result = db.execute(text(query2), [{'idp_id': idp_id}])
-            query3_result = db.execute(text(query3), [{'idp_id': idp_id}])
-            query4_result = db.execute(text(query4), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'registrationAPI': (query1, CUMULATIVE_SPECS['registration']['registrationAPI']),
+                'entityRegistration': (query2, CUMULATIVE_SPECS['registration']['entityRegistration']),
+                'invoiceRegWithEC': (query3, CUMULATIVE_SPECS['registration']['invoiceRegWithEC']),
+                'InvoiceRegWithoutEC': (query4, CUMULATIVE_SPECS['registration']['invoiceRegWithoutEC']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             query2 = query2 + "and period between (:fromDate)::date and (:toDate)::date"
@@ -1969,17 +2441,10 @@ class GetInvoiceHubMisReport:
         logger.info(f"query3_result {query3_result}")
         logger.info(f"query3_result {query4_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
-
-        columns = query2_result.keys()
-        data2 = [dict(zip(columns, row)) for row in query2_result.fetchall()]
-
-        columns = query3_result.keys()
-        data3 = [dict(zip(columns, row)) for row in query3_result.fetchall()]
-
-        columns = query4_result.keys()
-        data4 = [dict(zip(columns, row)) for row in query4_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(query2_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(query3_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(query4_result, mode)
 
         data = {
             'registrationAPI': data1,
@@ -1987,95 +2452,10 @@ class GetInvoiceHubMisReport:
             'invoiceRegWithEC': data3,
             'invoiceRegWithoutEC': data4
         }
-        if request_data.get('filterType', '') == 'all':
-            registration_api = GetInvoiceHubMisReport.cumulative_registration_data(data['registrationAPI'], 'registrationAPI') if data['registrationAPI'] != [] else []
-            entity_registration = GetInvoiceHubMisReport.cumulative_registration_data(data['entityRegistration'], 'entityRegistration') if data['entityRegistration'] != [] else []
-            invoice_reg_with_ec = GetInvoiceHubMisReport.cumulative_registration_data(data['invoiceRegWithEC'], 'invoiceRegWithEC') if data['invoiceRegWithEC'] != [] else []
-            invoice_reg_without_ec = GetInvoiceHubMisReport.cumulative_registration_data(data['invoiceRegWithoutEC'], 'invoiceRegWithoutEC') if data['invoiceRegWithoutEC'] != [] else []
-            data = {
-                'registrationAPI': registration_api,
-                'entityRegistration': entity_registration,
-                'invoiceRegWithEC': invoice_reg_with_ec,
-                'InvoiceRegWithoutEC': invoice_reg_without_ec
-            }
         return data
 
     @staticmethod
-    def cumulative_cancel_data(query_data):
-        # from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        now_time = dt.now()
-        curr_date = now_time.date()
-
-        ftd_df = df
-        ftd_df = ftd_df[ftd_df.period == curr_date]
-        # ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        cancel_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# Request": 'sum',
-            "# Successful": 'sum',
-            "# of Invoices Requested": 'sum',
-            "# Inv. Cancelled": 'sum'
-        }).reset_index()
-        # Round numeric columns to two decimal places
-        numeric_cols = ["# Request", "# Successful", "# of Invoices Requested", "# Inv. Cancelled"]
-        cancel_df[numeric_cols] = cancel_df[numeric_cols].astype(float).round(2)
-        cancel_df['period'] = 'FTD'
-
-        mtd_df = df
-        curr_month = now_time.date().month
-        mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-        # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        mtd_cancel_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# Request": 'sum',
-            "# Successful": 'sum',
-            "# of Invoices Requested": 'sum',
-            "# Inv. Cancelled": 'sum'
-        }).reset_index()
-        mtd_cancel_df[numeric_cols] = mtd_cancel_df[numeric_cols].astype(float).round(2)
-        mtd_cancel_df['period'] = 'MTD'
-
-        ytd_df = df
-        curr_year = now_time.date().year
-        ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-        # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        ytd_cancel_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# Request": 'sum',
-            "# Successful": 'sum',
-            "# of Invoices Requested": 'sum',
-            "# Inv. Cancelled": 'sum'
-        }).reset_index()
-        ytd_cancel_df[numeric_cols] = ytd_cancel_df[numeric_cols].astype(float).round(2)
-        ytd_cancel_df['period'] = 'YTD'
-
-        lmst_df = df
-        lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-        lmst_month = lmst_date.month
-        lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-        # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        lmst_cancel_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# Request": 'sum',
-            "# Successful": 'sum',
-            "# of Invoices Requested": 'sum',
-            "# Inv. Cancelled": 'sum'
-        }).reset_index()
-        lmst_cancel_df[numeric_cols] = lmst_cancel_df[numeric_cols].astype(float).round(2)
-        lmst_cancel_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([cancel_df, mtd_cancel_df, ytd_cancel_df, lmst_cancel_df])
-        cumulative_list.reset_index(drop=True)
-        # cumulative_list = cumulative_list.sort_values(by='idp_code')
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-
-        return cumulative_list
-
-    @staticmethod
-    def get_cancel_data(request_data, db):
+    def get_cancel_data(request_data, db, mode='list'):
         ## Cancellation API, Ledger Cancellation API, Invoice Cancellation API
         query1 = """
             select 
@@ -2133,9 +2513,11 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            query1_result = db.execute(text(query1), [{'idp_id': idp_id}])
-            query2_result = db.execute(text(query2), [{'idp_id': idp_id}])
-            query3_result = db.execute(text(query3), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'cancellationAPI': (query1, CUMULATIVE_SPECS['cancellation']),
+                'ledgerCancellationAPI': (query2, CUMULATIVE_SPECS['cancellation']),
+                'invoiceCancellationAPI': (query3, CUMULATIVE_SPECS['cancellation']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             query2 = query2 + "and period between (:fromDate)::date and (:toDate)::date"
@@ -2154,109 +2536,19 @@ class GetInvoiceHubMisReport:
         logger.info(f"query2_result {query2_result}")
         logger.info(f"query3_result {query3_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
-
-        columns = query2_result.keys()
-        data2 = [dict(zip(columns, row)) for row in query2_result.fetchall()]
-
-        columns = query3_result.keys()
-        data3 = [dict(zip(columns, row)) for row in query3_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(query2_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(query3_result, mode)
 
         data = {
             'cancellationAPI': data1,
             'ledgerCancellationAPI': data2,
             'invoiceCancellationAPI': data3
         }
-        if request_data.get('filterType', '') == 'all':
-            cancellation_api = GetInvoiceHubMisReport.cumulative_cancel_data(data['cancellationAPI']) if data['cancellationAPI'] != [] else []
-            ledger_cancellation_api = GetInvoiceHubMisReport.cumulative_cancel_data(data['ledgerCancellationAPI']) if data['ledgerCancellationAPI'] != [] else []
-            invoice_cancellation_api = GetInvoiceHubMisReport.cumulative_cancel_data(data['invoiceCancellationAPI']) if data['invoiceCancellationAPI'] != [] else []
-            data = {
-                'cancellationAPI': cancellation_api,
-                'ledgerCancellationAPI': ledger_cancellation_api,
-                'invoiceCancellationAPI': invoice_cancellation_api
-            }
         return data
 
     @staticmethod
-    def cumulative_disbursement_data(query_data):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-
-        ftd_df = df
-        ftd_df = ftd_df[ftd_df.period == curr_date]
-        # ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-        dis_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "# of Updated": 'sum',
-            "# Financed but not Disb": 'sum',
-            "% Unfunded": 'mean'
-        }).reset_index()
-        # Round numeric columns to two decimal places
-        numeric_cols = ["# of Request", "# of Updated", "# Financed but not Disb", "% Unfunded"]
-        dis_df[numeric_cols] = dis_df[numeric_cols].astype(float).round(2)
-        dis_df['period'] = 'FTD'
-
-        mtd_df = df
-        curr_month = now_time.date().month
-        mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-        # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        mtd_dis_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "# of Updated": 'sum',
-            "# Financed but not Disb": 'sum',
-            "% Unfunded": 'mean'
-        }).reset_index()
-        mtd_dis_df[numeric_cols] = mtd_dis_df[numeric_cols].astype(float).round(2)
-        mtd_dis_df['period'] = 'MTD'
-
-        ytd_df = df
-        curr_year = now_time.date().year
-        ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-        # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        ytd_dis_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "# of Updated": 'sum',
-            "# Financed but not Disb": 'sum',
-            "% Unfunded": 'mean'
-        }).reset_index()
-        ytd_dis_df[numeric_cols] = ytd_dis_df[numeric_cols].astype(float).round(2)
-        ytd_dis_df['period'] = 'YTD'
-
-        lmst_df = df
-        lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-        lmst_month = lmst_date.month
-        lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-        # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        lmst_dis_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "# of Updated": 'sum',
-            "# Financed but not Disb": 'sum',
-            "% Unfunded": 'mean'
-        }).reset_index()
-        lmst_dis_df[numeric_cols] = lmst_dis_df[numeric_cols].astype(float).round(2)
-        lmst_dis_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([dis_df, mtd_dis_df, ytd_dis_df, lmst_dis_df])
-        cumulative_list.reset_index(drop=True)
-        # cumulative_list = cumulative_list.sort_values(by='idp_code')
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_disbursement_data(request_data, db):
+    def get_disbursement_data(request_data, db, mode='list'):
         ## Disbursal API
         query1 = """
             select 
@@ -2272,13 +2564,17 @@ class GetInvoiceHubMisReport:
             from 
                 disbursement_api_materialized_view
             where 
-                api_url in ('syncDisbursement', 'asyncDisbursement') AND 
-                period between (:fromDate)::date and (:toDate)::date
+                api_url in ('syncDisbursement', 'asyncDisbursement') 
                 and idp_code = ANY(:idp_id)
         """
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
-        if from_date != "" and to_date != "":
+        if request_data.get('filterType', '') == 'all':
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'disbursalAPI': (query1, CUMULATIVE_SPECS['disbursement']),
+            }, {'idp_id': idp_id})
+        elif from_date != "" and to_date != "":
+            query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             from_date = dt.strptime(from_date, "%d/%m/%Y").strftime("%Y-%m-%d")
             to_date = dt.strptime(to_date, "%d/%m/%Y").strftime("%Y-%m-%d")
             query1_result = db.execute(text(query1), [{'idp_id': idp_id, 'fromDate': from_date, 'toDate': to_date}])
@@ -2287,150 +2583,13 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
 
         data = {'disbursalAPI': data1}
-        if request_data.get('filterType', '') == 'all':
-            disbursal_api = GetInvoiceHubMisReport.cumulative_disbursement_data(data['disbursalAPI']) if data['disbursalAPI'] != [] else []
-            data = {
-                'disbursalAPI': disbursal_api,
-            }
         return data
 
     @staticmethod
-    def cumulative_repayment_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        if type in ('repaymentAPI'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-            repay_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "# Repaid but not Disb": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ["# of Request", "# of Updated", "# Repaid but not Disb"]
-            repay_df[numeric_cols] = repay_df[numeric_cols].astype(float).round(2)
-            repay_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            mtd_repay_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "# Repaid but not Disb": 'sum'
-            }).reset_index()
-            mtd_repay_df[numeric_cols] = mtd_repay_df[numeric_cols].astype(float).round(2)
-            mtd_repay_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            ytd_repay_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "# Repaid but not Disb": 'sum'
-            }).reset_index()
-            ytd_repay_df[numeric_cols] = ytd_repay_df[numeric_cols].astype(float).round(2)
-            ytd_repay_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_repay_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "# Repaid but not Disb": 'sum'
-            }).reset_index()
-            lmst_repay_df[numeric_cols] = lmst_repay_df[numeric_cols].astype(float).round(2)
-            lmst_repay_df['period'] = 'LMST'
-
-        elif type in ('invoiceRepayment%'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-            repay_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Paid before Time": 'sum',
-                "On Time": 'sum',
-                "Less than 7 days Delay": 'sum',
-                "7-30 days delay": 'sum',
-                "> 30 days delay": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ["Paid before Time", "On Time", "Less than 7 days Delay", "7-30 days delay", "> 30 days delay"]
-            repay_df[numeric_cols] = repay_df[numeric_cols].astype(float).round(2)
-            repay_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            mtd_repay_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Paid before Time": 'sum',
-                "On Time": 'sum',
-                "Less than 7 days Delay": 'sum',
-                "7-30 days delay": 'sum',
-                "> 30 days delay": 'sum'
-            }).reset_index()
-            mtd_repay_df[numeric_cols] = mtd_repay_df[numeric_cols].astype(float).round(2)
-            mtd_repay_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            ytd_repay_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Paid before Time": 'sum',
-                "On Time": 'sum',
-                "Less than 7 days Delay": 'sum',
-                "7-30 days delay": 'sum',
-                "> 30 days delay": 'sum'
-            }).reset_index()
-            ytd_repay_df[numeric_cols] = ytd_repay_df[numeric_cols].astype(float).round(2)
-            ytd_repay_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_repay_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Paid before Time": 'sum',
-                "On Time": 'sum',
-                "Less than 7 days Delay": 'sum',
-                "7-30 days delay": 'sum',
-                "> 30 days delay": 'sum'
-            }).reset_index()
-            lmst_repay_df[numeric_cols] = lmst_repay_df[numeric_cols].astype(float).round(2)
-            lmst_repay_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([repay_df, mtd_repay_df, ytd_repay_df, lmst_repay_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_repayment_data(request_data, db):
+    def get_repayment_data(request_data, db, mode='list'):
         ## Repayment API, Invoice Repayment %
         query1 = """
             select 
@@ -2481,8 +2640,10 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            query1_result = db.execute(text(query1), [{'idp_id': idp_id}])
-            query2_result = db.execute(text(query2), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'repaymentAPI': (query1, CUMULATIVE_SPECS['repayment']['repaymentAPI']),
+                'invoiceRepayment%': (query2, CUMULATIVE_SPECS['repayment']['invoiceRepayment%']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             query2 = query2 + "and period between (:fromDate)::date and (:toDate)::date"
@@ -2496,94 +2657,17 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
-
-        columns = query2_result.keys()
-        data2 = [dict(zip(columns, row)) for row in query2_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(query2_result, mode)
 
         data = {
             'repaymentAPI': data1,
             'invoiceRepayment%': data2
         }
-        if request_data.get('filterType', '') == 'all':
-            repayment_api = GetInvoiceHubMisReport.cumulative_repayment_data(data['repaymentAPI'], 'repaymentAPI') if data['repaymentAPI'] != [] else []
-            invoice_repayment_per = GetInvoiceHubMisReport.cumulative_repayment_data(data['invoiceRepayment%'], 'invoiceRepayment%') if data['invoiceRepayment%'] != [] else []
-            data = {
-                'repaymentAPI': repayment_api,
-                'invoiceRepayment%': invoice_repayment_per
-            }
         return data
 
     @staticmethod
-    def cumulative_status_check_data(query_data):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-
-        ftd_df = df
-        ftd_df = ftd_df[ftd_df.period == curr_date]
-        # ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-        status_check_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "% Success": 'mean'
-        }).reset_index()
-        # Round numeric columns to two decimal places
-        numeric_cols = ["# of Request", "% Success"]
-        status_check_df[numeric_cols] = status_check_df[numeric_cols].astype(float).round(2)
-        status_check_df['period'] = 'FTD'
-
-        mtd_df = df
-        curr_month = now_time.date().month
-        mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-        # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        mtd_status_check_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "% Success": 'mean'
-        }).reset_index()
-        mtd_status_check_df[numeric_cols] = mtd_status_check_df[numeric_cols].astype(float).round(2)
-        mtd_status_check_df['period'] = 'MTD'
-
-        ytd_df = df
-        curr_year = now_time.date().year
-        ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-        # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        ytd_status_check_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "% Success": 'mean'
-        }).reset_index()
-        ytd_status_check_df[numeric_cols] = ytd_status_check_df[numeric_cols].astype(float).round(2)
-        ytd_status_check_df['period'] = 'YTD'
-
-        lmst_df = df
-        lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-        lmst_month = lmst_date.month
-        lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-        # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-        lmst_status_check_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-            "# of Request": 'sum',
-            "% Success": 'mean'
-        }).reset_index()
-        lmst_status_check_df[numeric_cols] = lmst_status_check_df[numeric_cols].astype(float).round(2)
-        lmst_status_check_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([status_check_df, mtd_status_check_df, ytd_status_check_df, lmst_status_check_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_status_check_data(request_data, db):
+    def get_status_check_data(request_data, db, mode='list'):
         ## Status Check, Status Check with Entity, Status Ch without Entity
         query1 = """
             select 
@@ -2623,9 +2707,11 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            query1_result = db.execute(text(query1), [{'idp_id': idp_id}])
-            query2_result = db.execute(text(query2), [{'idp_id': idp_id}])
-            query3_result = db.execute(text(query3), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'statusCheck': (query1, CUMULATIVE_SPECS['statusCheck']),
+                'statusCheckWithEntity': (query2, CUMULATIVE_SPECS['statusCheck']),
+                'statusCheckWithoutEntity': (query3, CUMULATIVE_SPECS['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             query1 = query1 + "and period between (:fromDate)::date and (:toDate)::date"
             query2 = query2 + "and period between (:fromDate)::date and (:toDate)::date"
@@ -2644,330 +2730,19 @@ class GetInvoiceHubMisReport:
         logger.info(f"query2_result {query2_result}")
         logger.info(f"query3_result {query3_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
-
-        columns = query2_result.keys()
-        data2 = [dict(zip(columns, row)) for row in query2_result.fetchall()]
-
-        columns = query3_result.keys()
-        data3 = [dict(zip(columns, row)) for row in query3_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(query2_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(query3_result, mode)
 
         data = {
             'statusCheck': data1,
             'statusCheckWithEntity': data2,
             'statusCheckWithoutEntity': data3
         }
-        if request_data.get('filterType', '') == 'all':
-            status_check = GetInvoiceHubMisReport.cumulative_status_check_data(data['statusCheck']) if data['statusCheck'] != [] else []
-            status_check_with_entity = GetInvoiceHubMisReport.cumulative_status_check_data(data['statusCheckWithEntity']) if data['statusCheckWithEntity'] != [] else []
-            status_check_without_entity = GetInvoiceHubMisReport.cumulative_status_check_data(data['statusCheckWithoutEntity']) if data['statusCheckWithoutEntity'] != [] else []
-            data = {
-                'statusCheck': status_check,
-                'statusCheckWithEntity': status_check_with_entity,
-                'statusCheckWithoutEntity': status_check_without_entity
-            }
         return data
 
     @staticmethod
-    def cumulative_hub_mis_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        # if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-        if type == 'registration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'finance':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Of Request', '# Successful', 'Funding Ok %', '# Invoices Request', '% of Invoices Ok']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        elif type == 'cancellation':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '# Successful']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type in ('disburse', 'repayment'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# of Updated']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'statusCheck':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_hub_mis_data(request_data, db):
+    def get_hub_mis_data(request_data, db, mode='list'):
 
         reg_query = """
             select 
@@ -3074,12 +2849,14 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            reg_result = db.execute(text(reg_query), [{'idp_id': idp_id}])
-            finance_result = db.execute(text(finance_query), [{'idp_id': idp_id}])
-            cancel_result = db.execute(text(cancel_query), [{'idp_id': idp_id}])
-            disburse_result = db.execute(text(disburse_query), [{'idp_id': idp_id}])
-            repay_result = db.execute(text(repay_query), [{'idp_id': idp_id}])
-            status_check_result = db.execute(text(status_check_query), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'registration': (reg_query, CUMULATIVE_SPECS['misHub']['registration']),
+                'finance': (finance_query, CUMULATIVE_SPECS['misHub']['finance']),
+                'cancellation': (cancel_query, CUMULATIVE_SPECS['misHub']['cancellation']),
+                'disburse': (disburse_query, CUMULATIVE_SPECS['misHub']['disburse']),
+                'repayment': (repay_query, CUMULATIVE_SPECS['misHub']['repayment']),
+                'statusCheck': (status_check_query, CUMULATIVE_SPECS['misHub']['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             reg_query = reg_query + "and period between (:fromDate)::date and (:toDate)::date"
             finance_query = finance_query + "and period between (:fromDate)::date and (:toDate)::date"
@@ -3112,344 +2889,21 @@ class GetInvoiceHubMisReport:
         logger.info(f"query3_result {repay_result}")
         logger.info(f"query3_result {status_check_result}")
 
-        columns = reg_result.keys()
-        data1 = [dict(zip(columns, row)) for row in reg_result.fetchall()]
-
-        columns = finance_result.keys()
-        data2 = [dict(zip(columns, row)) for row in finance_result.fetchall()]
-
-        columns = cancel_result.keys()
-        data3 = [dict(zip(columns, row)) for row in cancel_result.fetchall()]
-
-        columns = disburse_result.keys()
-        data4 = [dict(zip(columns, row)) for row in disburse_result.fetchall()]
-
-        columns = repay_result.keys()
-        data5 = [dict(zip(columns, row)) for row in repay_result.fetchall()]
-
-        columns = status_check_result.keys()
-        data6 = [dict(zip(columns, row)) for row in status_check_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(reg_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(finance_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(cancel_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(disburse_result, mode)
+        data5 = GetInvoiceHubMisReport.result_rows(repay_result, mode)
+        data6 = GetInvoiceHubMisReport.result_rows(status_check_result, mode)
 
         sheets = {
             'registration': data1, 'finance': data2, 'cancellation': data3,
             'disburse': data4, 'repayment': data5, 'statusCheck': data6
         }
-        if request_data.get('filterType', '') == 'all':
-            registration = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['registration'], 'registration') if sheets['registration'] != [] else []
-            finance = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['finance'], 'finance') if sheets['finance'] != [] else []
-            cancel = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['cancellation'], 'cancellation') if sheets['cancellation'] != [] else []
-            disburse = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['disburse'], 'disburse') if sheets['disburse'] != [] else []
-            repayment = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['repayment'], 'repayment') if sheets['repayment'] != [] else []
-            status_check = GetInvoiceHubMisReport.cumulative_hub_mis_data(sheets['statusCheck'], 'statusCheck') if sheets['statusCheck'] != [] else []
-            sheets = {
-                'registration': registration,
-                'finance': finance,
-                'cancellation': cancel,
-                'disburse': disburse,
-                'repayment': repayment,
-                'statusCheck': status_check
-            }
         return sheets
 
     @staticmethod
-    def cumulative_direct_ibdic_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        # if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-        if type == 'registration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'finance':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Successful', 'Funding Ok %', '# Invoices Request', '% of Invoices Ok']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        elif type == 'cancellation':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '# Successful']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type in ('disburse', 'repayment'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# of Updated']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'statusCheck':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_direct_ibdic_data(request_data, db):
+    def get_direct_ibdic_data(request_data, db, mode='list'):
 
         reg_query = """
             select 
@@ -3564,12 +3018,14 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            reg_result = db.execute(text(reg_query), [{'idp_id': idp_id}])
-            finance_result = db.execute(text(finance_query), [{'idp_id': idp_id}])
-            cancel_result = db.execute(text(cancel_query), [{'idp_id': idp_id}])
-            disburse_result = db.execute(text(disburse_query), [{'idp_id': idp_id}])
-            repay_result = db.execute(text(repay_query), [{'idp_id': idp_id}])
-            status_check_result = db.execute(text(status_check_query), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'registration': (reg_query, CUMULATIVE_SPECS['directIBDIC']['registration']),
+                'finance': (finance_query, CUMULATIVE_SPECS['directIBDIC']['finance']),
+                'cancellation': (cancel_query, CUMULATIVE_SPECS['directIBDIC']['cancellation']),
+                'disburse': (disburse_query, CUMULATIVE_SPECS['directIBDIC']['disburse']),
+                'repayment': (repay_query, CUMULATIVE_SPECS['directIBDIC']['repayment']),
+                'statusCheck': (status_check_query, CUMULATIVE_SPECS['directIBDIC']['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             reg_query = reg_query + "and period between (:fromDate)::date and (:toDate)::date"
             finance_query = finance_query + "and period between (:fromDate)::date and (:toDate)::date"
@@ -3601,349 +3057,21 @@ class GetInvoiceHubMisReport:
         logger.info(f"repay_result {repay_result}")
         logger.info(f"status_check_result {status_check_result}")
 
-        columns = reg_result.keys()
-        data1 = [dict(zip(columns, row)) for row in reg_result.fetchall()]
-
-        columns = finance_result.keys()
-        data2 = [dict(zip(columns, row)) for row in finance_result.fetchall()]
-
-        columns = cancel_result.keys()
-        data3 = [dict(zip(columns, row)) for row in cancel_result.fetchall()]
-
-        columns = disburse_result.keys()
-        data4 = [dict(zip(columns, row)) for row in disburse_result.fetchall()]
-
-        columns = repay_result.keys()
-        data5 = [dict(zip(columns, row)) for row in repay_result.fetchall()]
-
-        columns = status_check_result.keys()
-        data6 = [dict(zip(columns, row)) for row in status_check_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(reg_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(finance_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(cancel_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(disburse_result, mode)
+        data5 = GetInvoiceHubMisReport.result_rows(repay_result, mode)
+        data6 = GetInvoiceHubMisReport.result_rows(status_check_result, mode)
 
         sheets = {
             'registration': data1, 'finance': data2, 'cancellation': data3,
             'disburse': data4, 'repayment': data5, 'statusCheck': data6
         }
-        if request_data.get('filterType', '') == 'all':
-
-            registration = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['registration'], 'registration') if sheets['registration'] != [] else []
-            finance = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['finance'], 'finance') if sheets['finance'] != [] else []
-            cancel = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['cancellation'], 'cancellation') if sheets['cancellation'] != [] else []
-            disburse = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['disburse'], 'disburse') if sheets['disburse'] != [] else []
-            repayment = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['repayment'], 'repayment') if sheets['repayment'] != [] else []
-            status_check = GetInvoiceHubMisReport.cumulative_direct_ibdic_data(sheets['statusCheck'], 'statusCheck') if sheets['statusCheck'] != [] else []
-            sheets = {
-                'registration': registration,
-                'finance': finance,
-                'cancellation': cancel,
-                'disburse': disburse,
-                'repayment': repayment,
-                'statusCheck': status_check
-            }
         return sheets
 
     @staticmethod
-    def cumulative_total_business_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        # if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-        if type == 'registration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['Incoming Ping', 'Pass', 'Fail', '% Pass', '# Invoice Req', '# Inv Pass', 'Avg. Inv/Ping']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "Incoming Ping": 'sum',
-                "Pass": 'sum',
-                "Fail": 'sum',
-                "% Pass": 'mean',
-                # "% Duplicate": 'mean',
-                # "% Repeat": 'mean',
-                "# Invoice Req": 'sum',
-                "# Inv Pass": 'sum',
-                "Avg. Inv/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'finance':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            ftd_df['# Invoices Request'] = pd.to_numeric(ftd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Of Request', '# Successful', 'Funding Ok %', '# Invoices Request', '% of Invoices Ok']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(
-                0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Of Request": 'sum',
-                "# Successful": 'sum',
-                "Funding Ok %": 'mean',
-                "# Invoices Request": 'sum',
-                "% of Invoices Ok": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        elif type == 'cancellation':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '# Successful']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Successful": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type in ('disburse', 'repayment'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# of Updated']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'statusCheck':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_total_business_data(request_data, db):
+    def get_total_business_data(request_data, db, mode='list'):
 
         reg_query = """
             select 
@@ -4059,12 +3187,14 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            reg_result = db.execute(text(reg_query), [{'idp_id': idp_id}])
-            finance_result = db.execute(text(finance_query), [{'idp_id': idp_id}])
-            cancel_result = db.execute(text(cancel_query), [{'idp_id': idp_id}])
-            disburse_result = db.execute(text(disburse_query), [{'idp_id': idp_id}])
-            repay_result = db.execute(text(repay_query), [{'idp_id': idp_id}])
-            status_check_result = db.execute(text(status_check_query), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'registration': (reg_query, CUMULATIVE_SPECS['totalBusiness']['registration']),
+                'finance': (finance_query, CUMULATIVE_SPECS['totalBusiness']['finance']),
+                'cancellation': (cancel_query, CUMULATIVE_SPECS['totalBusiness']['cancellation']),
+                'disburse': (disburse_query, CUMULATIVE_SPECS['totalBusiness']['disburse']),
+                'repayment': (repay_query, CUMULATIVE_SPECS['totalBusiness']['repayment']),
+                'statusCheck': (status_check_query, CUMULATIVE_SPECS['totalBusiness']['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             reg_query = reg_query + "and period between (:fromDate)::date and (:toDate)::date"
             finance_query = finance_query + "and period between (:fromDate)::date and (:toDate)::date"
@@ -4096,47 +3226,21 @@ class GetInvoiceHubMisReport:
         logger.info(f"repay_result {repay_result}")
         logger.info(f"status_check_result {status_check_result}")
 
-        columns = reg_result.keys()
-        data1 = [dict(zip(columns, row)) for row in reg_result.fetchall()]
-
-        columns = finance_result.keys()
-        data2 = [dict(zip(columns, row)) for row in finance_result.fetchall()]
-
-        columns = cancel_result.keys()
-        data3 = [dict(zip(columns, row)) for row in cancel_result.fetchall()]
-
-        columns = disburse_result.keys()
-        data4 = [dict(zip(columns, row)) for row in disburse_result.fetchall()]
-
-        columns = repay_result.keys()
-        data5 = [dict(zip(columns, row)) for row in repay_result.fetchall()]
-
-        columns = status_check_result.keys()
-        data6 = [dict(zip(columns, row)) for row in status_check_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(reg_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(finance_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(cancel_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(disburse_result, mode)
+        data5 = GetInvoiceHubMisReport.result_rows(repay_result, mode)
+        data6 = GetInvoiceHubMisReport.result_rows(status_check_result, mode)
 
         sheets = {
             'registration': data1, 'finance': data2, 'cancellation': data3,
             'disburse': data4, 'repayment': data5, 'statusCheck': data6
         }
-        if request_data.get('filterType', '') == 'all':
-            registration = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['registration'],'registration') if sheets['registration'] != [] else []
-            finance = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['finance'], 'finance') if sheets['finance'] != [] else []
-            cancel = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['cancellation'], 'cancellation') if sheets['cancellation'] != [] else []
-            disburse = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['disburse'], 'disburse') if sheets['disburse'] != [] else []
-            repayment = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['repayment'], 'repayment') if sheets['repayment'] != [] else []
-            status_check = GetInvoiceHubMisReport.cumulative_total_business_data(sheets['statusCheck'], 'statusCheck') if sheets['statusCheck'] != [] else []
-            sheets = {
-                'registration': registration,
-                'finance': finance,
-                'cancellation': cancel,
-                'disburse': disburse,
-                'repayment': repayment,
-                'statusCheck': status_check
-            }
         return sheets
 
     @staticmethod
-    def get_idp_wise_billing_mis_data(request_data, db):
+    def get_idp_wise_billing_mis_data(request_data, db, mode='list'):
         ## IDP Wise Billing MIS
         query1 = """
             select 						
@@ -4152,7 +3256,7 @@ class GetInvoiceHubMisReport:
             inner join merchant_details md on md.id::text = arl.merchant_id
             where 
                 md.unique_id = ANY(:idp_id)
-                and arl.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(arl.created_at) between (:fromDate)::date and (:toDate)::date
             order by 
                 --arl.created_at::date desc 
                 s_no asc
@@ -4169,335 +3273,14 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
 
         # data = {'IdpWiseBillingMis': data1}
         data = {'UsageMISforIDP': data1}
         return data
 
     @staticmethod
-    def cumulative_idp_wise_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        # if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-        if type == 'all_api_calls':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "incoming": 'sum',
-                "successful": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['incoming', 'successful', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "incoming": 'sum',
-                "successful": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "incoming": 'sum',
-                "successful": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "incoming": 'sum',
-                "successful": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'registration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "enquiry": 'sum',
-                "successful": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['enquiry', 'successful', 'Avg Inc/Ping']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "enquiry": 'sum',
-                "successful": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "enquiry": 'sum',
-                "successful": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "enquiry": 'sum',
-                "successful": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'finance':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['% of funded Inv'] = pd.to_numeric(ftd_df['% of funded Inv'], errors='coerce').fillna(0).astype(float)
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum'
-                #"% of funded Inv": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# Successful', '# of Invoices']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        elif type == 'cancellation':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '% Successful']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type in ('disburse', 'repayment'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'statusCheck':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'mean'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_idp_wise_data(request_data, db):
+    def get_idp_wise_data(request_data, db, mode='list'):
 
         all_api_call_query = """
             select 
@@ -4620,13 +3403,15 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            all_api_call_result = db.execute(text(all_api_call_query), [{'idp_id': idp_id}])
-            reg_result = db.execute(text(reg_query), [{'idp_id': idp_id}])
-            finance_result = db.execute(text(finance_query), [{'idp_id': idp_id}])
-            cancel_result = db.execute(text(cancel_query), [{'idp_id': idp_id}])
-            disburse_result = db.execute(text(disburse_query), [{'idp_id': idp_id}])
-            repay_result = db.execute(text(repay_query), [{'idp_id': idp_id}])
-            status_check_result = db.execute(text(status_check_query), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'all_api_calls': (all_api_call_query, CUMULATIVE_SPECS['IdpWise']['all_api_calls']),
+                'registration': (reg_query, CUMULATIVE_SPECS['IdpWise']['registration']),
+                'finance': (finance_query, CUMULATIVE_SPECS['IdpWise']['finance']),
+                'cancellation': (cancel_query, CUMULATIVE_SPECS['IdpWise']['cancellation']),
+                'disburse': (disburse_query, CUMULATIVE_SPECS['IdpWise']['disburse']),
+                'repayment': (repay_query, CUMULATIVE_SPECS['IdpWise']['repayment']),
+                'statusCheck': (status_check_query, CUMULATIVE_SPECS['IdpWise']['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             all_api_call_query = all_api_call_query + "and period between (:fromDate)::date and (:toDate)::date"
             reg_query = reg_query + "and period between (:fromDate)::date and (:toDate)::date"
@@ -4666,397 +3451,23 @@ class GetInvoiceHubMisReport:
         logger.info(f"query3_result {repay_result}")
         logger.info(f"query3_result {status_check_result}")
 
-        columns = all_api_call_result.keys()
-        data = [dict(zip(columns, row)) for row in all_api_call_result.fetchall()]
-
-        columns = reg_result.keys()
-        data1 = [dict(zip(columns, row)) for row in reg_result.fetchall()]
-
-        columns = finance_result.keys()
-        data2 = [dict(zip(columns, row)) for row in finance_result.fetchall()]
-
-        columns = cancel_result.keys()
-        data3 = [dict(zip(columns, row)) for row in cancel_result.fetchall()]
-
-        columns = disburse_result.keys()
-        data4 = [dict(zip(columns, row)) for row in disburse_result.fetchall()]
-
-        columns = repay_result.keys()
-        data5 = [dict(zip(columns, row)) for row in repay_result.fetchall()]
-
-        columns = status_check_result.keys()
-        data6 = [dict(zip(columns, row)) for row in status_check_result.fetchall()]
+        data = GetInvoiceHubMisReport.result_rows(all_api_call_result, mode)
+        data1 = GetInvoiceHubMisReport.result_rows(reg_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(finance_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(cancel_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(disburse_result, mode)
+        data5 = GetInvoiceHubMisReport.result_rows(repay_result, mode)
+        data6 = GetInvoiceHubMisReport.result_rows(status_check_result, mode)
 
         sheets = {
             'all_api_calls': data,
             'registration': data1, 'finance': data2, 'cancellation': data3,
             'disburse': data4, 'repayment': data5, 'statusCheck': data6
         }
-        if request_data.get('filterType', '') == 'all':
-            all_api_calls = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['all_api_calls'], 'all_api_calls') if sheets['all_api_calls'] != [] else []
-            registration = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['registration'], 'registration') if sheets['registration'] != [] else []
-            finance = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['finance'], 'finance') if sheets['finance'] != [] else []
-            cancel = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['cancellation'], 'cancellation') if sheets['cancellation'] != [] else []
-            disburse = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['disburse'], 'disburse') if sheets['disburse'] != [] else []
-            repayment = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['repayment'], 'repayment') if sheets['repayment'] != [] else []
-            status_check = GetInvoiceHubMisReport.cumulative_idp_wise_data(sheets['statusCheck'], 'statusCheck') if sheets['statusCheck'] != [] else []
-            sheets = {
-                'all_api_calls': all_api_calls,
-                'registration': registration,
-                'finance': finance,
-                'cancellation': cancel,
-                'disburse': disburse,
-                'repayment': repayment,
-                'statusCheck': status_check
-            }
         return sheets
 
     @staticmethod
-    def cumulative_idp_wise_daily_trend_data(query_data, type):
-        from datetime import datetime
-
-        df = pd.DataFrame(query_data)
-        # df.to_json()
-        # now_time = datetime.now().replace(day=26, month=3)
-        now_time = datetime.now()
-        curr_date = now_time.date()
-        # if type in ('registrationAPI', 'invoiceRegWithEC', 'invoiceRegWithoutEC'):
-        if type == 'all_api_calls':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "% Success": 'mean',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '# Success', '% Success', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "% Success": 'mean',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "% Success": 'mean',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "% Success": 'mean',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'registration':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '# Success', 'Avg Inc/Ping', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "# Success": 'sum',
-                "No of Inv": 'sum',
-                "Avg Inc/Ping": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'finance':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['% of funded Inv'] = pd.to_numeric(ftd_df['% of funded Inv'], errors='coerce').fillna(0).astype(float)
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum',
-                "% Time Outliers": 'sum'
-                # "% of funded Inv": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# Successful', '# of Invoices', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Request'] = pd.to_numeric(mtd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Request'] = pd.to_numeric(ytd_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Request'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# Successful": 'sum',
-                "# of Invoices": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        elif type == 'cancellation':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# Request', '% Successful', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# Request": 'sum',
-                "% Successful": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type in ('disburse', 'repayment'):
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '# of Updated', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "# of Updated": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-        elif type == 'statusCheck':
-            ftd_df = df
-            ftd_df = ftd_df[ftd_df.period == curr_date]
-            # ftd_df['# Invoices Req'] = pd.to_numeric(ftd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-
-            ftd_reg_df = ftd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            # Round numeric columns to two decimal places
-            numeric_cols = ['# of Request', '% Success', '% Time Outliers']
-            ftd_reg_df[numeric_cols] = ftd_reg_df[numeric_cols].astype(float).round(2)
-            ftd_reg_df['period'] = 'FTD'
-
-            mtd_df = df
-            curr_month = now_time.date().month
-            mtd_df = mtd_df[pd.to_datetime(mtd_df.period).dt.month == curr_month]
-            # mtd_df['# Invoices Req'] = pd.to_numeric(mtd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            mtd_reg_df = mtd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            mtd_reg_df[numeric_cols] = mtd_reg_df[numeric_cols].astype(float).round(2)
-            mtd_reg_df['period'] = 'MTD'
-
-            ytd_df = df
-            curr_year = now_time.date().year
-            ytd_df = ytd_df[pd.to_datetime(ytd_df.period).dt.year == curr_year]  # '2024'
-            # ytd_df['# Invoices Req'] = pd.to_numeric(ytd_df['# Invoices Req'], errors='coerce').fillna(0).astype(float)
-            ytd_reg_df = ytd_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            ytd_reg_df[numeric_cols] = ytd_reg_df[numeric_cols].astype(float).round(2)
-            ytd_reg_df['period'] = 'YTD'
-
-            lmst_df = df
-            lmst_date = now_time.replace(month=curr_month) - relativedelta(months=1)
-            lmst_month = lmst_date.month
-            lmst_df = lmst_df[pd.to_datetime(lmst_df.period).dt.month == lmst_month]
-            # lmst_df['# Invoices Req'] = pd.to_numeric(lmst_df['# Invoices Request'], errors='coerce').fillna(0).astype(float)
-            lmst_reg_df = lmst_df.groupby(['category', 'idp_name', 'idp_code']).agg({
-                "# of Request": 'sum',
-                "% Success": 'sum',
-                "% Time Outliers": 'sum'
-            }).reset_index()
-            lmst_reg_df[numeric_cols] = lmst_reg_df[numeric_cols].astype(float).round(2)
-            lmst_reg_df['period'] = 'LMST'
-
-        cumulative_list = pd.concat([ftd_reg_df, mtd_reg_df, ytd_reg_df, lmst_reg_df])
-        cumulative_list.reset_index(drop=True)
-        cumulative_list.sort_values('idp_name', ascending=True, inplace=True)
-        cols = list(cumulative_list.columns)
-        cols.remove('period')  # Remove 'period' from its current position
-        cols.insert(3, 'period')  # Insert 'period' at the desired position
-        cumulative_list = cumulative_list[cols]
-        cumulative_list = jsonable_encoder(cumulative_list.to_dict(orient='records'))
-        return cumulative_list
-
-    @staticmethod
-    def get_idp_wise_daily_trend(request_data, db):
+    def get_idp_wise_daily_trend(request_data, db, mode='list'):
 
         all_api_call_query = """
             select 
@@ -5181,13 +3592,15 @@ class GetInvoiceHubMisReport:
         idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         if request_data.get('filterType', '') == 'all':
-            all_api_call_result = db.execute(text(all_api_call_query), [{'idp_id': idp_id}])
-            reg_result = db.execute(text(reg_query), [{'idp_id': idp_id}])
-            finance_result = db.execute(text(finance_query), [{'idp_id': idp_id}])
-            cancel_result = db.execute(text(cancel_query), [{'idp_id': idp_id}])
-            disburse_result = db.execute(text(disburse_query), [{'idp_id': idp_id}])
-            repay_result = db.execute(text(repay_query), [{'idp_id': idp_id}])
-            status_check_result = db.execute(text(status_check_query), [{'idp_id': idp_id}])
+            return GetInvoiceHubMisReport.cumulative_sheets(db, {
+                'all_api_calls': (all_api_call_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['all_api_calls']),
+                'registration': (reg_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['registration']),
+                'finance': (finance_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['finance']),
+                'cancellation': (cancel_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['cancellation']),
+                'disburse': (disburse_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['disburse']),
+                'repayment': (repay_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['repayment']),
+                'statusCheck': (status_check_query, CUMULATIVE_SPECS['IdpWiseDailyTrend']['statusCheck']),
+            }, {'idp_id': idp_id})
         elif from_date != "" and to_date != "":
             all_api_call_query = all_api_call_query + "and period between (:fromDate)::date and (:toDate)::date"
             reg_query = reg_query + "and period between (:fromDate)::date and (:toDate)::date"
@@ -5223,53 +3636,23 @@ class GetInvoiceHubMisReport:
         logger.info(f"query3_result {repay_result}")
         logger.info(f"query3_result {status_check_result}")
 
-        columns = all_api_call_result.keys()
-        data = [dict(zip(columns, row)) for row in all_api_call_result.fetchall()]
-
-        columns = reg_result.keys()
-        data1 = [dict(zip(columns, row)) for row in reg_result.fetchall()]
-
-        columns = finance_result.keys()
-        data2 = [dict(zip(columns, row)) for row in finance_result.fetchall()]
-
-        columns = cancel_result.keys()
-        data3 = [dict(zip(columns, row)) for row in cancel_result.fetchall()]
-
-        columns = disburse_result.keys()
-        data4 = [dict(zip(columns, row)) for row in disburse_result.fetchall()]
-
-        columns = repay_result.keys()
-        data5 = [dict(zip(columns, row)) for row in repay_result.fetchall()]
-
-        columns = status_check_result.keys()
-        data6 = [dict(zip(columns, row)) for row in status_check_result.fetchall()]
+        data = GetInvoiceHubMisReport.result_rows(all_api_call_result, mode)
+        data1 = GetInvoiceHubMisReport.result_rows(reg_result, mode)
+        data2 = GetInvoiceHubMisReport.result_rows(finance_result, mode)
+        data3 = GetInvoiceHubMisReport.result_rows(cancel_result, mode)
+        data4 = GetInvoiceHubMisReport.result_rows(disburse_result, mode)
+        data5 = GetInvoiceHubMisReport.result_rows(repay_result, mode)
+        data6 = GetInvoiceHubMisReport.result_rows(status_check_result, mode)
 
         sheets = {
             'all_api_calls': data,
             'registration': data1, 'finance': data2, 'cancellation': data3,
             'disburse': data4, 'repayment': data5, 'statusCheck': data6
         }
-        if request_data.get('filterType', '') == 'all':
-            all_api_calls = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['all_api_calls'], 'all_api_calls') if sheets['all_api_calls'] != [] else []
-            registration = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['registration'], 'registration') if sheets['registration'] != [] else []
-            finance = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['finance'], 'finance') if sheets['finance'] != [] else []
-            cancel = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['cancellation'], 'cancellation') if sheets['cancellation'] != [] else []
-            disburse = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['disburse'], 'disburse') if sheets['disburse'] != [] else []
-            repayment = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['repayment'], 'repayment') if sheets['repayment'] != [] else []
-            status_check = GetInvoiceHubMisReport.cumulative_idp_wise_daily_trend_data(sheets['statusCheck'], 'statusCheck') if sheets['statusCheck'] != [] else []
-            sheets = {
-                'all_api_calls': all_api_calls,
-                'registration': registration,
-                'finance': finance,
-                'cancellation': cancel,
-                'disburse': disburse,
-                'repayment': repayment,
-                'statusCheck': status_check
-            }
         return sheets
 
     @staticmethod
-    def get_consent_data(request_data, db):
+    def get_consent_data(request_data, db, mode='list'):
         ## Consent Data
         query1 = """
             select 
@@ -5284,7 +3667,7 @@ class GetInvoiceHubMisReport:
             from 
                 gsp_user_details gud
             where	
-                gud.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(gud.created_at) between (:fromDate)::date and (:toDate)::date
             """
         # idp_id = request_data.get('idpId', '')
         from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
@@ -5297,14 +3680,13 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
 
         data = {'consentData': data1}
         return data
 
     @staticmethod
-    def get_gsp_api_calls(request_data, db):
+    def get_gsp_api_calls(request_data, db, mode='list'):
         ## GSP API Calls
         # query1 = """
         #     select
@@ -5391,7 +3773,7 @@ class GetInvoiceHubMisReport:
             cross join lateral jsonb_array_elements(garl.request_data->'payload') AS payload_data
             where	
                 split_part(garl.api_url,'/', array_upper(string_to_array(garl.api_url, '/'), 1)) in ('verify-ewb')
-                and garl.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(garl.created_at) between (:fromDate)::date and (:toDate)::date
             union all
             select
                 to_date(to_char(garl.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as request_date,
@@ -5432,7 +3814,7 @@ class GetInvoiceHubMisReport:
                 gsp_api_request_log garl
             where
                 split_part(garl.api_url,'/', array_upper(string_to_array(garl.api_url, '/'), 1)) in ('verify-ewb-credential')
-                and garl.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(garl.created_at) between (:fromDate)::date and (:toDate)::date
         ) as data
         order by 
             (data.request_date, data.request_time)  desc
@@ -5450,17 +3832,103 @@ class GetInvoiceHubMisReport:
 
         logger.info(f"query1_result {query1_result}")
 
-        columns = query1_result.keys()
-        data1 = [dict(zip(columns, row)) for row in query1_result.fetchall()]
+        data1 = GetInvoiceHubMisReport.result_rows(query1_result, mode)
 
         data = {'gspApiCalls': data1}
         return data
 
 
-@router.post("/get-invoice-hub-mis-report/")
-def get_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Session = Depends(get_db)):
-    request_data = jsonable_encoder(request)
-    report_type_list = ['finance', 'registration', 'cancellation', 'disbursement', 'repayment', 'statusCheck', 'misHub',
+class MisReportCache:
+    # report types served from the materialized views / rollups, the rest read live tables and are never cached
+    CACHED_REPORT_TYPES = ('finance', 'registration', 'cancellation', 'disbursement', 'repayment', 'statusCheck',
+                           'misHub', 'directIBDIC', 'totalBusiness', 'summary', 'IdpWiseDailyTrend', 'IdpWise')
+    GENERATION_KEY = 'mis_report_cache:generation'
+    LRU_KEY = 'mis_report_cache:lru'
+    STATS_KEY = 'mis_report_cache:stats'
+
+    @staticmethod
+    def cache_key(request_data):
+        idp_id = request_data.get('idpId', '')
+        idp_ids = idp_id if isinstance(idp_id, list) else [idp_id]
+        generation = r.get(MisReportCache.GENERATION_KEY) or '0'
+        params = json.dumps([
+            request_data.get('reportType', ''), request_data.get('filterType', ''), sorted(set(map(str, idp_ids))),
+            request_data.get('fromDate', ''), request_data.get('toDate', '')
+        ])
+        return f"mis_report_cache:{generation}:{hashlib.sha256(params.encode()).hexdigest()}"
+
+    @staticmethod
+    def get(request_data):
+        if not MIS_REPORT_CACHE or request_data.get('reportType', '') not in MisReportCache.CACHED_REPORT_TYPES:
+            return None, None
+        try:
+            key = MisReportCache.cache_key(request_data)
+            cached = r.get(key)
+            pipe = r.pipeline()
+            if cached is None:
+                pipe.hincrby(MisReportCache.STATS_KEY, 'misses', 1)
+            else:
+                pipe.hincrby(MisReportCache.STATS_KEY, 'hits', 1)
+                pipe.zadd(MisReportCache.LRU_KEY, {key: time.time()})
+            pipe.execute()
+            return key, None if cached is None else json.loads(cached)
+        except Exception as e:
+            logger.warning(f"MisReportCache get failed :: {e}")
+            return None, None
+
+    @staticmethod
+    def set(key, data):
+        if key is None:
+            return
+        try:
+            pipe = r.pipeline()
+            pipe.set(key, json.dumps(jsonable_encoder(data)), ex=MIS_REPORT_CACHE_TTL)
+            pipe.zadd(MisReportCache.LRU_KEY, {key: time.time()})
+            pipe.zcard(MisReportCache.LRU_KEY)
+            size = pipe.execute()[-1]
+            if size > MIS_REPORT_CACHE_MAX_ENTRIES:
+                evicted = [member for member, _ in r.zpopmin(MisReportCache.LRU_KEY, size - MIS_REPORT_CACHE_MAX_ENTRIES)]
+                if evicted:
+                    pipe = r.pipeline()
+                    pipe.delete(*evicted)
+                    pipe.hincrby(MisReportCache.STATS_KEY, 'evictions', len(evicted))
+                    pipe.execute()
+        except Exception as e:
+            logger.warning(f"MisReportCache set failed :: {e}")
+
+    @staticmethod
+    def invalidate():
+        # a new generation makes every cached response unreachable, the old entries are dropped right away
+        try:
+            stale = r.zrange(MisReportCache.LRU_KEY, 0, -1)
+            pipe = r.pipeline()
+            pipe.incr(MisReportCache.GENERATION_KEY)
+            if stale:
+                pipe.delete(*stale)
+            pipe.delete(MisReportCache.LRU_KEY)
+            pipe.hincrby(MisReportCache.STATS_KEY, 'invalidations', 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"MisReportCache invalidate failed :: {e}")
+
+    @staticmethod
+    def stats():
+        try:
+            stats = {name: int(count) for name, count in r.hgetall(MisReportCache.STATS_KEY).items()}
+            stats.update({
+                'generation': int(r.get(MisReportCache.GENERATION_KEY) or 0),
+                'entries': r.zcard(MisReportCache.LRU_KEY)
+            })
+            return stats
+        except Exception as e:
+            logger.warning(f"MisReportCache stats failed :: {e}")
+            return {}
+
+
+@router.post("/get-invoice-hub-mis-report/")
+def get_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Session = Depends(get_db)):
+    request_data = jsonable_encoder(request)
+    report_type_list = ['finance', 'registration', 'cancellation', 'disbursement', 'repayment', 'statusCheck', 'misHub',
                         'directIBDIC', 'totalBusiness', 'summary', 'UsageMISforIDP', 'IdpWiseDailyTrend',
                         'IdpWise', 'consentData', 'gspApiCalls']
     try:
@@ -5469,6 +3937,12 @@ def get_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Sessio
             **ErrorCodes.get_error_response(200)
         }
 
+        # keyed on the request as sent, 'all' covers every idp so the merchant lookup below is skipped on a hit
+        cache_key, cached_data = MisReportCache.get(request_data)
+        if cached_data is not None:
+            response_data.update({'data': cached_data})
+            return response_data
+
         idp_id = request_data.get('idpId', '')
         if request_data.get('filterType', '') == 'all':
             request_data.update({'idpId': [idp_id]})
@@ -5523,6 +3997,7 @@ def get_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Sessio
                 'code': 200,
                 'message': 'invalid reportType'
             }
+        MisReportCache.set(cache_key, data)
         response_data.update({'data': data})
         return response_data
 
@@ -6061,20 +4536,67 @@ def get_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Sessio
 #         return sheets
 
 
-@router.post("/download-invoice-hub-mis-report/")
-def download_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Session = Depends(get_db)):
-    request_data = jsonable_encoder(request)
-    report_type_list = ['finance', 'registration', 'cancellation', 'disbursement', 'repayment', 'statusCheck', 'misHub',
-                        'directIBDIC', 'totalBusiness', 'summary', 'UsageMISforIDP', 'IdpWiseDailyTrend',
-                        'IdpWise', 'consentData', 'gspApiCalls']
-    try:
-        response_data = {
-            'requestId': request_data.get('requestId'),
-            **ErrorCodes.get_error_response(200)
-        }
+class MisReportExport:
+    XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    @staticmethod
+    def sheet_rows(value):
+        # sheets are either row dicts (the filterType 'all' cumulative sheets) or a result opened with
+        # stream_results, the latter is read from the server side cursor in batches
+        if hasattr(value, 'keys') and hasattr(value, 'partitions'):
+            columns = list(value.keys())
+            return columns, (dict(zip(columns, row)) for rows in value.partitions(1000) for row in rows)
+        rows = iter(value or [])
+        first_row = next(rows, None)
+        if first_row is None:
+            return [], iter(())
+        return list(first_row.keys()), chain([first_row], rows)
+
+    @staticmethod
+    def write_xlsx(sheets, output=None):
+        # constant_memory flushes every row to the temp file as soon as the next row starts,
+        # so neither a DataFrame nor the whole workbook is held in memory
+        if output is None:
+            output = tempfile.SpooledTemporaryFile(max_size=MIS_EXPORT_SPOOL_BYTES)
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'remove_timezone': True, 'in_memory': False})
+        header_format = workbook.add_format({'bold': True, 'border': 1})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        datetime_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        for sheet_name in list(sheets):
+            columns, rows = MisReportExport.sheet_rows(sheets.pop(sheet_name))
+            worksheet = workbook.add_worksheet(sheet_name)
+            for col, column in enumerate(columns):
+                worksheet.write_string(0, col, str(column), header_format)
+            for row_no, row in enumerate(rows, start=1):
+                for col, column in enumerate(columns):
+                    value = row.get(column)
+                    if value is None:
+                        continue
+                    if isinstance(value, dt):
+                        worksheet.write_datetime(row_no, col, value, datetime_format)
+                    elif isinstance(value, datetime.date):
+                        worksheet.write_datetime(row_no, col, value, date_format)
+                    elif isinstance(value, (dict, list)):
+                        worksheet.write_string(row_no, col, json.dumps(jsonable_encoder(value)))
+                    else:
+                        worksheet.write(row_no, col, value)
+        workbook.close()
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def invoice_hub_export(request_data, db, output=None):
+        # builds the hub MIS workbook for the download endpoint and the export job,
+        # returns the error response when there is nothing to export
+        report_type_list = ['finance', 'registration', 'cancellation', 'disbursement', 'repayment', 'statusCheck', 'misHub',
+                            'directIBDIC', 'totalBusiness', 'summary', 'UsageMISforIDP', 'IdpWiseDailyTrend',
+                            'IdpWise', 'consentData', 'gspApiCalls']
         # idp_id = request_data.get('idpId', '')
         # merchant_details = db.query(MerchantDetails).filter(MerchantDetails.unique_id == idp_id).first()
         # merchant_key = merchant_details and merchant_details.merchant_key or None
+        # every query of the export runs on a server side cursor, the get_* helpers return the open results
+        # ('stream' mode) and write_xlsx reads them in batches instead of the rows being built into lists
+        db.connection(execution_options={'stream_results': True, 'yield_per': MIS_USER_REPORT_PAGE_SIZE})
         if request_data.get('filterType', '') == 'all':
             idp_ids = db.query(models.MerchantDetails.unique_id).all()
             idp_id = [unique_id for (unique_id,) in idp_ids]
@@ -6084,81 +4606,146 @@ def download_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: S
             return {
                 "requestId": request_data.get('requestId'),
                 **ErrorCodes.get_error_response(1132)
-            }
+            }, None, None
         report_type = request_data.get('reportType', '')
         sheets = {}
         if report_type == 'finance':
-            sheets = GetInvoiceHubMisReport.get_finance_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_finance_data(request_data, db, 'stream')
         elif report_type == 'registration':
-            sheets = GetInvoiceHubMisReport.get_registration_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_registration_data(request_data, db, 'stream')
         elif report_type == 'cancellation':
-            sheets = GetInvoiceHubMisReport.get_cancel_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_cancel_data(request_data, db, 'stream')
         elif report_type == 'disbursement':
-            sheets = GetInvoiceHubMisReport.get_disbursement_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_disbursement_data(request_data, db, 'stream')
         elif report_type == 'repayment':
-            sheets = GetInvoiceHubMisReport.get_repayment_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_repayment_data(request_data, db, 'stream')
         elif report_type == 'statusCheck':
-            sheets = GetInvoiceHubMisReport.get_status_check_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_status_check_data(request_data, db, 'stream')
         elif report_type == 'misHub':
-            sheets = GetInvoiceHubMisReport.get_hub_mis_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_hub_mis_data(request_data, db, 'stream')
         elif report_type == 'directIBDIC':
-            sheets = GetInvoiceHubMisReport.get_direct_ibdic_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_direct_ibdic_data(request_data, db, 'stream')
         elif report_type == 'totalBusiness':
-            sheets = GetInvoiceHubMisReport.get_total_business_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_total_business_data(request_data, db, 'stream')
         elif report_type == 'summary':
-            sheets = GetInvoiceHubMisReport.get_total_business_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_total_business_data(request_data, db, 'stream')
         elif report_type == 'UsageMISforIDP': #'IdpWiseBillingMis'
-            sheets = GetInvoiceHubMisReport.get_idp_wise_billing_mis_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_idp_wise_billing_mis_data(request_data, db, 'stream')
         elif report_type == 'IdpWiseDailyTrend':
-            sheets = GetInvoiceHubMisReport.get_idp_wise_daily_trend(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_idp_wise_daily_trend(request_data, db, 'stream')
         elif report_type == 'IdpWise':
-            sheets = GetInvoiceHubMisReport.get_idp_wise_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_idp_wise_data(request_data, db, 'stream')
         elif report_type == 'consentData':
-            sheets = GetInvoiceHubMisReport.get_consent_data(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_consent_data(request_data, db, 'stream')
         elif report_type == 'gspApiCalls':
-            sheets = GetInvoiceHubMisReport.get_gsp_api_calls(request_data, db)
+            sheets = GetInvoiceHubMisReport.get_gsp_api_calls(request_data, db, 'stream')
         else:
             return {
                 'code': 200,
                 'message': 'invalid reportType'
+            }, None, None
+        if not sheets:
+            return {
+                **ErrorCodes.get_error_response(500)
+            }, None, None
+
+        # rows go straight into a spooled temp file, each sheet's rows are released once written
+        output = MisReportExport.write_xlsx(sheets, output)
+
+        ## sample fileName :: # 29_May_2024_11:50_InvoiceData_invoice registred_10_May_2024to27_May_2024
+        curr_datetime = dt.now(asia_kolkata).strftime("%d_%b_%Y_%H:%M")
+        from_date = request_data.get("fromDate", '')
+        to_date = request_data.get("toDate", '')
+        if from_date != "" and to_date != "":
+            from_date = dt.strptime(request_data.get("fromDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
+            to_date = dt.strptime(request_data.get("toDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
+            file_name = curr_datetime + '_' + report_type + '_' + from_date + 'to' + to_date
+        else:
+            file_name = curr_datetime + '_' + report_type
+        return {
+            'requestId': request_data.get('requestId'),
+            **ErrorCodes.get_error_response(200)
+        }, output, file_name
+
+    @staticmethod
+    def user_mis_export(request_data, db, output=None):
+        report_type_list = ["entity_registration_data", "invoice_data", "api_wises_success_failure_summary"]
+        report_type = request_data.get('reportType', '')
+        report_sub_type = request_data.get('reportSubType', '')
+        if report_type not in report_type_list:
+            return {
+                "requestId": request_data.get('requestId'),
+                **ErrorCodes.get_error_response(1132)
+            }, None, None
+
+        data = []
+        if report_type == 'entity_registration_data':
+            report_sub_type_list = ["entity_registered", "gstin_wise_entity_registered",
+                                    "entity_id_with_identifiers", "entity_ids_having_multiple_gstin",
+                                    "entity_ids_without_gstin", "entity_ids_without_pan"]
+
+            if report_sub_type not in report_sub_type_list:
+                return {
+                    "requestId": request_data.get('requestId'),
+                    **ErrorCodes.get_error_response(1132)
+                }, None, None
+            data = GetUserMisReport.entity_registered_data(request_data, db, 'stream')
+        elif report_type == 'invoice_data':
+            report_sub_type_list = ["invoices_registered", "ledger_funded", "invoices_funded_with_invoice_details",
+                                    "invoices_cancelled", "invoices_disbursed", "ledger_with_partial_funding",
+                                    "invoices_with_partial_funding", "invoices_repaid",
+                                    "funding_requests_rejected_for_reason_already_funded"]
+
+            if report_sub_type not in report_sub_type_list:
+                return {
+                    "requestId": request_data.get('requestId'),
+                    **ErrorCodes.get_error_response(1132)
+                }, None, None
+            data = GetUserMisReport.invoice_data(request_data, db, 'stream')
+        else:
+            response_data = {
+                "requestId": request_data.get('requestId'),
+                **ErrorCodes.get_error_response(1132)
             }
-        # Create a BytesIO buffer to hold the Excel file
-        output = BytesIO()
-        if sheets:
-            for sheet in sheets:
-                value = sheets.get(sheet)
-                df = pd.DataFrame(value)
-                sheets[sheet] = df
-            # Use ExcelWriter to write multiple sheets to the buffer
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                for sheet_name, df in sheets.items():
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            # Set the buffer's position to the beginning
-            output.seek(0)
-
-            ## sample fileName :: # 29_May_2024_11:50_InvoiceData_invoice registred_10_May_2024to27_May_2024
-            curr_datetime = dt.now(asia_kolkata).strftime("%d_%b_%Y_%H:%M")
-            from_date = request_data.get("fromDate", '')
-            to_date = request_data.get("toDate", '')
-            if from_date != "" and to_date != "":
-                from_date = dt.strptime(request_data.get("fromDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
-                to_date = dt.strptime(request_data.get("toDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
-                file_name = curr_datetime + '_' + report_type + '_' + from_date + 'to' + to_date
-            else:
-                file_name = curr_datetime + '_' + report_type
-
-            headers = {'Content-Disposition': f'attachment; filename="{file_name}.xlsx"'}
-            # Return the Excel file as a response
-            return Response(
-                content=output.getvalue(),
-                media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                headers=headers
-            )
+            response_data.update({'data': data})
+            return response_data, None, None
 
+        # single sheet, named the way DataFrame.to_excel named it
+        output = MisReportExport.write_xlsx({'Sheet1': data}, output)
+        curr_datetime = dt.now(asia_kolkata).strftime("%d_%b_%Y_%H:%M")
+        from_date = dt.strptime(request_data.get("fromDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
+        to_date = dt.strptime(request_data.get("toDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
+        # 29_May_2024_11:50_InvoiceData_invoice registred_10_May_2024to27_May_2024
+        file_name = curr_datetime + '_' + report_sub_type + '_' + from_date + 'to' + to_date
         return {
-            **ErrorCodes.get_error_response(500)
-        }
+            'requestId': request_data.get('requestId'),
+            **ErrorCodes.get_error_response(200)
+        }, output, file_name
+
+    @staticmethod
+    def stream_file(output):
+        try:
+            while chunk := output.read(MIS_EXPORT_CHUNK_BYTES):
+                yield chunk
+        finally:
+            output.close()
+
+
+@router.post("/download-invoice-hub-mis-report/")
+def download_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: Session = Depends(get_db)):
+    request_data = jsonable_encoder(request)
+    try:
+        response_data, output, file_name = MisReportExport.invoice_hub_export(request_data, db)
+        if output is None:
+            return response_data
+
+        headers = {'Content-Disposition': f'attachment; filename="{file_name}.xlsx"'}
+        # Stream the Excel file back in chunks
+        return StreamingResponse(
+            MisReportExport.stream_file(output),
+            media_type=MisReportExport.XLSX_MEDIA_TYPE,
+            headers=headers
+        )
         # query = download_mis_report_query(request_data)
         # from_date, to_date = request_data.get("fromDate"), request_data.get("toDate")
         # if from_date != "" and to_date != "":
@@ -6220,50 +4807,130 @@ def download_invoice_hub_mis_report(request: GetInvoiceHubMisReportSchema, db: S
 
 class GetUserMisReport:
 
+    REPORT_SUB_TYPES = {
+        'entity_registration_data': ["entity_registered", "gstin_wise_entity_registered",
+                                     "entity_id_with_identifiers", "entity_ids_having_multiple_gstin",
+                                     "entity_ids_without_gstin", "entity_ids_without_pan"],
+        'invoice_data': ["invoices_registered", "ledger_funded", "invoices_funded_with_invoice_details",
+                         "invoices_cancelled", "invoices_disbursed", "ledger_with_partial_funding",
+                         "invoices_with_partial_funding", "invoices_repaid",
+                         "funding_requests_rejected_for_reason_already_funded"]
+    }
+    # every report query selects cursor_created_at / cursor_id, the (created_at, id) keyset its pages are cut on
+    CURSOR_COLUMNS = ('cursor_created_at', 'cursor_id')
+    # one row per entity out of a single pass over entity_identifier_line, the reports hash join it
+    # instead of probing entity_identifier_line once per row and flag
+    ENTITY_IDENTIFIER_SUMMARY = """
+        with entity_identifier_summary as (
+            select
+                eil.entity_id,
+                bool_or(eil.entity_id_type = 'gstin') as has_gstin,
+                bool_or(eil.entity_id_type = 'pan') as has_pan,
+                bool_or(eil.is_active = true) as is_active,
+                (array_agg(eil.entity_id_name order by eil.id desc)
+                    filter (where eil.entity_id_name is not null and eil.entity_id_name != ''))[1] as display_name
+            from
+                entity_identifier_line eil
+            group by
+                eil.entity_id
+        )
+    """
+
+    @staticmethod
+    def encode_cursor(row):
+        # created_at is timestamptz, the cursor carries the instant in UTC with its offset so the next page
+        # compares it as timestamptz whatever the session time zone
+        created_at = row['cursor_created_at'].astimezone(datetime.timezone.utc).isoformat()
+        cursor = json.dumps([created_at, row['cursor_id']])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return dt.fromisoformat(created_at), [int(value) for value in row_id]
+
+    @staticmethod
+    def report_row(columns, row):
+        return {column: value for column, value in zip(columns, row) if column not in GetUserMisReport.CURSOR_COLUMNS}
+
+    @staticmethod
+    def run_report(db, query, request_data, mode='all'):
+        # mode 'all' returns every row, 'page' one keyset page with the cursor of the next one,
+        # 'stream' a generator reading the server side cursor in batches
+        idp_id = request_data.get('idpId', '')
+        from_date = request_data.get("fromDate")
+        to_date = request_data.get("toDate")
+        params = {}
+        if from_date != "" and to_date != "":
+            from_date = dt.strptime(from_date, "%d/%m/%Y").strftime("%Y-%m-%d")
+            to_date = dt.strptime(to_date, "%d/%m/%Y").strftime("%Y-%m-%d")
+            params = {'idpId': idp_id, 'fromDate': from_date, 'toDate': to_date}
+
+        if mode == 'page':
+            query = query.strip().rstrip(';')
+            # the report's own order by is replaced by the keyset order
+            query = query[:query.lower().rindex('order by')]
+            keyset = ''
+            if request_data.get('cursor'):
+                cursor_created_at, cursor_id = GetUserMisReport.decode_cursor(request_data['cursor'])
+                keyset = "where (page.cursor_created_at, page.cursor_id) < ((:cursorCreatedAt)::timestamptz, (:cursorId)::bigint[])"
+                params.update({'cursorCreatedAt': cursor_created_at, 'cursorId': cursor_id})
+            page_size = min(int(request_data.get('pageSize') or MIS_USER_REPORT_PAGE_SIZE), MIS_USER_REPORT_MAX_PAGE_SIZE)
+            page_query = f"""
+                select page.* from ({query}) page
+                {keyset}
+                order by page.cursor_created_at desc, page.cursor_id desc
+                limit :pageSize
+            """
+            result = db.execute(text(page_query), [{**params, 'pageSize': page_size}])
+            columns = list(result.keys())
+            rows = [dict(zip(columns, row)) for row in result.fetchall()]
+            next_cursor = GetUserMisReport.encode_cursor(rows[-1]) if len(rows) == page_size else None
+            return {
+                'data': [GetUserMisReport.report_row(columns, row.values()) for row in rows],
+                'nextCursor': next_cursor
+            }
+
+        if mode == 'stream':
+            statement = text(query).execution_options(stream_results=True, yield_per=MIS_USER_REPORT_PAGE_SIZE)
+            result = db.execute(statement, [params]) if params else db.execute(statement)
+            columns = list(result.keys())
+            return (GetUserMisReport.report_row(columns, row) for rows in result.partitions() for row in rows)
+
+        result = db.execute(text(query), [params]) if params else db.execute(text(query))
+        logger.info(f"result {result}")
+        columns = list(result.keys())
+        return [GetUserMisReport.report_row(columns, row) for row in result.fetchall()]
+
     @staticmethod
-    def entity_registered_data(request_data, db):
-        entity_registered_query = """
+    def entity_registered_data(request_data, db, mode='all'):
+        entity_registered_query = GetUserMisReport.ENTITY_IDENTIFIER_SUMMARY + """
         select 
+            ec.created_at as cursor_created_at, array[ec.id]::bigint[] as cursor_id,
             e.id as entityId, 
             ec.entity_code as "Entity Code", 
-            ( SELECT eil.entity_id_name FROM entity_identifier_line eil WHERE eil.entity_id=e.id and eil.entity_id_name is not null and eil.entity_id_name != '' order by id desc limit 1) AS "Entity Name", 
+            eis.display_name AS "Entity Name", 
             to_date(to_char(ec.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Created on",
             md.name as "Created by",
-            md.unique_id as "idpid" 
+            md.unique_id as "idpid",
             'NA'::text as "Authorised by",
-            ( SELECT
-                CASE
-                WHEN EXISTS (SELECT 1 FROM entity_identifier_line WHERE entity_id_type = 'gstin' and entity_id=e.id)
-                THEN 'Y'
-                ELSE 'N'
-                END AS result
-            ) as GSTIN,
-            ( SELECT
-                CASE
-                WHEN EXISTS (SELECT 1 FROM entity_identifier_line WHERE entity_id_type = 'pan' and entity_id=e.id)
-                THEN 'Y'
-                ELSE 'N'
-                END AS result
-            ) as PAN,
-            ( SELECT
-                CASE
-                WHEN EXISTS (SELECT 1 FROM entity_identifier_line WHERE is_active = true and entity_id=e.id)
-                THEN 'Y'
-                ELSE 'N'
-                END AS result 
-            ) as "Active Status"
+            case when coalesce(eis.has_gstin, false) then 'Y' else 'N' end as GSTIN,
+            case when coalesce(eis.has_pan, false) then 'Y' else 'N' end as PAN,
+            case when coalesce(eis.is_active, false) then 'Y' else 'N' end as "Active Status"
         from 
             entity_combination ec
         left join entity e on e.id = ec.entity_id 
+        left join entity_identifier_summary eis on eis.entity_id = e.id
         inner join merchant_details md on md.id = ec.merchant_id 
         where 
             md.unique_id = :idpId and
-            ec.created_at::date between (:fromDate)::date and (:toDate)::date
+            ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date
         order by "Created on" desc
         """
 
         gstin_wise_entity_registered_query = """
         select 
+            ec.created_at as cursor_created_at, array[ec.id, eil.id]::bigint[] as cursor_id,
             eil.entity_id_no as GSTIN,
             eil.entity_id_name AS "Entity Name",
             ec.entity_code as "Entity Code",
@@ -6279,7 +4946,7 @@ class GetUserMisReport:
         where 
             md.unique_id = idpId and
             eil.entity_id_type ='gstin' and 
-            ec.created_at::date between (:fromDate)::date and (:toDate)::date
+            ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date
         order by "Created on" desc
         ;
         """
@@ -6290,6 +4957,7 @@ class GetUserMisReport:
         from 
         (
             select 
+                ec.created_at as cursor_created_at, array[1, ec.id, eil.id]::bigint[] as cursor_id,
                 to_date(to_char(ec.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Date of entry",	
                 coalesce(ec.entity_code, '') as "Entity Code",
                 e.id as "Entity Id", 
@@ -6305,9 +4973,10 @@ class GetUserMisReport:
             inner join entity_identifier_line eil on eil.entity_id = e.id
             where 
                 md.unique_id = idpId and
-                ec.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date
             union all
             select 
+                e.created_at as cursor_created_at, array[2, e.id, eil.id]::bigint[] as cursor_id,
                 to_date(to_char(e.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Date of entry",
                 '-' as "Entity Code",
                 e.id as "Entity Id", 
@@ -6324,7 +4993,7 @@ class GetUserMisReport:
             where 
                 md.unique_id = :idpId and
                 ec.entity_id is null and
-                e.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(e.created_at) between (:fromDate)::date and (:toDate)::date
         ) as data 
         order by 
             data."Date of entry" desc
@@ -6333,6 +5002,7 @@ class GetUserMisReport:
 
         entity_ids_having_multiple_gstin_query = """
         select 
+            ec.created_at as cursor_created_at, array[ec.id, eil.id]::bigint[] as cursor_id,
             to_date(to_char(ec.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Date of entry",	
             ec.entity_code as "Entity Code",
             e.id as "Entity Id", 
@@ -6348,13 +5018,14 @@ class GetUserMisReport:
         where 
             md.unique_id =:idpI d and
             eil.entity_id_type ='gstin' and
-            ec.created_at::date between (:fromDate)::date and (:toDate)::date
+            ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date
         order by "Date of entry" desc
         ;
         """
 
         entity_ids_without_gstin_query = """
         select 
+            ec.created_at as cursor_created_at, array[ec.id, eil.id]::bigint[] as cursor_id,
             to_date(to_char(ec.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Date of entry",    
             ec.entity_code as "Entity Code",
             e.id as "Entity Id", 
@@ -6370,7 +5041,7 @@ class GetUserMisReport:
         inner join entity_identifier_line eil on eil.entity_id = ec.entity_id
         where 
             md.unique_id = :idpId and
-            ec.created_at::date between (:fromDate)::date and (:toDate)::date and
+            ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date and
             not exists (
                 select 1
                 from entity_identifier_line sub_eil
@@ -6382,6 +5053,7 @@ class GetUserMisReport:
 
         entity_ids_without_pan_query = """
         select 
+            ec.created_at as cursor_created_at, array[ec.id, eil.id]::bigint[] as cursor_id,
             to_date(to_char(ec.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as "Date of entry",    
             ec.entity_code as "Entity Code",
             e.id as "Entity Id", 
@@ -6397,7 +5069,7 @@ class GetUserMisReport:
         inner join entity_identifier_line eil on eil.entity_id = ec.entity_id
         where 
             md.unique_id = :idpId and
-            ec.created_at::date between (:fromDate)::date and (:toDate)::date and
+            ist_day(ec.created_at) between (:fromDate)::date and (:toDate)::date and
             not exists (
                 select 1
                 from entity_identifier_line sub_eil
@@ -6418,24 +5090,10 @@ class GetUserMisReport:
 
         report_sub_type = request_data.get('reportSubType', '')
         query = query_mapper.get(report_sub_type)
-        idp_id = request_data.get('idpId', '')
-        from_date = request_data.get("fromDate")
-        to_date = request_data.get("toDate")
-        if from_date != "" and to_date != "":
-            from_date = dt.strptime(from_date, "%d/%m/%Y").strftime("%Y-%m-%d")
-            to_date = dt.strptime(to_date, "%d/%m/%Y").strftime("%Y-%m-%d")
-            result = db.execute(text(query), [{'idpId': idp_id, 'fromDate': from_date, 'toDate': to_date}])
-        else:
-            result = db.execute(text(query))
-        logger.info(f"result {result}")
-
-        columns = result.keys()
-        data = [dict(zip(columns, row)) for row in result.fetchall()]
-
-        return data
+        return GetUserMisReport.run_report(db, query, request_data, mode)
 
     @staticmethod
-    def invoice_data(request_data, db):
+    def invoice_data(request_data, db, mode='all'):
         idp_id = request_data.get('idpId', '')
         from_date = request_data.get("fromDate")
         to_date = request_data.get("toDate")
@@ -6444,8 +5102,9 @@ class GetUserMisReport:
             to_date = dt.strptime(to_date, "%d/%m/%Y").strftime("%Y-%m-%d")
 
  
-        invoices_registered_query = """
+        invoices_registered_query = GetUserMisReport.ENTITY_IDENTIFIER_SUMMARY + """
             select 
+                i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
                 i.invoice_no as invoiceNo,
                 to_char(i.invoice_date::date,'DD/MM/YYYY') as invoiceDate,
                 i.invoice_amt as invoiceAmount,
@@ -6461,9 +5120,9 @@ class GetUserMisReport:
                      else '-'
                 end as "P/F",
                 coalesce( i.extra_data->>'buyer_gst', '') as buyerGST,
-                coalesce( (select eil2.entity_id_name from entity e2 inner join entity_identifier_line eil2 on eil2.entity_id = e2.id where (e2.id)::text = (i.extra_data->>'buyer_entity_id') and eil2.entity_id_name is not null and eil2.entity_id_name != '' limit 1), '') as buyerName,
+                coalesce(buyer_eis.display_name, '') as buyerName,
                 coalesce( i.extra_data->>'seller_gst', '') as sellerGST,
-                coalesce( (select eil3.entity_id_name from entity e3 inner join entity_identifier_line eil3 on eil3.entity_id = e3.id where (e3.id)::text = (i.extra_data->>'seller_entity_id') and eil3.entity_id_name is not null and eil3.entity_id_name != '' limit 1), '') as sellerName,
+                coalesce(seller_eis.display_name, '') as sellerName,
                 to_char(i.created_at, 'DD/MM/YYYY') as createdOn,  
                 md.name as createdBy,
                 md.name as authorisedBy
@@ -6472,15 +5131,18 @@ class GetUserMisReport:
             inner join invoice_ledger_association ila on i.id = ila.invoice_id 
             inner join ledger l on l.id = ila.ledger_id
             inner join merchant_details md on md.id = l.merchant_id
+            left join entity_identifier_summary buyer_eis on (buyer_eis.entity_id)::text = (i.extra_data->>'buyer_entity_id')
+            left join entity_identifier_summary seller_eis on (seller_eis.entity_id)::text = (i.extra_data->>'seller_entity_id')
             where
                 md.unique_id = :idpId and
-                i.created_at::date between (:fromDate)::date and (:toDate)::date 
+                ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date 
             order by createdOn desc
         ;
         """
 
         ledger_funded_query = """
             select 
+                l.created_at as cursor_created_at, array[l.id]::bigint[] as cursor_id,
                 l.ledger_id as ledgerId,
                 ( select coalesce( sum(i.invoice_amt), 0)::text
                   from 
@@ -6513,13 +5175,14 @@ class GetUserMisReport:
             where 
                 md.unique_id = :idpId and
                 l.status in ('funded', 'partial_funded') and 
-                l.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(l.created_at) between (:fromDate)::date and (:toDate)::date
             order by dateCreated desc
             ;
             """
 
         invoices_funded_with_invoice_details_query = """
             select 
+                i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
                 l.ledger_id as ledgerId,
                 ( select coalesce( sum(i.invoice_amt), 0)::text
                   from 
@@ -6548,13 +5211,14 @@ class GetUserMisReport:
             where
                 md.unique_id = :idpId and 
                 i.status in ('funded', 'partial_funded') and
-                i.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
             order by i.created_at::date desc
             ;
             """
 
         invoices_cancelled_query = """
             select 
+                i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
                 l.ledger_id as ledgerId,
                 ( select coalesce( sum(i.invoice_amt), 0)::text 
                   from 
@@ -6585,7 +5249,7 @@ class GetUserMisReport:
                 md.unique_id = :idpId
                 and l.status in ('non_funded', 'cancel') 
                 and i.fund_status = false 
-                and i.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
                 and l.extra_data->>'cancellationMessage' is not null
             order by i.created_at::date desc
             ;
@@ -6593,6 +5257,7 @@ class GetUserMisReport:
 
         invoices_disbursed_query = """ 
             select 
+                i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
                 l.ledger_id as ledgerId,
                 ( select coalesce( sum(i.invoice_amt), 0)::text 
                   from 
@@ -6621,13 +5286,14 @@ class GetUserMisReport:
             where 
                 md.unique_id = idpId and
                 i.status in ('partial_disbursed', 'full_disbursed') and 
-                i.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
             order by i.created_at desc
             ;
             """
 
         ledger_with_partial_funding_query = """ 
             select 
+                 max(l.created_at) as cursor_created_at, array[max(l.id)]::bigint[] as cursor_id,
                  l.ledger_id as ledgerId,
                  ( select coalesce( sum(i.invoice_amt), 0)::text
                   from
@@ -6717,6 +5383,7 @@ class GetUserMisReport:
 
         invoices_with_partial_funding_query = """ 
         select 
+            i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
             l.ledger_id as ledgerId,
             ( select coalesce( sum(i.invoice_amt), 0)::text 
                   from 
@@ -6743,13 +5410,14 @@ class GetUserMisReport:
         where 
             md.unique_id = idpId and
             i.status in ('partial_funded', 'partial_disbursed', 'partial_paid') and 
-            i.created_at::date between (:fromDate)::date and (:toDate)::date
+            ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
         order by i.created_at::date desc
         ;
         """
 
         invoices_repaid_query = """ 
             select 
+                i.created_at as cursor_created_at, array[i.id, l.id]::bigint[] as cursor_id,
                 l.ledger_id as ledgerId,
                 ( select coalesce( sum(i.invoice_amt), 0)::text 
                   from 
@@ -6781,25 +5449,26 @@ class GetUserMisReport:
             where 
                 md.unique_id = idpId and
                 i.status in ('repaid', 'partial_repaid') and 
-                i.created_at::date between (:fromDate)::date and (:toDate)::date
+                ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
             order by i.created_at::date desc
             ;
             """
 
-        funding_requests_rejected_for_reason_already_funded_query = """ 
+        funding_requests_rejected_for_reason_already_funded_query = GetUserMisReport.ENTITY_IDENTIFIER_SUMMARY + """ 
             select 
                 data.*
             from
             (
             select 
+                i.created_at as cursor_created_at, array[1, arl.id, i.id, l.id]::bigint[] as cursor_id,
                 arl.request_id as reqId,
                 to_date(to_char(i.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as requestDate,
                 i.invoice_no as invoiceNo,
                 cast(i.invoice_amt AS VARCHAR) as invoiceAmount,
                 coalesce(i.extra_data->>'buyer_gst', '') as buyerGST,
-                coalesce( (select eil2.entity_id_name from entity e2 inner join entity_identifier_line eil2 on eil2.entity_id = e2.id where (e2.id)::text = (i.extra_data->>'buyer_entity_id') and eil2.entity_id_name is not null and eil2.entity_id_name != '' limit 1), '') as buyerName,  
+                coalesce(buyer_eis.display_name, '') as buyerName,  
                 coalesce(i.extra_data->>'seller_gst', '') as sellerGST,
-                coalesce( (select eil3.entity_id_name from entity e3 inner join entity_identifier_line eil3 on eil3.entity_id = e3.id where (e3.id)::text = (i.extra_data->>'seller_entity_id') and eil3.entity_id_name is not null and eil3.entity_id_name != '' limit 1), '') as sellerName,
+                coalesce(seller_eis.display_name, '') as sellerName,
                 to_date(to_char( i.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as registeredByUsOn
             from
                 api_request_log arl
@@ -6808,23 +5477,26 @@ class GetUserMisReport:
             inner join invoice_ledger_association ila on i.id = ila.invoice_id 
             inner join ledger l on l.id = ila.ledger_id
             inner join merchant_details md on md.id = l.merchant_id
+            left join entity_identifier_summary buyer_eis on (buyer_eis.entity_id)::text = (i.extra_data->>'buyer_entity_id')
+            left join entity_identifier_summary seller_eis on (seller_eis.entity_id)::text = (i.extra_data->>'seller_entity_id')
             where 
                 arl.api_url in ( 'syncFinancing', 'asyncFinancing') 
                 and md.unique_id = :idpId 
-                and i.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
                 and arl.response_data->>'code'::text in ('1004')
                 
             union all
             
             select 
+                i.created_at as cursor_created_at, array[2, ppr.id, i.id, l.id]::bigint[] as cursor_id,
                 ppr.request_extra_data->>'request_id' as reqId,
                 to_date(to_char(i.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as requestDate,
                 i.invoice_no as invoiceNo,
                 cast(i.invoice_amt AS VARCHAR) as invoiceAmount,
                 coalesce(i.extra_data->>'buyer_gst', '') as buyerGST,
-                coalesce( (select eil2.entity_id_name from entity e2 inner join entity_identifier_line eil2 on eil2.entity_id = e2.id where (e2.id)::text = (i.extra_data->>'buyer_entity_id') and eil2.entity_id_name is not null and eil2.entity_id_name != '' limit 1), '') as buyerName,  
+                coalesce(buyer_eis.display_name, '') as buyerName,  
                 coalesce(i.extra_data->>'seller_gst', '') as sellerGST,
-                coalesce( (select eil3.entity_id_name from entity e3 inner join entity_identifier_line eil3 on eil3.entity_id = e3.id where (e3.id)::text = (i.extra_data->>'seller_entity_id') and eil3.entity_id_name is not null and eil3.entity_id_name != '' limit 1), '') as sellerName,
+                coalesce(seller_eis.display_name, '') as sellerName,
                 to_date(to_char( i.created_at, 'DD/MM/YYYY'), 'DD/MM/YYYY') as registeredByUsOn
             from
                 post_processing_request ppr
@@ -6833,10 +5505,12 @@ class GetUserMisReport:
             inner join invoice_ledger_association ila on i.id = ila.invoice_id 
             inner join ledger l on l.id = ila.ledger_id
             inner join merchant_details md on md.id = l.merchant_id
+            left join entity_identifier_summary buyer_eis on (buyer_eis.entity_id)::text = (i.extra_data->>'buyer_entity_id')
+            left join entity_identifier_summary seller_eis on (seller_eis.entity_id)::text = (i.extra_data->>'seller_entity_id')
             where 
                 ppr.type in ('asyncFinancing') 
                 and md.unique_id = :idpId
-                and i.created_at::date between (:fromDate)::date and (:toDate)::date
+                and ist_day(i.created_at) between (:fromDate)::date and (:toDate)::date
                 and ppr.webhook_response->>'code'::text in ('1004')
             ) as data
             order by 
@@ -6858,21 +5532,7 @@ class GetUserMisReport:
 
         report_sub_type = request_data.get('reportSubType', '')
         query = query_mapper.get(report_sub_type)
-        idp_id = request_data.get('idpId', '')
-        from_date = request_data.get("fromDate")
-        to_date = request_data.get("toDate")
-        if from_date != "" and to_date != "":
-            from_date = dt.strptime(from_date, "%d/%m/%Y").strftime("%Y-%m-%d")
-            to_date = dt.strptime(to_date, "%d/%m/%Y").strftime("%Y-%m-%d")
-            result = db.execute(text(query), [{'idpId': idp_id, 'fromDate': from_date, 'toDate': to_date}])
-        else:
-            result = db.execute(text(query))
-        logger.info(f"result {result}")
-
-        columns = result.keys()
-        data = [dict(zip(columns, row)) for row in result.fetchall()]
-
-        return data
+        return GetUserMisReport.run_report(db, query, request_data, mode)
 
 
 @router.post("/get-user-mis-report/")
@@ -6886,7 +5546,9 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
             **ErrorCodes.get_error_response(200)
         }
         idp_id = request_data.get('idpId', '')
-        
+        merchant_details = db.query(MerchantDetails).filter(MerchantDetails.unique_id == idp_id).first()
+        merchant_key = merchant_details and merchant_details.merchant_key or None
+
         api_request_log_res = views.create_request_log(db, request_data.get('requestId'), request_data, '', 'request', 'get-mis-report', merchant_key)
         if api_request_log_res.get("code") != 200:
              return {
@@ -6902,6 +5564,7 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
             }
 
         data = []
+        mode = 'page' if request_data.get('pageSize') or request_data.get('cursor') else 'all'
         if report_type == 'entity_registration_data':
             report_sub_type_list = ["entity_registered", "gstin_wise_entity_registered",
                                     "entity_id_with_identifiers", "entity_ids_having_multiple_gstin",
@@ -6912,7 +5575,7 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
                     "requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(1132)
                 }
-            data = GetUserMisReport.entity_registered_data(request_data, db)
+            data = GetUserMisReport.entity_registered_data(request_data, db, mode)
             # if report_sub_type_list == 'gstin_wise_entity_registered':
             #     pass
             # if report_sub_type_list == 'entity_id_with_identifiers':
@@ -6934,13 +5597,17 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
                     "requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(1132)
                 }
-            data = GetUserMisReport.invoice_data(request_data, db)
+            data = GetUserMisReport.invoice_data(request_data, db, mode)
         else:
             return {
                 'code': 200,
                 'message': 'invalid reportType'
             }
 
+        if mode == 'page':
+            # data holds the page rows and the opaque cursor of the next page, None on the last one
+            response_data.update(data)
+            return response_data
         response_data.update({'data': data})
         return response_data
     except Exception as e:
@@ -6950,11 +5617,46 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
         }
 
 
+@router.post("/stream-user-mis-report/")
+def stream_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(get_db)):
+    # newline delimited json, rows are written as they come off the server side cursor
+    request_data = jsonable_encoder(request)
+    try:
+        idp_id = request_data.get('idpId', '')
+        merchant_details = db.query(MerchantDetails).filter(MerchantDetails.unique_id == idp_id).first()
+        merchant_key = merchant_details and merchant_details.merchant_key or None
+
+        api_request_log_res = views.create_request_log(db, request_data.get('requestId'), request_data, '', 'request', 'get-mis-report', merchant_key)
+        if api_request_log_res.get("code") != 200:
+            return {
+                "requestId": request_data.get('requestId'),
+                **api_request_log_res
+            }
+
+        report_type = request_data.get('reportType', '')
+        if request_data.get('reportSubType', '') not in GetUserMisReport.REPORT_SUB_TYPES.get(report_type, []):
+            return {
+                "requestId": request_data.get('requestId'),
+                **ErrorCodes.get_error_response(1132)
+            }
+        if report_type == 'entity_registration_data':
+            rows = GetUserMisReport.entity_registered_data(request_data, db, 'stream')
+        else:
+            rows = GetUserMisReport.invoice_data(request_data, db, 'stream')
+        return StreamingResponse(
+            (json.dumps(jsonable_encoder(row)) + '\n' for row in rows),
+            media_type='application/x-ndjson'
+        )
+    except Exception as e:
+        logger.exception(f"Exception stream_user_mis_report :: {e}")
+        return {
+            **ErrorCodes.get_error_response(500)
+        }
+
+
 @router.post("/download-user-mis-report/")
 def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(get_db)):
     request_data = jsonable_encoder(request)
-    report_type_list = ["entity_registration_data", "invoice_data", "api_wises_success_failure_summary"]
-
     try:
         response_data = {
             'requestId': request_data.get('requestId'),
@@ -6971,61 +5673,14 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
                  **api_request_log_res
              }
 
-        report_type = request_data.get('reportType', '')
-        report_sub_type = request_data.get('reportSubType', '')
-        if report_type not in report_type_list:
-            return {
-                "requestId": request_data.get('requestId'),
-                **ErrorCodes.get_error_response(1132)
-            }
-
-        data = []
-        if report_type == 'entity_registration_data':
-            report_sub_type_list = ["entity_registered", "gstin_wise_entity_registered",
-                                    "entity_id_with_identifiers", "entity_ids_having_multiple_gstin",
-                                    "entity_ids_without_gstin", "entity_ids_without_pan"]
-
-            if report_sub_type not in report_sub_type_list:
-                return {
-                    "requestId": request_data.get('requestId'),
-                    **ErrorCodes.get_error_response(1132)
-                }
-            data = GetUserMisReport.entity_registered_data(request_data, db)
-        elif report_type == 'invoice_data':
-            report_sub_type_list = ["invoices_registered", "ledger_funded", "invoices_funded_with_invoice_details",
-                                    "invoices_cancelled", "invoices_disbursed", "ledger_with_partial_funding",
-                                    "invoices_with_partial_funding", "invoices_repaid",
-                                    "funding_requests_rejected_for_reason_already_funded"]
-
-            if report_sub_type not in report_sub_type_list:
-                return {
-                    "requestId": request_data.get('requestId'),
-                    **ErrorCodes.get_error_response(1132)
-                }
-            data = GetUserMisReport.invoice_data(request_data, db)
-        else:
-            response_data = {
-                "requestId": request_data.get('requestId'),
-                **ErrorCodes.get_error_response(1132)
-            }
-            response_data.update({'data': data})
+        response_data, output, file_name = MisReportExport.user_mis_export(request_data, db)
+        if output is None:
             return response_data
-
-        # ### Write DataFrame to an Excel file
-        df = pd.DataFrame(data)
-        output = BytesIO()
-        df.to_excel(output, index=False)
-        output.seek(0)
-        curr_datetime = dt.now(asia_kolkata).strftime("%d_%b_%Y_%H:%M")
-        from_date = dt.strptime(request_data.get("fromDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
-        to_date = dt.strptime(request_data.get("toDate"), "%d/%m/%Y").strftime("%d_%b_%Y")
-        # 29_May_2024_11:50_InvoiceData_invoice registred_10_May_2024to27_May_2024
-        file_name = curr_datetime + '_' + report_sub_type + '_' + from_date + 'to' + to_date
         # Return the Excel file as a response
         headers = {'Content-Disposition': f'attachment; filename="{file_name}.xlsx"'}
-        return Response(
-            content=output.getvalue(),
-            media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        return StreamingResponse(
+            MisReportExport.stream_file(output),
+            media_type=MisReportExport.XLSX_MEDIA_TYPE,
             headers=headers)
 
     except Exception as e:
@@ -7034,3 +5689,303 @@ def get_user_mis_report(request: GetUserMisReportSchema, db: Session = Depends(g
             **ErrorCodes.get_error_response(500)
         }
 
+
+class MisReportExportJob:
+    EXPORT_TYPES = ('invoiceHubMis', 'userMis')
+
+    # status, fields and ttl of a new export are set in one step, the export key never exists without its expiry
+    CREATE_EXPORT = r.register_script("""
+        if redis.call('hsetnx', KEYS[1], 'status', 'queued') == 0 then
+            return 0
+        end
+        redis.call('hset', KEYS[1], unpack(ARGV, 2))
+        redis.call('expire', KEYS[1], ARGV[1])
+        return 1
+    """)
+    # every enqueue gets its own runId, a task of a superseded run neither starts nor writes status
+    START_RUN = r.register_script("""
+        if redis.call('hget', KEYS[1], 'runId') ~= ARGV[1] or redis.call('hget', KEYS[1], 'status') ~= 'queued' then
+            return 0
+        end
+        redis.call('hset', KEYS[1], 'status', 'running', 'startedAt', ARGV[2], 'heartbeatAt', ARGV[3])
+        return 1
+    """)
+    UPDATE_RUN = r.register_script("""
+        if redis.call('hget', KEYS[1], 'runId') ~= ARGV[1] then
+            return 0
+        end
+        redis.call('hset', KEYS[1], unpack(ARGV, 2))
+        return 1
+    """)
+
+    @staticmethod
+    def job_key(job_id):
+        return f"mis_export_job:{job_id}"
+
+    @staticmethod
+    def export_key(export_id):
+        return f"mis_export:{export_id}"
+
+    @staticmethod
+    def token_hash(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def create(export_type, request_data):
+        # identical parameters share one export (the work and the artifact), hub exports also carry the view
+        # generation so a refresh starts a fresh export instead of serving the previous workbook
+        params = {key: value for key, value in request_data.items() if key != 'requestId'}
+        generation = (r.get(MisReportCache.GENERATION_KEY) or '0') if export_type == 'invoiceHubMis' else ''
+        export_id = hashlib.sha256(json.dumps([export_type, params, generation], sort_keys=True).encode()).hexdigest()[:32]
+        key = MisReportExportJob.export_key(export_id)
+        created = False
+        for _ in range(2):
+            run_id = secrets.token_hex(8)
+            created = bool(MisReportExportJob.CREATE_EXPORT(keys=[key], args=[
+                MIS_EXPORT_JOB_TTL,
+                'exportId', export_id,
+                'runId', run_id,
+                'exportType', export_type,
+                'requestId', request_data.get('requestId') or '',
+                'params', json.dumps(params),
+                'path', os.path.join(MIS_EXPORT_DIR, f"{export_id}.xlsx"),
+                'createdAt', dt.now(asia_kolkata).isoformat(),
+                'heartbeatAt', time.time()
+            ]))
+            if created:
+                config.async_report_export.delay(export_id, run_id)
+                break
+            if MisReportExportJob.is_stale(r.hgetall(key)):
+                r.delete(key)
+                continue
+            break
+        # every requester gets its own random job id, status / download also need the token handed out here
+        # and only its hash is kept, so sending the same parameters doesn't give access to someone else's job
+        job_id, token = secrets.token_urlsafe(16), secrets.token_urlsafe(32)
+        job_key = MisReportExportJob.job_key(job_id)
+        r.pipeline().hset(job_key, mapping={
+            'jobId': job_id,
+            'exportId': export_id,
+            'requestId': request_data.get('requestId') or '',
+            'tokenHash': MisReportExportJob.token_hash(token),
+            'createdAt': dt.now(asia_kolkata).isoformat()
+        }).expire(job_key, MIS_EXPORT_JOB_TTL).execute()
+        return {**MisReportExportJob.get(job_id, token), 'jobId': job_id, 'token': token}, not created
+
+    @staticmethod
+    def is_stale(export):
+        status = export.get('status')
+        if status == 'failed' or (status == 'done' and not os.path.exists(export.get('path', ''))):
+            return True
+        if status in ('queued', 'running'):
+            return time.time() - float(export.get('heartbeatAt') or 0) > MIS_EXPORT_STALE_SECONDS
+        return False
+
+    @staticmethod
+    def get(job_id, token):
+        # a wrong token looks exactly like a missing job
+        job = r.hgetall(MisReportExportJob.job_key(job_id))
+        if not job or not token or not hmac.compare_digest(job.get('tokenHash', ''), MisReportExportJob.token_hash(token)):
+            return {}
+        export = r.hgetall(MisReportExportJob.export_key(job['exportId']))
+        if not export:
+            return {}
+        return {**export, 'jobId': job_id, 'requestId': job.get('requestId')}
+
+    @staticmethod
+    def run(export_id, run_id):
+        key = MisReportExportJob.export_key(export_id)
+        job = r.hgetall(key)
+        if not job:
+            logger.info(f"MisReportExportJob :: {export_id} expired before it ran")
+            return
+        if not MisReportExportJob.START_RUN(keys=[key], args=[run_id, dt.now(asia_kolkata).isoformat(), time.time()]):
+            logger.info(f"MisReportExportJob :: {export_id} run {run_id} superseded or already started")
+            return
+        MisReportExportJob.remove_expired_artifacts()
+        os.makedirs(MIS_EXPORT_DIR, exist_ok=True)
+        path = job['path']
+        # per run, a lost run that comes back never writes into the file of the run that replaced it
+        part_path = f"{path}.{run_id}.part"
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not stop_heartbeat.wait(MIS_EXPORT_HEARTBEAT_SECONDS):
+                MisReportExportJob.UPDATE_RUN(keys=[key], args=[run_id, 'heartbeatAt', time.time()])
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        db = next(get_db())
+        try:
+            request_data = {**json.loads(job['params']), 'requestId': job.get('requestId')}
+            if job['exportType'] == 'invoiceHubMis':
+                export = MisReportExport.invoice_hub_export
+            else:
+                export = MisReportExport.user_mis_export
+            with open(part_path, 'wb') as artifact:
+                response_data, output, file_name = export(request_data, db, artifact)
+            if output is None:
+                MisReportExportJob.UPDATE_RUN(keys=[key], args=[
+                    run_id, 'status', 'failed', 'error', json.dumps(response_data)
+                ])
+                return
+            if r.hget(key, 'runId') != run_id:
+                logger.info(f"MisReportExportJob :: {export_id} run {run_id} superseded, artifact dropped")
+                return
+            # the artifact only appears under its final name once it is complete
+            os.replace(part_path, path)
+            MisReportExportJob.UPDATE_RUN(keys=[key], args=[
+                run_id,
+                'status', 'done',
+                'fileName', f"{file_name}.xlsx",
+                'size', os.path.getsize(path),
+                'finishedAt', dt.now(asia_kolkata).isoformat()
+            ])
+        except Exception as e:
+            logger.exception(f"Exception MisReportExportJob run {export_id} :: {e}")
+            MisReportExportJob.UPDATE_RUN(keys=[key], args=[run_id, 'status', 'failed', 'error', str(e)])
+        finally:
+            stop_heartbeat.set()
+            db.close()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    @staticmethod
+    def remove_expired_artifacts():
+        if not os.path.isdir(MIS_EXPORT_DIR):
+            return
+        expired_before = time.time() - MIS_EXPORT_JOB_TTL
+        for entry in os.scandir(MIS_EXPORT_DIR):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired_before:
+                    os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"remove_expired_artifacts :: {entry.path} {e}")
+
+    @staticmethod
+    def parse_range(range_header, size):
+        # single byte range only, anything else is answered with the whole file
+        unit, _, byte_range = range_header.partition('=')
+        if unit.strip() != 'bytes' or ',' in byte_range:
+            return 0, size - 1
+        start, _, end = byte_range.strip().partition('-')
+        try:
+            if start == '':
+                start, end = max(size - int(end), 0), size - 1
+            else:
+                start, end = int(start), min(int(end), size - 1) if end else size - 1
+        except ValueError:
+            return 0, size - 1
+        if start > end or start >= size:
+            return None
+        return start, end
+
+    @staticmethod
+    def stream_range(path, start, end):
+        with open(path, 'rb') as artifact:
+            artifact.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = artifact.read(min(MIS_EXPORT_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def export_job_response(request_data, job, deduplicated):
+    return {
+        'requestId': request_data.get('requestId'),
+        **ErrorCodes.get_error_response(200),
+        'data': {
+            'jobId': job.get('jobId'),
+            'token': job.get('token'),
+            'status': job.get('status'),
+            'deduplicated': deduplicated
+        }
+    }
+
+
+@router.post("/download-invoice-hub-mis-report/jobs/")
+def create_invoice_hub_mis_export_job(request: GetInvoiceHubMisReportSchema):
+    request_data = jsonable_encoder(request)
+    try:
+        job, deduplicated = MisReportExportJob.create('invoiceHubMis', request_data)
+        return export_job_response(request_data, job, deduplicated)
+    except Exception as e:
+        logger.exception(f"Exception create_invoice_hub_mis_export_job :: {e}")
+        return {
+            **ErrorCodes.get_error_response(500)
+        }
+
+
+@router.post("/download-user-mis-report/jobs/")
+def create_user_mis_export_job(request: GetUserMisReportSchema, db: Session = Depends(get_db)):
+    request_data = jsonable_encoder(request)
+    try:
+        idp_id = request_data.get('idpId', '')
+        merchant_details = db.query(MerchantDetails).filter(MerchantDetails.unique_id == idp_id).first()
+        merchant_key = merchant_details and merchant_details.merchant_key or None
+
+        api_request_log_res = views.create_request_log(db, request_data.get('requestId'), request_data, '', 'request', 'get-mis-report', merchant_key)
+        if api_request_log_res.get("code") != 200:
+            return {
+                "requestId": request_data.get('requestId'),
+                **api_request_log_res
+            }
+        job, deduplicated = MisReportExportJob.create('userMis', request_data)
+        return export_job_response(request_data, job, deduplicated)
+    except Exception as e:
+        logger.exception(f"Exception create_user_mis_export_job :: {e}")
+        return {
+            **ErrorCodes.get_error_response(500)
+        }
+
+
+@router.get("/report-export-jobs/{job_id}")
+def report_export_job_status(job_id: str, x_export_token: str = Header(None)):
+    job = MisReportExportJob.get(job_id, x_export_token)
+    if not job:
+        return {
+            **ErrorCodes.get_error_response(1155)
+        }
+    return {
+        **ErrorCodes.get_error_response(200),
+        'data': {key: value for key, value in job.items() if key not in ('params', 'path', 'exportId', 'runId')}
+    }
+
+
+@router.get("/report-export-jobs/{job_id}/download")
+def download_report_export_job(job_id: str, range: str = Header(None), x_export_token: str = Header(None)):
+    job = MisReportExportJob.get(job_id, x_export_token)
+    if not job:
+        return {
+            **ErrorCodes.get_error_response(1155)
+        }
+    path = job.get('path', '')
+    if job.get('status') != 'done' or not os.path.exists(path):
+        return {
+            **ErrorCodes.get_error_response(1156),
+            'status': job.get('status')
+        }
+
+    size = os.path.getsize(path)
+    headers = {
+        'Content-Disposition': f'attachment; filename="{job.get("fileName")}"',
+        'Accept-Ranges': 'bytes'
+    }
+    start, end, status_code = 0, size - 1, 200
+    if range:
+        byte_range = MisReportExportJob.parse_range(range, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(
+        MisReportExportJob.stream_range(path, start, end),
+        status_code=status_code,
+        media_type=MisReportExport.XLSX_MEDIA_TYPE,
+        headers=headers
+    )
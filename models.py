@@ -5,7 +5,7 @@ from schema import InvoiceStatus
 
 from fastapi import HTTPException
 
-from sqlalchemy import Enum, Boolean, Column, ForeignKey, Integer, String, DateTime, Table, UniqueConstraint, Numeric
+from sqlalchemy import Enum, Boolean, Column, ForeignKey, Integer, String, DateTime, Table, UniqueConstraint, Numeric, Index
 from sqlalchemy.orm import relationship, Mapped
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func, false, true, text
@@ -90,6 +90,54 @@ class Ledger(BaseModel):
         return f"{self.id}"
 
 
+def identifier_gstin(party):
+    # first GSTIN of the seller/buyer identifier data, filled in at insert time from extra_data.
+    # a missing GSTIN is stored as NULL, never '', so it can't match another invoice
+    def default(context):
+        extra_data = context.get_current_parameters().get('extra_data') or {}
+        if extra_data.get(f"{party}_gst"):
+            return extra_data.get(f"{party}_gst")
+        for identifier in extra_data.get(f"{party}IdentifierData") or []:
+            if identifier.get(f"{party}IdType") == 'GSTIN':
+                return identifier.get(f"{party}IdNo") or None
+        return None
+    return default
+
+
+def request_extra_data_request_id(context):
+    # requestId of the stored request, filled in at insert time so webhook lookups hit an index
+    request_extra_data = context.get_current_parameters().get('request_extra_data')
+    if isinstance(request_extra_data, dict) and request_extra_data.get('requestId') is not None:
+        return str(request_extra_data.get('requestId'))
+    return None
+
+
+def concurrent_index_option(connection, table_name):
+    # partitioned tables don't support create index concurrently, their indexes are built per partition
+    partitioned = connection.execute(text("""
+        select 1 from pg_partitioned_table pt
+        inner join pg_class c on c.oid = pt.partrelid
+        where c.relname = :table_name and pg_table_is_visible(c.oid)
+    """), [{'table_name': table_name}]).first()
+    return '' if partitioned else 'concurrently '
+
+
+def create_index(connection, index_name, table_name, columns):
+    # a failed create index concurrently leaves an invalid index behind, 'if not exists' would keep it forever.
+    # it is dropped and built again, a valid index is left alone
+    valid = connection.execute(text("""
+        select i.indisvalid from pg_index i
+        inner join pg_class c on c.oid = i.indexrelid
+        where c.relname = :index_name and pg_table_is_visible(c.oid)
+    """), [{'index_name': index_name}]).scalar()
+    if valid:
+        return
+    concurrently = concurrent_index_option(connection, table_name)
+    if valid is False:
+        connection.execute(text(f"drop index {concurrently}if exists {index_name}"))
+    connection.execute(text(f"create index {concurrently}{index_name} on {table_name} ({columns})"))
+
+
 class Invoice(BaseModel):
     __tablename__ = "invoice"
 
@@ -98,8 +146,8 @@ class Invoice(BaseModel):
     invoice_date = Column(DateTime(timezone=True))
     invoice_due_date = Column(DateTime(timezone=True), nullable=True)
     invoice_amt = Column(Numeric(precision=10, scale=2))
-    # buyer_gst = Column(String)
-    # seller_gst = Column(String)
+    seller_gstin = Column(String, index=True, default=identifier_gstin('seller'))
+    buyer_gstin = Column(String, default=identifier_gstin('buyer'))
     invoice_hash = Column(String)
     funded_amt = Column(String)
     gst_status = Column(Boolean, default=False)
@@ -108,6 +156,53 @@ class Invoice(BaseModel):
     status = Column(String)
     ledger = relationship("Ledger", secondary=invoice_ledger_association, back_populates="invoice")
 
+    __table_args__ = (
+        Index('ix_invoice_dedup', 'invoice_no', 'seller_gstin', 'buyer_gstin', 'invoice_date', 'invoice_amt'),
+    )
+
+    @staticmethod
+    def create_gstin_columns(session, batch_size=10000):
+        # existing tables get the columns and the dedup index, old rows are backfilled walking the primary key.
+        # invoices without a GSTIN keep NULL, '' left by an earlier backfill is cleared on the way
+        for table_name in ('invoice', 'old_invoice'):
+            session.execute(text(f"alter table {table_name} add column if not exists seller_gstin varchar"))
+            session.execute(text(f"alter table {table_name} add column if not exists buyer_gstin varchar"))
+            session.commit()
+            last_id = session.execute(text(f"select min(id) - 1 from {table_name}")).scalar()
+            while last_id is not None:
+                last_id = session.execute(text(f"""
+                    with batch as (
+                        select id from {table_name} where id > :last_id order by id limit :batch_size
+                    ), updated as (
+                        update {table_name} i
+                        set
+                            seller_gstin = nullif(coalesce(nullif(i.extra_data->>'seller_gst', ''), (
+                                select s->>'sellerIdNo'
+                                from jsonb_array_elements(case when jsonb_typeof(i.extra_data->'sellerIdentifierData') = 'array'
+                                    then i.extra_data->'sellerIdentifierData' else '[]'::jsonb end) with ordinality as t(s, n)
+                                where s->>'sellerIdType' = 'GSTIN' order by n limit 1
+                            )), ''),
+                            buyer_gstin = nullif(coalesce(nullif(i.extra_data->>'buyer_gst', ''), (
+                                select b->>'buyerIdNo'
+                                from jsonb_array_elements(case when jsonb_typeof(i.extra_data->'buyerIdentifierData') = 'array'
+                                    then i.extra_data->'buyerIdentifierData' else '[]'::jsonb end) with ordinality as t(b, n)
+                                where b->>'buyerIdType' = 'GSTIN' order by n limit 1
+                            )), '')
+                        from batch
+                        where i.id = batch.id
+                            and (i.seller_gstin is null or i.buyer_gstin is null
+                                or i.seller_gstin = '' or i.buyer_gstin = '')
+                    )
+                    select max(id) from batch
+                """), [{'last_id': last_id, 'batch_size': batch_size}]).scalar()
+                session.commit()
+                logger.info(f"create_gstin_columns :: {table_name} backfilled up to id {last_id}")
+        with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            create_index(
+                connection, 'ix_invoice_dedup', 'invoice', 'invoice_no, seller_gstin, buyer_gstin, invoice_date, invoice_amt'
+            )
+            create_index(connection, 'ix_invoice_seller_gstin', 'invoice', 'seller_gstin')
+
     # def __str__(self):
     #     return f"{self.id}"
 
@@ -120,6 +215,8 @@ class OldInvoice(BaseModel):
     invoice_date = Column(DateTime(timezone=True))
     invoice_due_date = Column(DateTime(timezone=True))
     invoice_amt = Column(Numeric(precision=10, scale=2))
+    seller_gstin = Column(String, default=identifier_gstin('seller'))
+    buyer_gstin = Column(String, default=identifier_gstin('buyer'))
     invoice_hash = Column(String)
     funded_amt = Column(String)
     gst_status = Column(Boolean, default=False)
@@ -129,6 +226,267 @@ class OldInvoice(BaseModel):
     ledger = relationship("Ledger", secondary=old_invoice_ledger_association, back_populates="old_invoice")
 
 
+class InvoicePartitions:
+    # invoice and old_invoice range partitioned by created_at month. existing ids are kept, new ids come from one
+    # sequence started above both tables so they are unique across them. archival detaches a month from invoice
+    # and attaches it to old_invoice, a month whose ids already exist in old_invoice is archived row wise instead.
+    #
+    # a partitioned primary key has to include created_at, so the foreign keys on id are replaced: every
+    # referencing column gets a deferred constraint trigger (check_invoice_reference) that rejects, at commit,
+    # a row pointing at an id missing from its table. deletes are not guarded, invoice rows only leave through
+    # archival, which repoints the referencing rows in the same transaction; orphaned_references reports any
+    # row that still lost its invoice
+    SEQUENCE = 'invoice_store_id_seq'
+    MONTHS_AHEAD = 3
+    DEPENDENT_TABLES = ('invoice_encrypted_data', 'disbursed_history', 'repayment_history', 'lender_invoice_association')
+    # (referencing table, column, referenced table)
+    FOREIGN_KEYS = (
+        ('invoice_ledger_association', 'invoice_id', 'invoice'),
+        ('old_invoice_ledger_association', 'invoice_id', 'old_invoice'),
+        ('invoice_encrypted_data', 'invoice_id', 'invoice'),
+        ('invoice_encrypted_data', 'old_invoice_id', 'old_invoice'),
+        ('disbursed_history', 'invoice_id', 'invoice'),
+        ('disbursed_history', 'old_invoice_id', 'old_invoice'),
+        ('repayment_history', 'invoice_id', 'invoice'),
+        ('repayment_history', 'old_invoice_id', 'old_invoice'),
+        ('lender_invoice_association', 'invoice_id', 'invoice'),
+        ('lender_invoice_association', 'old_invoice_id', 'old_invoice'),
+    )
+
+    @staticmethod
+    def is_partitioned(session):
+        return not concurrent_index_option(session, 'invoice')
+
+    @staticmethod
+    def add_months(month, months):
+        month_index = month.month - 1 + months
+        return month.replace(year=month.year + month_index // 12, month=month_index % 12 + 1, day=1)
+
+    @staticmethod
+    def partition_name(table_name, month):
+        return f"{table_name}_p{month:%Y_%m}"
+
+    @staticmethod
+    def create_partitions(session, table_name, first_month, last_month):
+        month = first_month
+        while month <= last_month:
+            session.execute(text(f"""
+                create table if not exists {InvoicePartitions.partition_name(table_name, month)}
+                partition of {table_name}
+                for values from ('{month.isoformat()}') to ('{InvoicePartitions.add_months(month, 1).isoformat()}')
+            """))
+            month = InvoicePartitions.add_months(month, 1)
+
+    @staticmethod
+    def ensure_partitions(session):
+        current_month = datetime.date.today().replace(day=1)
+        InvoicePartitions.create_partitions(
+            session, 'invoice', current_month, InvoicePartitions.add_months(current_month, InvoicePartitions.MONTHS_AHEAD)
+        )
+        session.commit()
+
+    @staticmethod
+    def migrate(session):
+        # one transaction, either both tables are partitioned or nothing changed
+        if InvoicePartitions.is_partitioned(session):
+            return
+        session.execute(text("lock table invoice, old_invoice in access exclusive mode"))
+        # a partitioned primary key has to include created_at, so id alone can't be referenced any more
+        for table_name, column, _ in InvoicePartitions.FOREIGN_KEYS:
+            constraint_names = session.execute(text("""
+                select con.conname
+                from pg_constraint con
+                inner join pg_class c on c.oid = con.conrelid
+                inner join pg_attribute a on a.attrelid = c.oid and a.attnum = any(con.conkey)
+                where con.contype = 'f' and c.relname = :table_name and a.attname = :column
+                    and pg_table_is_visible(c.oid)
+            """), [{'table_name': table_name, 'column': column}]).scalars().all()
+            for constraint_name in constraint_names:
+                session.execute(text(f'alter table {table_name} drop constraint "{constraint_name}"'))
+
+        first_month = session.execute(text("""
+            select date_trunc('month', min(created_at))::date from (
+                select min(created_at) as created_at from invoice
+                union all
+                select min(created_at) from old_invoice
+            ) t
+        """)).scalar() or datetime.date.today().replace(day=1)
+        current_month = datetime.date.today().replace(day=1)
+        session.execute(text(f"create sequence if not exists {InvoicePartitions.SEQUENCE}"))
+        for table_name in ('invoice', 'old_invoice'):
+            session.execute(text(f"alter table {table_name} rename to {table_name}_legacy"))
+            session.execute(text(
+                f"create table {table_name} (like {table_name}_legacy including defaults) partition by range (created_at)"
+            ))
+            session.execute(text(
+                f"alter table {table_name} alter column id set default nextval('{InvoicePartitions.SEQUENCE}')"
+            ))
+            session.execute(text(f"alter table {table_name} add primary key (id, created_at)"))
+            session.execute(text(f"create table {table_name}_default partition of {table_name} default"))
+            InvoicePartitions.create_partitions(
+                session, table_name, first_month,
+                InvoicePartitions.add_months(current_month, InvoicePartitions.MONTHS_AHEAD)
+                if table_name == 'invoice' else current_month
+            )
+            columns = session.execute(text("""
+                select column_name from information_schema.columns
+                where table_name = :table_name and table_schema = current_schema()
+                order by ordinal_position
+            """), [{'table_name': f"{table_name}_legacy"}]).scalars().all()
+            session.execute(text(
+                f"insert into {table_name} ({', '.join(columns)}) select {', '.join(columns)} from {table_name}_legacy"
+            ))
+            session.execute(text(f"drop table {table_name}_legacy"))
+
+        session.execute(text(f"""
+            select setval('{InvoicePartitions.SEQUENCE}', greatest(
+                (select coalesce(max(id), 0) from invoice), (select coalesce(max(id), 0) from old_invoice)
+            ) + 1, false)
+        """))
+        session.execute(text("create index if not exists ix_invoice_id on invoice (id)"))
+        session.execute(text(
+            "create index if not exists ix_invoice_dedup "
+            "on invoice (invoice_no, seller_gstin, buyer_gstin, invoice_date, invoice_amt)"
+        ))
+        session.execute(text("create index if not exists ix_invoice_seller_gstin on invoice (seller_gstin)"))
+        session.execute(text("create index if not exists ix_invoice_updated_at on invoice (updated_at)"))
+        session.execute(text("create index if not exists ix_old_invoice_id on old_invoice (id)"))
+        if session.execute(text("select to_regprocedure('ist_day(timestamp with time zone)')")).scalar():
+            session.execute(text("create index if not exists ix_invoice_ist_day on invoice (ist_day(created_at))"))
+        InvoicePartitions.create_reference_checks(session)
+        session.commit()
+        logger.info(f"InvoicePartitions :: migrated")
+
+    @staticmethod
+    def create_reference_checks(session):
+        session.execute(text("""
+            create or replace function check_invoice_reference() returns trigger language plpgsql as $$
+            declare
+                reference_id integer;
+                referenced boolean;
+            begin
+                execute format('select ($1).%I', TG_ARGV[0]) into reference_id using new;
+                if reference_id is null then
+                    return null;
+                end if;
+                execute format('select exists (select 1 from %I where id = $1)', TG_ARGV[1])
+                    into referenced using reference_id;
+                if not referenced then
+                    raise foreign_key_violation using message = format(
+                        '%s.%s = %s is not present in %s', TG_TABLE_NAME, TG_ARGV[0], reference_id, TG_ARGV[1]
+                    );
+                end if;
+                return null;
+            end
+            $$
+        """))
+        for table_name, column, referenced_table in InvoicePartitions.FOREIGN_KEYS:
+            trigger_name = f"{table_name}_{column}_reference"
+            session.execute(text(f"drop trigger if exists {trigger_name} on {table_name}"))
+            session.execute(text(f"""
+                create constraint trigger {trigger_name}
+                after insert or update of {column} on {table_name}
+                deferrable initially deferred
+                for each row execute function check_invoice_reference('{column}', '{referenced_table}')
+            """))
+
+    @staticmethod
+    def orphaned_references(session):
+        # referencing rows whose invoice is gone, {"table.column": count} of the non zero ones
+        orphaned = {}
+        for table_name, column, referenced_table in InvoicePartitions.FOREIGN_KEYS:
+            count = session.execute(text(f"""
+                select count(*) from {table_name} t
+                where t.{column} is not null
+                    and not exists (select 1 from {referenced_table} r where r.id = t.{column})
+            """)).scalar()
+            if count:
+                orphaned[f"{table_name}.{column}"] = count
+        return orphaned
+
+    @staticmethod
+    def archive_partitions(session, delta_date):
+        # moves every invoice month that ended before delta_date and has no row updated after it, one
+        # transaction per month. a month with recent updates, or with ids already used in old_invoice,
+        # stays in invoice and its expired rows are archived row wise by archive_invoice_batch
+        cutoff_date = delta_date.date()
+        partition_names = session.execute(text("""
+            select c.relname
+            from pg_inherits inh
+            inner join pg_class c on c.oid = inh.inhrelid
+            inner join pg_class p on p.oid = inh.inhparent
+            where p.relname = 'invoice' and pg_table_is_visible(p.oid) and c.relname ~ '^invoice_p[0-9]{4}_[0-9]{2}$'
+            order by c.relname
+        """)).scalars().all()
+        archived = []
+        for partition_name in partition_names:
+            month = datetime.datetime.strptime(partition_name, 'invoice_p%Y_%m').date()
+            next_month = InvoicePartitions.add_months(month, 1)
+            if next_month > cutoff_date:
+                break
+            # the locks keep the month unchanged between the checks and the detach
+            session.execute(text(f"lock table invoice, {partition_name} in access exclusive mode"))
+            updated_since = session.execute(text(
+                f"select exists (select 1 from {partition_name} where updated_at > :delta_date)"
+            ), [{'delta_date': delta_date}]).scalar()
+            id_taken = session.execute(text(
+                f"select exists (select 1 from {partition_name} p inner join old_invoice o on o.id = p.id)"
+            )).scalar()
+            if updated_since or id_taken:
+                session.rollback()
+                logger.info(f"InvoicePartitions :: {partition_name} kept, updated {updated_since} id taken {id_taken}")
+                continue
+            session.execute(text(f"alter table invoice detach partition {partition_name}"))
+            target_name = InvoicePartitions.partition_name('old_invoice', month)
+            overlapping = session.execute(
+                text("select to_regclass(:target_name) is not null"), [{'target_name': target_name}]
+            ).scalar()
+            if overlapping:
+                # old_invoice already has the month, the live rows are merged into it row wise
+                session.execute(text(f"insert into old_invoice select * from {partition_name}"))
+                moved_table = partition_name
+            else:
+                # rows of the month already archived one by one sit in old_invoice_default, they move into the
+                # detached month before it is attached
+                month_range = [{'month': month, 'next_month': next_month}]
+                session.execute(text(f"""
+                    insert into {partition_name}
+                    select * from old_invoice_default where created_at >= :month and created_at < :next_month
+                """), month_range)
+                session.execute(text("""
+                    delete from old_invoice_default where created_at >= :month and created_at < :next_month
+                """), month_range)
+                session.execute(text(f"alter table {partition_name} rename to {target_name}"))
+                session.execute(text(f"""
+                    alter table old_invoice attach partition {target_name}
+                    for values from ('{month.isoformat()}') to ('{next_month.isoformat()}')
+                """))
+                moved_table = target_name
+
+            session.execute(text(f"""
+                insert into old_invoice_ledger_association (invoice_id, ledger_id)
+                select ila.invoice_id, ila.ledger_id
+                from invoice_ledger_association ila
+                where ila.invoice_id in (select id from {moved_table})
+            """))
+            session.execute(text(f"""
+                delete from invoice_ledger_association
+                where invoice_id in (select id from {moved_table})
+            """))
+            for table_name in InvoicePartitions.DEPENDENT_TABLES:
+                session.execute(text(f"""
+                    update {table_name}
+                    set old_invoice_id = invoice_id, invoice_id = null
+                    where invoice_id in (select id from {moved_table})
+                """))
+            if overlapping:
+                session.execute(text(f"drop table {partition_name}"))
+            session.commit()
+            archived.append(month.isoformat())
+            logger.info(f"InvoicePartitions :: archived {partition_name}")
+        return archived
+
+
 class InvoiceEncryptedData(BaseModel):
     __tablename__ = "invoice_encrypted_data"
 
@@ -245,12 +603,40 @@ class PostProcessingRequest(BaseModel):
     __tablename__ = "post_processing_request"
 
     id = Column(Integer, primary_key=True, index=True)
+    request_id = Column(String, index=True, default=request_extra_data_request_id)
     request_extra_data = Column(JSONB, default=[])
     api_response = Column(JSONB, default=[])
     webhook_response = Column(JSONB, default=[])
     merchant_id = Column(String, index=True)
     type = Column(String)
 
+    @staticmethod
+    def create_request_id_column(session, batch_size=10000):
+        # existing tables get the column, old rows are backfilled walking the primary key, then indexed
+        session.execute(text("alter table post_processing_request add column if not exists request_id varchar"))
+        session.commit()
+        last_id = 0
+        while True:
+            last_id_in_batch = session.execute(text("""
+                with batch as (
+                    select id from post_processing_request where id > :last_id order by id limit :batch_size
+                ), updated as (
+                    update post_processing_request ppr
+                    set request_id = ppr.request_extra_data->>'requestId'
+                    from batch
+                    where ppr.id = batch.id and ppr.request_id is null
+                        and jsonb_typeof(ppr.request_extra_data) = 'object'
+                )
+                select max(id) from batch
+            """), [{'last_id': last_id, 'batch_size': batch_size}]).scalar()
+            session.commit()
+            if last_id_in_batch is None:
+                break
+            logger.info(f"create_request_id_column :: post_processing_request backfilled up to id {last_id_in_batch}")
+            last_id = last_id_in_batch
+        with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            create_index(connection, 'ix_post_processing_request_request_id', 'post_processing_request', 'request_id')
+
 
 class LenderDetails(BaseModel):
     __tablename__ = "lender_details"
@@ -5172,6 +5172,9 @@ class GetUserMisReportSchema(BaseModel):
     # filterType: str
     reportType: str
     reportSubType: str
+    # keyset pagination, cursor is the opaque nextCursor of the previous page
+    pageSize: Optional[int] = None
+    cursor: Optional[str] = None
 
     @model_validator(mode='after')
     def validate_field(self):
@@ -5183,6 +5186,10 @@ class GetUserMisReportSchema(BaseModel):
         #     raise HTTPException(status_code=400, detail=f"idpId can not accept special character {self.idpId}")
         if not isinstance(self.idpId, list):
             raise HTTPException(status_code=400, detail=f"invalide idpId  {self.idpId}")
+        if self.pageSize is not None and self.pageSize < 1:
+            raise HTTPException(status_code=400, detail=f"pageSize should be greater than 0 {self.pageSize}")
+        if self.cursor is not None and not re.match(r'^[A-Za-z0-9_\-=]*$', self.cursor):
+            raise HTTPException(status_code=400, detail=f"invalid cursor {self.cursor}")
         return self
 
     @field_validator('requestId')
@@ -1,4 +1,3 @@
-import logging
 import hashlib
 import os
 import re
@@ -6,7 +5,6 @@ import json
 import io
 import base64
 import redis
-import ast
 import pytz
 import math
 import csv
@@ -18,6 +16,10 @@ import string
 import time
 import random
 import uuid
+import threading
+import atexit
+
+from collections import OrderedDict, namedtuple
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
@@ -34,9 +36,11 @@ from decouple import config as dconfig
 from datetime import datetime, timedelta
 
 from errors import ErrorCodes
+from log_utils import get_logger, Payload
 import models
 from models import MerchantDetails, PostProcessingRequest, Hub
-from sqlalchemy import desc, text
+from sqlalchemy import desc, text, event, inspect, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from random import randint
 
 from fastapi import Depends
@@ -45,9 +49,27 @@ from database import get_db
 
 # logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
 # get root logger
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 r = redis.Redis(host=dconfig('REDIS_HOST'), port=6379, decode_responses=True)
+# in flight invoices are per invoice id keys (invoice numbers only repeat across sellers), claimed and released by
+# fund_ledger and cancel only. a claim expires if the worker dies before releasing it
+IN_FLIGHT_INVOICE_PREFIX = 'invoice_in_flight'
+IN_FLIGHT_INVOICE_TTL = dconfig('IN_FLIGHT_INVOICE_TTL', default=300, cast=int)
+# merchant records kept per process for MERCHANT_CACHE_LOCAL_TTL seconds, in redis for MERCHANT_CACHE_TTL.
+# ORM updates invalidate right away, raw SQL updates to merchant_details are only seen once the TTL runs out
+MERCHANT_CACHE_LOCAL_TTL = dconfig('MERCHANT_CACHE_LOCAL_TTL', default=30, cast=int)
+MERCHANT_CACHE_TTL = dconfig('MERCHANT_CACHE_TTL', default=300, cast=int)
+MERCHANT_CACHE_MAX_ENTRIES = dconfig('MERCHANT_CACHE_MAX_ENTRIES', default=1000, cast=int)
+# response side of the request logs is queued in redis and written in batches by a background thread,
+# a batch claimed by a writer that stopped for REQUEST_LOG_CLAIM_TIMEOUT seconds is queued again
+REQUEST_LOG_ASYNC = dconfig('REQUEST_LOG_ASYNC', default=True, cast=bool)
+REQUEST_LOG_BATCH_SIZE = dconfig('REQUEST_LOG_BATCH_SIZE', default=200, cast=int)
+REQUEST_LOG_FLUSH_INTERVAL = dconfig('REQUEST_LOG_FLUSH_INTERVAL', default=1.0, cast=float)
+REQUEST_LOG_FLUSH_RETRIES = dconfig('REQUEST_LOG_FLUSH_RETRIES', default=3, cast=int)
+REQUEST_LOG_CLAIM_TIMEOUT = dconfig('REQUEST_LOG_CLAIM_TIMEOUT', default=300, cast=int)
 asia_kolkata = pytz.timezone('Asia/Kolkata')
+# shared signature encoder, output is byte for byte json.dumps(data, separators=(',', ':'))
+SIGNATURE_ENCODER = json.JSONEncoder(separators=(',', ':'))
 
 
 # Function to generate a random string
@@ -67,22 +89,125 @@ class InvoiceStatus:
     PARTIAL_FUNDED = 'partial_funded'
 
 
+class MerchantCache:
+    FIELDS = ('id', 'name', 'merchant_key', 'merchant_secret', 'is_active', 'username', 'webhook_endpoint', 'hub_id',
+              'unique_id')
+    MerchantRecord = namedtuple('MerchantRecord', FIELDS)
+    KEY_PREFIX = 'merchant_cache'
+    local = OrderedDict()
+    lock = threading.Lock()
+    # a record loaded from the db is only cached if no invalidation bumped the version since the load started
+    SET_IF_VERSION = r.register_script("""
+        if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then
+            return 0
+        end
+        redis.call('set', KEYS[1], ARGV[2], 'ex', ARGV[3])
+        return 1
+    """)
+
+    @staticmethod
+    def cache_key(merchant_key):
+        return f"{MerchantCache.KEY_PREFIX}:{merchant_key}"
+
+    @staticmethod
+    def version_key(merchant_key):
+        return f"{MerchantCache.KEY_PREFIX}:version:{merchant_key}"
+
+    @staticmethod
+    def get(db, merchant_key):
+        if not merchant_key:
+            return None
+        now = time.monotonic()
+        with MerchantCache.lock:
+            cached = MerchantCache.local.get(merchant_key)
+            if cached and cached[0] > now:
+                MerchantCache.local.move_to_end(merchant_key)
+                return cached[1]
+
+        record = None
+        version = None
+        try:
+            cached_value, version = r.mget(MerchantCache.cache_key(merchant_key), MerchantCache.version_key(merchant_key))
+            if cached_value:
+                record = MerchantCache.MerchantRecord(**json.loads(cached_value))
+        except Exception as e:
+            logger.error(f"MerchantCache :: redis read failed {e}")
+
+        if record is None:
+            merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+            if not merchant_details:
+                return None
+            record = MerchantCache.MerchantRecord(
+                **{field: getattr(merchant_details, field) for field in MerchantCache.FIELDS}
+            )
+            try:
+                cached = MerchantCache.SET_IF_VERSION(
+                    keys=[MerchantCache.cache_key(merchant_key), MerchantCache.version_key(merchant_key)],
+                    args=[version or '0', json.dumps(record._asdict()), MERCHANT_CACHE_TTL]
+                )
+            except Exception as e:
+                cached = None
+                logger.error(f"MerchantCache :: redis write failed {e}")
+            if cached == 0:
+                # the row changed while it was read, this copy may be stale and is not kept anywhere
+                return record
+
+        with MerchantCache.lock:
+            MerchantCache.local[merchant_key] = (now + MERCHANT_CACHE_LOCAL_TTL, record)
+            MerchantCache.local.move_to_end(merchant_key)
+            while len(MerchantCache.local) > MERCHANT_CACHE_MAX_ENTRIES:
+                MerchantCache.local.popitem(last=False)
+        return record
+
+    @staticmethod
+    def invalidate(*merchant_keys):
+        merchant_keys = [merchant_key for merchant_key in merchant_keys if merchant_key]
+        with MerchantCache.lock:
+            for merchant_key in merchant_keys:
+                MerchantCache.local.pop(merchant_key, None)
+        if merchant_keys:
+            pipe = r.pipeline()
+            for merchant_key in merchant_keys:
+                pipe.incr(MerchantCache.version_key(merchant_key))
+            pipe.delete(*[MerchantCache.cache_key(merchant_key) for merchant_key in merchant_keys])
+            pipe.execute()
+        logger.info("MerchantCache :: invalidated %s", Payload(len(merchant_keys)))
+
+
+@event.listens_for(MerchantDetails, 'after_update')
+@event.listens_for(MerchantDetails, 'after_delete')
+def merchant_changed(mapper, connection, target):
+    # the cached record is dropped once the change is committed, the old key too when merchant_key changed
+    history = inspect(target).attrs.merchant_key.history
+    merchant_keys = {target.merchant_key, *(history.deleted or [])}
+    inspect(target).session.info.setdefault('merchant_cache_invalidate', set()).update(merchant_keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_merchant_cache(session):
+    merchant_keys = session.info.pop('merchant_cache_invalidate', None)
+    if merchant_keys:
+        try:
+            MerchantCache.invalidate(*merchant_keys)
+        except Exception as e:
+            logger.error(f"MerchantCache :: invalidate failed {e}")
+
+
 def create_signature(data, secret_key):
-    logger.info(f"getting signature data >>>>>>>>>>>>>>>> {data}")
-    logger.info(f"getting merchant secret key >>>>>>>>>>>>>>>> {secret_key}")
-    params = json.dumps(data, separators=(',', ':'))
-    logger.info(f"getting seperator data >>>>>>>>>>>>>> {params}")
-    final_string = '%s%s' % (params, secret_key)
-    signature = hashlib.sha256(final_string.encode()).hexdigest()
-    logger.info(f"getting signature {signature}")
+    # payload is serialized once and hashed in parts, neither the payload nor the secret is logged
+    signature = hashlib.sha256(SIGNATURE_ENCODER.encode(data).encode())
+    signature.update(str(secret_key).encode())
+    signature = signature.hexdigest()
+    logger.info("getting signature %s", Payload(signature))
     # add this signature to the request body and post
     return signature
 
 
 def create_ledger_hash(data, secret_key):
-    final_string = '%s%s' % (data, secret_key)
-    signature = hashlib.sha256(final_string.encode()).hexdigest()
-    logger.info(f"getting signature {signature}")
+    signature = hashlib.sha256(str(data).encode())
+    signature.update(str(secret_key).encode())
+    signature = signature.hexdigest()
+    logger.info("getting signature %s", Payload(signature))
     # add this signature to the request body and post
     return signature
 
@@ -90,12 +215,12 @@ def create_ledger_hash(data, secret_key):
 def create_response_hash(db, data, merchant_key):
     if 'signature' in data:
         data.pop('signature')
-    logger.info(f"getting signature data {data}")
+    logger.info("getting signature data %s", Payload(data))
 
-    merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+    merchant_details = MerchantCache.get(db, merchant_key)
     final_string = '%s%s' % (data, merchant_details.merchant_secret)
     signature = hashlib.sha256(final_string.encode()).hexdigest()
-    logger.info(f"getting signature {signature}")
+    logger.info("getting signature %s", Payload(signature))
     # add this signature to the request body and post
     return signature
 
@@ -106,15 +231,15 @@ def validate_signature(db, request_data, merchant_key):
     # if not duplicates_exist:
     #     duplicates_exist = check_for_duplicate_values(request_data.get('ledgerData'))
     #     if not duplicates_exist:
-    merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+    merchant_details = MerchantCache.get(db, merchant_key)
     request_data_copy = request_data.copy()
     request_data.pop('signature', '')
-    logger.info(f"getting requests data >>>>>>>>>>>>>>>> {request_data}")
+    logger.info("getting requests data >>>>>>>>>>>>>>>> %s", Payload(request_data))
 
     if merchant_details:
         created_signature = create_signature(request_data, merchant_details.merchant_secret)
-        logger.info(f"created signature @@@@@@@@@@@@@@@@@@ {created_signature}")
-        logger.info(f"requested signature @@@@@@@@@@@@@@@@@@ {request_data_copy.get('signature')}")
+        logger.info("created signature @@@@@@@@@@@@@@@@@@ %s", Payload(created_signature))
+        logger.info("requested signature @@@@@@@@@@@@@@@@@@ %s", Payload(request_data_copy.get('signature')))
         if request_data_copy.get('signature') == created_signature:
             return {"requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(200), "merchant_details": merchant_details
@@ -237,11 +362,11 @@ def check_for_entity_gst_duplicate_values(request_data):
 def check_invoice_date(invoice_data):
     from datetime import datetime
     date_list = [sub['invoiceDate'] for sub in invoice_data.get('ledgerData')]
-    logger.info(f"getting date list >>>>>>>>>>>>>>>>>>{date_list}")
+    logger.info("getting date list >>>>>>>>>>>>>>>>>>%s", Payload(date_list))
     current_date = datetime.now()
     is_greater_than_current = lambda date: datetime.strptime(date, '%d/%m/%Y') < current_date
     results = list(map(is_greater_than_current, date_list))
-    logger.info(f"getting date list >>>>>>>>>>>>>>>>>>{results}")
+    logger.info("getting date list >>>>>>>>>>>>>>>>>>%s", Payload(results))
 
     if False in results:
         for index, value in enumerate(results):
@@ -255,7 +380,7 @@ def check_invoice_date(invoice_data):
 
 
 def create_post_processing(db, data, api_type, flag, merchant_key, api_response):
-    logger.info(f"getting response data {data}")
+    logger.info("getting response data %s", Payload(data))
     # merchant_details = db.query(models.MerchantDetails).filter(models.MerchantDetails.merchant_key ==
     # merchant_key).first()
     # merchant_id_obj = merchant_details.id if merchant_details.id else ''
@@ -264,25 +389,25 @@ def create_post_processing(db, data, api_type, flag, merchant_key, api_response)
     if flag == "response":
         invoice_obj = (
             db.query(models.PostProcessingRequest)
-            .filter(models.PostProcessingRequest.request_extra_data.contains({"requestId": data.get('requestId')}))
+            .filter(models.PostProcessingRequest.request_id == str(data.get('requestId')))
             .order_by(desc(
                 models.PostProcessingRequest.id))  # Replace 'your_column_name' with the actual column to order by
             .first()
         )
-        logger.info(f"getting invoice object >>>>>>>>>>> {invoice_obj.id} >>>>>>>>>>> ")
+        logger.info("getting invoice object >>>>>>>>>>> %s >>>>>>>>>>> ", Payload(invoice_obj.id))
         invoice_obj.webhook_response = data
+        invoice_obj.updated_at = datetime.now()
         db.commit()
         db.refresh(invoice_obj)
     else:
-        merchant_details = db.query(models.MerchantDetails).filter(
-            models.MerchantDetails.merchant_key == merchant_key).first()
+        merchant_details = MerchantCache.get(db, merchant_key)
         if not merchant_details:
             return {
                 "requestId": data.get('requestId'),
                 **ErrorCodes.get_error_response(1002)
             }
         merchant_id = merchant_details.id if merchant_details else ''
-        logger.info(f"merchant id create post processing >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
+        logger.info("merchant id create post processing >>>>>>>>>>>>>>>>>>>>>> %s", Payload(merchant_id))
         post_process_create = PostProcessingRequest(
             request_extra_data=data,
             api_response=api_response,
@@ -315,56 +440,203 @@ def create_post_processing(db, data, api_type, flag, merchant_key, api_response)
         return return_response
 
 
+class RequestLogWriter:
+    # queued updates live in a redis list, a process killed before flushing loses nothing.
+    # a batch being flushed is parked under its own key and listed in CLAIMED with the claim time,
+    # claims older than REQUEST_LOG_CLAIM_TIMEOUT belonged to a dead writer and go back to the queue
+    PENDING_KEY = 'request_log:pending'
+    CLAIMED_KEY = 'request_log:claimed'
+    CLAIM = r.register_script("""
+        local items = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        if #items == 0 then
+            return items
+        end
+        redis.call('ltrim', KEYS[1], #items, -1)
+        redis.call('rpush', KEYS[3], unpack(items))
+        redis.call('zadd', KEYS[2], ARGV[2], KEYS[3])
+        return items
+    """)
+    REQUEUE = r.register_script("""
+        local items = redis.call('lrange', KEYS[3], 0, -1)
+        if #items > 0 then
+            redis.call('rpush', KEYS[1], unpack(items))
+        end
+        redis.call('del', KEYS[3])
+        redis.call('zrem', KEYS[2], KEYS[3])
+        return #items
+    """)
+    stopping = threading.Event()
+    thread = None
+    pid = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def insert(db, model, **values):
+        # request_id is unique on every log table, the insert is the duplicate check
+        table = model.__table__
+        created = db.execute(
+            pg_insert(table).values(**values).on_conflict_do_nothing(
+                index_elements=['request_id']
+            ).returning(table.c.id)
+        ).first()
+        db.commit()
+        return created is not None
+
+    @staticmethod
+    def encode(model, request_id, values):
+        return json.dumps({
+            'table': model.__tablename__,
+            'request_id': request_id,
+            'values': {
+                column: value.isoformat() if isinstance(value, datetime) else value
+                for column, value in values.items()
+            },
+            'datetimes': [column for column, value in values.items() if isinstance(value, datetime)]
+        })
+
+    @staticmethod
+    def decode(item):
+        item = json.loads(item)
+        values = item['values']
+        for column in item['datetimes']:
+            values[column] = datetime.fromisoformat(values[column])
+        return models.Base.metadata.tables[item['table']], item['request_id'], values
+
+    @staticmethod
+    def update(model, request_id, **values):
+        if REQUEST_LOG_ASYNC:
+            try:
+                r.rpush(RequestLogWriter.PENDING_KEY, RequestLogWriter.encode(model, request_id, values))
+                RequestLogWriter.start()
+                return
+            except Exception as e:
+                logger.error(f"RequestLogWriter :: queueing failed {e}, writing inline")
+        RequestLogWriter.flush([(model.__table__, request_id, values)])
+
+    @staticmethod
+    def start():
+        with RequestLogWriter.lock:
+            if RequestLogWriter.pid == os.getpid() and RequestLogWriter.thread.is_alive():
+                return
+            if RequestLogWriter.pid != os.getpid():
+                # a forked worker runs its own writer thread, the parent's thread is not running here
+                RequestLogWriter.stopping = threading.Event()
+            RequestLogWriter.pid = os.getpid()
+            RequestLogWriter.thread = threading.Thread(
+                target=RequestLogWriter.run, name='request-log-writer', daemon=True
+            )
+            RequestLogWriter.thread.start()
+
+    @staticmethod
+    def run():
+        stopping = RequestLogWriter.stopping
+        while not stopping.is_set():
+            try:
+                RequestLogWriter.requeue_stale_claims()
+                if not RequestLogWriter.drain():
+                    stopping.wait(REQUEST_LOG_FLUSH_INTERVAL)
+            except Exception as e:
+                logger.error(f"RequestLogWriter :: writer loop failed {e}")
+                stopping.wait(REQUEST_LOG_FLUSH_INTERVAL)
+
+    @staticmethod
+    def drain():
+        # flushes one claimed batch, a batch that can't be written goes back to the queue
+        claim_key = f"request_log:claim:{uuid.uuid4().hex}"
+        keys = [RequestLogWriter.PENDING_KEY, RequestLogWriter.CLAIMED_KEY, claim_key]
+        items = RequestLogWriter.CLAIM(keys=keys, args=[REQUEST_LOG_BATCH_SIZE, time.time()])
+        if not items:
+            return 0
+        batch = [RequestLogWriter.decode(item) for item in items]
+        if RequestLogWriter.flush(batch):
+            r.pipeline().delete(claim_key).zrem(RequestLogWriter.CLAIMED_KEY, claim_key).execute()
+        else:
+            RequestLogWriter.REQUEUE(keys=keys)
+            logger.error(f"RequestLogWriter :: requeued {len(items)} response logs")
+            RequestLogWriter.stopping.wait(REQUEST_LOG_FLUSH_INTERVAL)
+        return len(items)
+
+    @staticmethod
+    def requeue_stale_claims():
+        stale = r.zrangebyscore(RequestLogWriter.CLAIMED_KEY, '-inf', time.time() - REQUEST_LOG_CLAIM_TIMEOUT)
+        for claim_key in stale:
+            requeued = RequestLogWriter.REQUEUE(
+                keys=[RequestLogWriter.PENDING_KEY, RequestLogWriter.CLAIMED_KEY, claim_key]
+            )
+            logger.error(f"RequestLogWriter :: requeued {requeued} response logs of an abandoned batch")
+
+    @staticmethod
+    def flush(batch):
+        # one executemany update per table and column set, the last update of a request wins
+        groups = {}
+        for table, request_id, values in batch:
+            groups.setdefault((table, tuple(sorted(values))), {})[request_id] = values
+        for attempt in range(1, REQUEST_LOG_FLUSH_RETRIES + 1):
+            db = next(get_db())
+            try:
+                for (table, columns), rows in groups.items():
+                    statement = table.update().where(
+                        table.c.request_id == bindparam('log_request_id')
+                    ).values({column: bindparam(f"log_{column}") for column in columns})
+                    db.execute(statement, [
+                        {'log_request_id': request_id, **{f"log_{column}": values[column] for column in columns}}
+                        for request_id, values in rows.items()
+                    ])
+                db.commit()
+                logger.info("RequestLogWriter :: flushed %s", Payload(len(batch)))
+                return True
+            except Exception as e:
+                db.rollback()
+                logger.error(f"RequestLogWriter :: flush attempt {attempt} failed {e}")
+                time.sleep(min(attempt, 5))
+            finally:
+                db.close()
+        return False
+
+    @staticmethod
+    def stop():
+        # the queue is in redis, stopping only lets the batch in progress finish
+        if RequestLogWriter.pid != os.getpid():
+            return
+        RequestLogWriter.stopping.set()
+        if RequestLogWriter.thread is not None:
+            RequestLogWriter.thread.join(timeout=30)
+
+
+atexit.register(RequestLogWriter.stop)
+
+
 def create_request_log(db, request_id, request_data, response_data, flag, api_url='', merchant_key=None):
     try:
-        # merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
-        # if not merchant_details:
-        #     return {
-        #         "requestId": request_data.get('requestId'),
-        #         **ErrorCodes.get_error_response(1002)
-        #     }
-        # merchant_id_obj = merchant_details.id if merchant_details.id else ''
-        # merchant_id = str(merchant_id_obj).zfill(4)
-        # logger.info(f"merchant_id request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-        api_request_obj = db.query(
-            models.APIRequestLog
-        ).filter(
-            models.APIRequestLog.request_id == request_id
-        ).first()
-        logger.info(f"getting data iof api request log ################### {api_request_obj}")
         if flag == 'request':
-            if api_request_obj:
-                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
-            merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+            merchant_details = MerchantCache.get(db, merchant_key)
             if not merchant_details:
                 return {
                     "requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(1002)
                 }
             merchant_id = merchant_details.id if merchant_details else ''
-            logger.info(f"merchant_id request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-            request_created = models.APIRequestLog(
+            logger.info("merchant_id request log >>>>>>>>>>>>>>>>>>>>>> %s", Payload(merchant_id))
+            if not RequestLogWriter.insert(
+                db, models.APIRequestLog,
                 request_id=request_data.get('requestId'),
                 request_data=request_data,
                 api_url=api_url,
                 merchant_id=str(merchant_id)
-            )
-            db.add(request_created)
-            db.commit()
-            db.refresh(request_created)
+            ):
+                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
             return {"requestId": request_id, **ErrorCodes.get_error_response(200)}
         else:
-            api_request_obj.response_data = response_data
-            api_request_obj.updated_at = datetime.now()
-            db.commit()
-            db.refresh(api_request_obj)
+            RequestLogWriter.update(
+                models.APIRequestLog, request_id, response_data=response_data, updated_at=datetime.now()
+            )
     except Exception as e:
         logger.error(f"getting error while creating request log >>>>>>>>>>>>>>> {e}")
         return {**ErrorCodes.get_error_response(500)}
 
 
 def get_webhook_url(db, merchant_key):
-    merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+    merchant_details = MerchantCache.get(db, merchant_key)
     return merchant_details.webhook_endpoint
 
 
@@ -531,34 +803,46 @@ def validate_ledger_date(request_data):
 
 
 def check_ledger(db, request_data, merchant_obj):
-    logger.info(f"getting ledger check {request_data.get('ledgerNo')}")
+    logger.info("getting ledger check %s", Payload(request_data.get('ledgerNo')))
     ledger_data = db.query(models.Ledger).filter(
         models.Ledger.ledger_id == request_data.get('ledgerNo'),
         models.Ledger.merchant_id == merchant_obj.id
     ).first()
-    logger.info(f"getting ledger data {ledger_data}")
+    logger.info("getting ledger data %s", Payload(ledger_data))
     if ledger_data:
         return {'requestId': request_data.get('requestId'), **ErrorCodes.get_error_response(200)}
     else:
         return {'requestId': request_data.get('requestId'), **ErrorCodes.get_error_response(1007)}
 
 
-def update_cached_invoice_list(invoices_list):
-    invoice_cache = r.get('invoices')
-    ast.literal_eval(invoice_cache)
-    new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-    r.set('invoices', str(new_invoice))
-    invoice_cache = r.get('invoices')
-    logger.info(f"updated redis cached invoice list.......:: {invoice_cache}")
+def in_flight_invoice_key(invoice_id):
+    return f"{IN_FLIGHT_INVOICE_PREFIX}:{invoice_id}"
+
 
+def add_cached_invoice_list(invoice_ids):
+    # claims every invoice of the batch with SET NX, returns the invoice ids already held by another request
+    invoice_ids = list(dict.fromkeys(invoice_ids))
+    if not invoice_ids:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for invoice_id in invoice_ids:
+        pipe.set(in_flight_invoice_key(invoice_id), 1, nx=True, ex=IN_FLIGHT_INVOICE_TTL)
+    claimed = pipe.execute()
+    busy_invoices = [invoice_id for invoice_id, is_claimed in zip(invoice_ids, claimed) if not is_claimed]
+    if busy_invoices:
+        # all or nothing, release what this request claimed
+        acquired = [invoice_id for invoice_id, is_claimed in zip(invoice_ids, claimed) if is_claimed]
+        update_cached_invoice_list(acquired)
+    logger.info("in flight invoices claimed :: %s busy :: %s",
+                Payload(len(invoice_ids) - len(busy_invoices)), Payload(busy_invoices))
+    return busy_invoices
 
-def update_cached_invoice_list(invoices_list):
-    invoice_cache = r.get('invoices')
-    ast.literal_eval(invoice_cache)
-    new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-    r.set('invoices', str(new_invoice))
-    invoice_cache = r.get('invoices')
-    logger.info(f"updated redis cached invoice list.......:: {invoice_cache}")
+
+def update_cached_invoice_list(invoice_ids):
+    invoice_ids = list(dict.fromkeys(invoice_ids or []))
+    if invoice_ids:
+        r.delete(*[in_flight_invoice_key(invoice_id) for invoice_id in invoice_ids])
+    logger.info("released redis in flight invoices.......:: %s", Payload(len(invoice_ids)))
 
 
 def validate_pan_gst_pan(request_data):
@@ -580,7 +864,7 @@ def validate_pan_gst_pan(request_data):
 
 
 def validate_seller_invoice_pan_gst_pan(request_data):
-    logger.info(f"seller data {request_data} >>>>>>>>>>>>>>>>>>>>>>>")
+    logger.info("seller data %s >>>>>>>>>>>>>>>>>>>>>>>", Payload(request_data))
     if request_data.get("sellerIdentifierData"):
         gst_filtered_obj = filter(lambda entry: entry.get("sellerIdType").lower() == "gstin",
                                   request_data.get("sellerIdentifierData", []))
@@ -598,7 +882,7 @@ def validate_seller_invoice_pan_gst_pan(request_data):
 
 
 def validate_buyer_invoice_pan_gst_pan(request_data):
-    logger.info(f"buyer  data{request_data} >>>>>>>>>>>>>>>>>>>>>>>")
+    logger.info("buyer  data%s >>>>>>>>>>>>>>>>>>>>>>>", Payload(request_data))
     if request_data.get("buyerIdentifierData"):
         gst_filtered_obj = filter(lambda entry: entry.get("buyerIdType").lower() == "gstin",
                                   request_data.get("buyerIdentifierData", []))
@@ -818,7 +1102,7 @@ def decrypt_aes_256(key: bytes, encrypted_data: bytes):
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
     decryptor = cipher.decryptor()
     decrypted_data = decryptor.update(encrypted_data) + decryptor.finalize()
-    logger.info(f"decrypted_data {decrypted_data}")
+    logger.info("decrypted_data %s", Payload(decrypted_data))
     # decrypted_data = ''.join(char for char in decrypted_data.decode('utf-8') if char in
     # '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ ')
     # return json.loads(decrypted_data.decode('utf-8'))
@@ -888,18 +1172,17 @@ def decrypt_aes_256(key: bytes, encrypted_data: bytes):
 
 
 def create_hub_signature(data, hub_secret_key):
-    logger.info(f"getting signature data >>>>>>>>>>>>>>>> {data}")
-    logger.info(f"getting hub secret key >>>>>>>>>>>>>>>> {hub_secret_key}")
+    logger.info("getting signature data >>>>>>>>>>>>>>>> %s", Payload(data))
 
     final_string = '%s%s' % (data, hub_secret_key)
     signature = hashlib.sha256(final_string.encode()).hexdigest()
-    logger.info(f"getting signature {signature}")
+    logger.info("getting signature %s", Payload(signature))
     # add this signature to the request body and post
     return signature
 
 
 def validate_hub_signature(db, request_data, hub_key):
-    logger.info(f"...inside validate_hub_signature...request :: {request_data}")
+    logger.info("...inside validate_hub_signature...request :: %s", Payload(request_data))
 
     hub_obj = db.query(Hub).filter(Hub.hub_key == hub_key).first()
     request_data_copy = request_data.copy()
@@ -909,8 +1192,8 @@ def validate_hub_signature(db, request_data, hub_key):
     if hub_obj:
         data = request_data.get('txnCode') + request_data.get('correlationId')
         created_hub_sign = create_hub_signature(data, hub_obj.hub_secret)
-        logger.info(f"create hub signature :: {created_hub_sign}")
-        logger.info(f"requested hub signature :: {request_data_copy.get('signature')}")
+        logger.info("create hub signature :: %s", Payload(created_hub_sign))
+        logger.info("requested hub signature :: %s", Payload(request_data_copy.get('signature')))
         if request_data_copy.get('signature') == created_hub_sign:
             return {
                 "hub_obj": hub_obj,
@@ -925,40 +1208,19 @@ def create_hub_request_log(db, request_id, request_data, response_data, flag, ap
                            merchant_key=None):
     try:
         logger.info(f"... inside create_hub_request_log... ")
-        hub_request_obj = db.query(
-            models.HubRequestLog
-        ).filter(
-            models.HubRequestLog.request_id == request_id
-        ).first()
-        logger.info(f"fetch hub api request log data :: {hub_request_obj}")
         if flag == 'request':
-            if hub_request_obj:
-                return {"requestId": request_id, **ErrorCodes.get_error_response(1070)}
-            # merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
-            # if not merchant_details:
-            #     return {
-            #         "requestId": request_data.get('requestId'),
-            #         **ErrorCodes.get_error_response(1002)
-            #     }
-            # merchant_id_obj = merchant_details.id if merchant_details.id else ''
-            # merchant_id = str(merchant_id_obj).zfill(4)
-            # logger.info(f"merchant_id request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-            request_created = models.HubRequestLog(
+            if not RequestLogWriter.insert(
+                db, models.HubRequestLog,
                 request_id=request_id,
                 request_data=request_data,
                 api_url=api_url,
                 hub_id=hub_id,
                 merchant_id=merchant_id
-                # merchant_id=merchant_id
-            )
-            db.add(request_created)
-            db.commit()
-            db.refresh(request_created)
+            ):
+                return {"requestId": request_id, **ErrorCodes.get_error_response(1070)}
             return {"requestId": request_id, **ErrorCodes.get_error_response(200)}
         else:
-            hub_request_obj.response_data = response_data
-            db.commit()
-            db.refresh(hub_request_obj)
+            RequestLogWriter.update(models.HubRequestLog, request_id, response_data=response_data)
     except Exception as e:
         logger.error(f"getting error while creating hub request log :: {e}")
         return {**ErrorCodes.get_error_response(500)}
@@ -1204,7 +1466,7 @@ def read_csv_reg_finance():
                 finance_request_packet.append(finance_obj)
             request_packet_validation = True
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1239,7 +1501,7 @@ def validate_pan_gst_relationship(pan, gst):
 
 def create_csv_response_file(field_name, file_path, response_csv_data):
     try:
-        logger.info(f"getting inside create csv file >>>>>>>>>>> {response_csv_data}")
+        logger.info("getting inside create csv file >>>>>>>>>>> %s", Payload(response_csv_data))
         csv_data = io.StringIO()
         csv_writer = csv.DictWriter(csv_data, fieldnames=field_name, delimiter="|")
         csv_writer.writeheader()
@@ -1335,7 +1597,7 @@ def dis_read_csv_file():
                 "invoiceAmt": str(row.invoiceAmt),
             }
             total_row_invoices = total_row_invoices + 1
-            logger.info(f"getting ledger_datas request packet {ledger_datas}")
+            logger.info("getting ledger_datas request packet %s", Payload(ledger_datas))
 
         if ledger_datas:
             ledger_data.append(ledger_datas)
@@ -1348,7 +1610,7 @@ def dis_read_csv_file():
                 "idpId": row.idpId,
             })
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1410,7 +1672,7 @@ def repay_read_csv_file():
                 "invoiceAmt": str(row.invoiceAmt)
             }
             total_row_invoices = total_row_invoices + 1
-            logger.info(f"getting request packet {repayment_ledger_datas}")
+            logger.info("getting request packet %s", Payload(repayment_ledger_datas))
 
         if repayment_ledger_datas:
             repayment_ledger_data.append(repayment_ledger_datas)
@@ -1423,7 +1685,7 @@ def repay_read_csv_file():
                 "idpId": str(row.idpId),
             })
 
-    logger.info(f"getting repayment request packet {request_packet}")
+    logger.info("getting repayment request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1560,7 +1822,7 @@ def read_csv_reg_without_ec():
                     request_packet.append(invoice_obj)
             request_packet_validation = True
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1659,7 +1921,7 @@ def read_csv_entity_reg():
 
             request_packet_validation = True
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1752,7 +2014,7 @@ def read_csv_reg_with_ec():
                     request_packet.append(invoice_obj)
                 hub_validation = True
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1849,7 +2111,7 @@ def read_csv_reg_with_ec():
                     request_packet.append(invoice_obj)
                 hub_validation = True
 
-    logger.info(f"getting request packet {request_packet}")
+    logger.info("getting request packet %s", Payload(request_packet))
     return request_packet
 
 
@@ -1890,49 +2152,38 @@ def cancel_read_csv():
         })
         # logger.info(f" cancel data -------{invoice_obj}")
 
-    logger.info(f"getting cancellation request packet {request_packet}")
+    logger.info("getting cancellation request packet %s", Payload(request_packet))
     return request_packet
 
 
 def create_bulk_request_log(db, request_id, request_data, response_data, flag, api_url='', merchant_key=None):
     try:
-        api_request_obj = db.query(
-            models.BulkAPIRequestLog
-        ).filter(
-            models.BulkAPIRequestLog.request_id == request_id
-        ).first()
-        logger.info(f"getting data iof api request log ################### {api_request_obj}")
         if flag == 'request':
-            if api_request_obj:
-                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
-            merchant_details = db.query(MerchantDetails).filter(MerchantDetails.merchant_key == merchant_key).first()
+            merchant_details = MerchantCache.get(db, merchant_key)
             if not merchant_details:
                 return {
                     "requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(1002)
                 }
             merchant_id = merchant_details.id if merchant_details else ''
-            logger.info(f"merchant_id request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-            request_created = models.BulkAPIRequestLog(
+            logger.info("merchant_id request log >>>>>>>>>>>>>>>>>>>>>> %s", Payload(merchant_id))
+            if not RequestLogWriter.insert(
+                db, models.BulkAPIRequestLog,
                 request_id=request_data.get('requestId'),
                 request_data=request_data,
                 api_url=api_url,
                 merchant_id=str(merchant_id)
-            )
-            db.add(request_created)
-            db.commit()
-            db.refresh(request_created)
+            ):
+                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
             return {"requestId": request_id, **ErrorCodes.get_error_response(200)}
         elif flag == 'response':
-            api_request_obj.response_data = response_data
-            api_request_obj.updated_at = datetime.now()
-            db.commit()
-            db.refresh(api_request_obj)
+            RequestLogWriter.update(
+                models.BulkAPIRequestLog, request_id, response_data=response_data, updated_at=datetime.now()
+            )
         else:
-            api_request_obj.webhook_response = response_data
-            api_request_obj.updated_at = datetime.now()
-            db.commit()
-            db.refresh(api_request_obj)
+            RequestLogWriter.update(
+                models.BulkAPIRequestLog, request_id, webhook_response=response_data, updated_at=datetime.now()
+            )
     except Exception as e:
         logger.error(f"getting error while creating request log >>>>>>>>>>>>>>> {e}")
         return {**ErrorCodes.get_error_response(500)}
@@ -2007,7 +2258,7 @@ def check_invoice_suffix(invoice_data):
     # from datetime import datetime
     invoice_suffix_num = [sub['invoiceNo'] for sub in invoice_data.get('ledgerData')]
     invoice_suffix_number = sorted(invoice_suffix_num)
-    logger.info(f"invoice_suffix_number >>>>> {invoice_suffix_number}")
+    logger.info("invoice_suffix_number >>>>> %s", Payload(invoice_suffix_number))
     if len(invoice_suffix_number) == 1:
         logger.info(f"only one data here")
         return True
@@ -2016,7 +2267,7 @@ def check_invoice_suffix(invoice_data):
     for invoice_number in invoice_suffix_number[1:]:
         suffix = remove_numbers(invoice_number)
         if suffix != first_invoice_suffix:
-            logger.info(f"suffix must be start with >>>> {first_invoice_suffix}")
+            logger.info("suffix must be start with >>>> %s", Payload(first_invoice_suffix))
             return False
     return True
 
@@ -2054,12 +2305,15 @@ def duplicate_inv_no(db, invoice_data):
     # from datetime import datetime
     invoice_num = [sub['invoiceNo'] for sub in invoice_data.get('ledgerData')]
     invoice_number = sorted(invoice_num)
+    # without sellerGst the filter would be "seller_gstin is null" and match unrelated invoices
+    if not invoice_data.get('sellerGst'):
+        return False
 
     # first_invoice_suffix = remove_numbers(invoice_number[0])
     for invoice_no in invoice_number:
         # suffix = remove_numbers(invoice_number)
         invoice_obj = db.query(models.Invoice).filter(
-            models.Invoice.extra_data.contains({"seller_gst": invoice_data.get('sellerGst')}),
+            models.Invoice.seller_gstin == invoice_data.get('sellerGst'),
             models.Invoice.invoice_no == invoice_no
         ).first()
         if invoice_obj:
@@ -2133,11 +2387,11 @@ class SpecialCharRemove:
         pattern = re.compile(r'[-_!@#$%^&*()+={}[\]:;"\'|<,>.?/\\\s]')
         invoice_num = [sub['invoiceNo'] for sub in invoice_data.get('ledgerData')]
         cleaned_invoice_num = [pattern.sub('', value) for value in invoice_num]
-        logger.info(f"invoice number ---- {cleaned_invoice_num}")
+        logger.info("invoice number ---- %s", Payload(cleaned_invoice_num))
 
         invoice_obj = (db.query(models.Invoice).filter(
-            models.Invoice.extra_data.contains({"seller_gst": invoice_data.get('sellerGst')}),
-        ).all())
+            models.Invoice.seller_gstin == invoice_data.get('sellerGst'),
+        ).all()) if invoice_data.get('sellerGst') else []
         if invoice_obj:
             invoice = []
             for invoice_num in invoice_obj:
@@ -2152,13 +2406,13 @@ class SpecialCharRemove:
         from collections import Counter
         element_counts = Counter([pattern.sub('', string) for string in invoice])
 
-        logger.info(f"element_counts >>>> {element_counts}")
+        logger.info("element_counts >>>> %s", Payload(element_counts))
 
         # Filter elements with counts greater than 1 (duplicates)
         duplicates = {key: value for key, value in element_counts.items() if value > 1}
         clean_invoice_num = list(set(cleaned_invoice_num))
 
-        logger.info(f"duplicates >>>> {duplicates}")
+        logger.info("duplicates >>>> %s", Payload(duplicates))
 
         # check duplicate from invoice present in db
         check_invoice_number_response = SpecialCharRemove.check_key_in_list(invoice_data, duplicates, clean_invoice_num)
@@ -2230,21 +2484,22 @@ class SpecialCharRemove:
 
         for request_datas in invoice_data.get('ledgerData'):
             invoice_amt_obj = (db.query(models.Invoice).filter(
-                models.Invoice.extra_data.contains({"seller_gst": invoice_data.get('sellerGst')}),
+                models.Invoice.seller_gstin == invoice_data.get('sellerGst'),
                 # models.Invoice.invoice_no == request_datas.get('invoiceNo')
             ).order_by(
                 desc(models.Invoice.id)
-            ).first())
+            ).first()) if invoice_data.get('sellerGst') else None
 
             # new invoice number check with duplicate_data invoice no is present or not
             value_to_match = request_datas.get('invoiceNo')
             for key, value in duplicate_data.items():
                 if key != value_to_match:
-                    logger.info(f"Key '{key}' matches the value {value_to_match}")
+                    logger.info("Key '%s' matches the value %s", Payload(key), Payload(value_to_match))
                     return True
 
             if invoice_amt_obj:
-                logger.info(f"invoice number get{invoice_amt_obj.invoice_no}>>>>{invoice_amt_obj.invoice_amt}")
+                logger.info("invoice number get%s>>>>%s",
+                            Payload(invoice_amt_obj.invoice_no), Payload(invoice_amt_obj.invoice_amt))
                 # check invoice amount with record invoice amount
                 if merchant_obj.id in invoice_amt_obj.extra_data.get('register_merchant_id'):
                     record_amount = invoice_amt_obj.invoice_amt
@@ -2254,10 +2509,12 @@ class SpecialCharRemove:
                     # recorded_inv = pattern.sub('', invoice_amt_obj.invoice_no)
                     # if requested_inv == recorded_inv:
                     if Decimal(request_datas.get('invoiceAmt')) >= record_amount:
-                        logger.info(f"amount >>>> {request_datas.get('invoiceAmt')} >>>> {record_amount}")
+                        logger.info("amount >>>> %s >>>> %s",
+                                    Payload(request_datas.get('invoiceAmt')), Payload(record_amount))
                         return True
                     else:
-                        logger.info(f"amount not correct >>>> {request_datas.get('invoiceAmt')} >>>> {record_amount}")
+                        logger.info("amount not correct >>>> %s >>>> %s",
+                                    Payload(request_datas.get('invoiceAmt')), Payload(record_amount))
                         return False
                     #not match invoice case
                     # else:
@@ -2272,7 +2529,7 @@ def check_bulk_inv_date(data):
     for group in data['groupData']:
         for ledger in group['ledgerData']:
             invoice_dates.append(ledger['invoiceDate'])
-            logger.info(f"bulk invoice date >>>> {invoice_dates}")
+            logger.info("bulk invoice date >>>> %s", Payload(invoice_dates))
 
     dates = [datetime.strptime(date, '%d/%m/%Y') for date in invoice_dates]
     if len(dates) == 1:
@@ -2335,7 +2592,7 @@ class OTPGenerateVerify:
         otp_validation_resp = otp_cache_obj.validate_otp(otp_to_validate=otp)
         if otp_validation_resp.get('responseCode') == 200:
             otp_cache_obj.delete()
-        logger.info(f"********* getting response from verify otp {otp_validation_resp} **********")
+        logger.info("********* getting response from verify otp %s **********", Payload(otp_validation_resp))
         return otp_validation_resp
 
     @staticmethod
@@ -2343,7 +2600,7 @@ class OTPGenerateVerify:
         logger.info("***** Inside the delete OTP *****")
         otp_cache_obj = OTPCache(mobile_no=mobile, reference_id=reference_id)
         otp_del_resp = otp_cache_obj.delete()
-        logger.info(f"********* getting response from delete otp {otp_del_resp} **********")
+        logger.info("********* getting response from delete otp %s **********", Payload(otp_del_resp))
 
 
 
@@ -2463,7 +2720,7 @@ def create_vouchers(db: Session, user_id: str, quantity: int, value: float):
     if voucher_count < 10:
         # Notify the user
         # Here you could add the code to send a notification, e.g., email, SMS, etc.
-        logger.info(f"User {user_id} has fewer than 10 vouchers left.")
+        logger.info("User %s has fewer than 10 vouchers left.", Payload(user_id))
     
     return vouchers
 
@@ -2513,7 +2770,7 @@ def use_vouchers(db: Session, user_id: str, amount: float):
     
     if voucher_count < 10:
         # Notify the user
-        logger.info(f"User {user_id} has fewer than 10 vouchers left.")
+        logger.info("User %s has fewer than 10 vouchers left.", Payload(user_id))
     
     return used_vouchers
 
@@ -1,8 +1,6 @@
-import logging
 import traceback
 
 import redis
-import ast
 import datetime
 import pytz
 import hashlib
@@ -15,11 +13,12 @@ from sqlalchemy import text
 import models
 import utils
 from errors import ErrorCodes
+from log_utils import get_logger, Payload
 from models import LenderInvoiceAssociation
 from utils import InvoiceStatus
 
 # logging.basicConfig('logging.conf')
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 r = redis.Redis(host=dconfig('REDIS_HOST'), port=6379, decode_responses=True)
 
 
@@ -27,7 +26,7 @@ class Registration:
     @staticmethod
     def create_invoice(db, invoice, merchant_obj, financial_year):
         try:
-            logger.info(f"getting invoice data @@@@@@@@@@ {invoice}")
+            logger.info("getting invoice data @@@@@@@@@@ %s", Payload(invoice))
             ledger_create = models.Ledger(
                 merchant_id=merchant_obj.id,
                 invoice_count=len(invoice.get('ledgerData')),
@@ -44,7 +43,7 @@ class Registration:
             db.commit()
             db.refresh(ledger_create)
 
-            logger.info(f"getting ledger created id >>>>>>>>>>>>>>>>>>>.. {ledger_create.id}")
+            logger.info("getting ledger created id >>>>>>>>>>>>>>>>>>>.. %s", Payload(ledger_create.id))
 
             # Add Invoices Get Invoice All Invoice Ids Return
             invoice_id_response = Registration.get_invoice_ids(
@@ -55,16 +54,16 @@ class Registration:
                 financial_year
             )
             # invoice_id_response = invoice_id_unsorted
-            logger.info(f"getting invoice ids @@@@@@@@@@@@@ {invoice_id_response}")
+            logger.info("getting invoice ids @@@@@@@@@@@@@ %s", Payload(invoice_id_response))
 
             # Join Ids with pip and create ledger hash
             con_invoice_ids = '|'.join(invoice_id_response)
             ledger_hash = utils.create_ledger_hash(con_invoice_ids, merchant_obj.merchant_secret)
-            logger.info(f"Ledger Hash Data :: \n {ledger_hash}")
+            logger.info("Ledger Hash Data :: \n %s", Payload(ledger_hash))
 
             # Validate Ledger Hash
             validate_response = Registration.validate_ledger_hash(db, ledger_hash)
-            logger.info(f"getting ************ {validate_response}")
+            logger.info("getting ************ %s", Payload(validate_response))
             if not validate_response:
                 ledger_create.ledger_hash = ledger_hash,
                 db.commit()
@@ -90,127 +89,145 @@ class Registration:
             return return_response
 
         except Exception as e:
-            logger.info(f"getting error >>>>>>>>>>>>>>. {e}")
+            logger.info("getting error >>>>>>>>>>>>>>. %s", Payload(e))
             raise HTTPException(
                 status_code=500,
                 detail=f"getting error while create student {e}"
             )
 
+    @staticmethod
+    def get_gstin_ids(invoice_datas):
+        # None when the party has no GSTIN, stored as NULL so it never matches another invoice
+        seller_id_no = None
+        buyer_id_no = None
+        for seller_data in invoice_datas.get('selleridentifierdata') or []:
+            if not seller_id_no and seller_data.get('sellerIdType') == 'GSTIN':
+                seller_id_no = seller_data.get('sellerIdNo') or None
+
+        for buyer_data in invoice_datas.get('buyeridentifierdata') or []:
+            if not buyer_id_no and buyer_data.get('buyerIdType') == 'GSTIN':
+                buyer_id_no = buyer_data.get('buyerIdNo') or None
+        return seller_id_no, buyer_id_no
+
     @staticmethod
     def get_invoice_ids(db, invoice_data, ledger_obj, merchant_key, financial_year):
-        logger.info(f"getting invoice data >>>>>>>>>>>>>>>>>>>.. {invoice_data}")
-        invoice_ids = []
-        for invoice_datas in invoice_data:
+        logger.info("getting invoice data >>>>>>>>>>>>>>>>>>>.. %s", Payload(invoice_data))
+        if not invoice_data:
+            return []
+
+        rows = []
+        params = {'financial_year': financial_year}
+        for ordinal, invoice_datas in enumerate(invoice_data):
             parsed_date = datetime.datetime.strptime(invoice_datas.get('invoiceDate'), '%d/%m/%Y')
-            logger.info(f"getting parsed date {parsed_date}")
-            # invoices = db.query(models.Invoice).filter(
-            #     models.Invoice.invoice_no == invoice_datas.get('invoiceNo'),
-            #     models.Invoice.invoice_date == invoice_datas.get('invoiceDate'),
-            #     models.Invoice.invoice_amt == invoice_datas.get('invoiceAmt'),
-            #     # models.Invoice.buyer_gst == invoice_datas.get('buyerGST'),
-            #     # models.Invoice.seller_gst == invoice_datas.get('sellerGST')
-            # ).first()
-            seller_id_no = ''
-            buyer_id_no = ''
-            for seller_data in invoice_datas.get('selleridentifierdata'):
-                if not seller_id_no and seller_data.get('sellerIdType') == 'GSTIN':
-                    seller_id_no = seller_data.get('sellerIdNo')
-
-            for buyer_data in invoice_datas.get('buyeridentifierdata'):
-                if not buyer_id_no and buyer_data.get('buyerIdType') == 'GSTIN':
-                    buyer_id_no = buyer_data.get('buyerIdNo')
-
-            logger.info(f"getting seller id ????????????? {seller_id_no}")
-            logger.info(f"getting buyer id ????????????????????? {buyer_id_no}")
-            query = """
-                        select
+            seller_id_no, buyer_id_no = Registration.get_gstin_ids(invoice_datas)
+            rows.append({
+                'invoice_no': invoice_datas.get('invoiceNo'),
+                'seller_id_no': seller_id_no,
+                'buyer_id_no': buyer_id_no,
+                'parsed_date': parsed_date,
+                'invoice_amt': invoice_datas.get('invoiceAmt')
+            })
+            params.update({f"{key}_{ordinal}": value for key, value in rows[-1].items()})
+            params[f"ordinal_{ordinal}"] = ordinal
+
+        # one lookup for every invoice of the ledger, matched back by ordinal
+        values = ",\n".join(
+            f"(:ordinal_{i}, cast(:invoice_no_{i} as text), cast(:seller_id_no_{i} as text), "
+            f"cast(:buyer_id_no_{i} as text), cast(:parsed_date_{i} as timestamptz), "
+            f"cast(:invoice_amt_{i} as numeric))"
+            for i in range(len(rows))
+        )
+        query = f"""
+                    select distinct on (v.ordinal)
+                        v.ordinal,
                         i.id
                     from
-                        invoice i ,
-                        lateral jsonb_to_recordset(extra_data->'buyerIdentifierData') as x("buyerIdNo" text,
-                        "buyerIdType" text),
-                        lateral jsonb_to_recordset(extra_data->'sellerIdentifierData') as y("sellerIdNo" text,
-                        "sellerIdType" text)
+                        (values {values}) as v(ordinal, invoice_no, seller_id_no, buyer_id_no, invoice_date, invoice_amt)
+                        join invoice i on i.invoice_no = v.invoice_no
+                        and i.seller_gstin = v.seller_id_no
+                        and i.buyer_gstin = v.buyer_id_no
+                        and i.invoice_date = v.invoice_date
+                        and i.invoice_amt = v.invoice_amt
                     where
-                        i.invoice_no = :invoice_no
-                        and y."sellerIdNo" = :seller_id_no
-                        and x."buyerIdNo" = :buyer_id_no'
-                        and x."buyerIdType" = 'GSTN'
-                        and y."sellerIdType" = 'GSTIN'
-                        and i.invoice_date = :parsed_date
-                        and i.invoice_amt = :invoice_amt 
-                        and (i.financial_year = :financial_year 
-                        or i.time_created >= NOW() - INTERVAL '180 days' AND i.invoice_date::timestamp <= NOW());
-                       """
-            invoices = db.execute(text(query),
-                                  [{'invoice_no': invoice_datas.get('invoiceNo'),
-                                    'seller_id_no': seller_id_no,
-                                    'buyer_id_no': buyer_id_no,
-                                    'parsed_date': parsed_date,
-                                    'invoice_amt': invoice_datas.get('invoiceAmt'),
-                                    'financial_year': financial_year
-                                    }]
-                                  ).first()
-            logger.info(f"getting invoices $$$$$$$$$$$$$$$$$$$$ {invoices}")
-            if not invoices:
-                logger.info(f">>>>>>>>>>>>>>>>> getting inside if means invoice not found <<<<<<<<<<<<< ")
-                extra_data = {
+                        v.seller_id_no <> '' and v.buyer_id_no <> ''
+                        and (i.financial_year = :financial_year
+                        or i.created_at >= NOW() - INTERVAL '180 days' AND i.invoice_date::timestamp <= NOW())
+                    order by v.ordinal, i.id;
+                """
+        found = {row.ordinal: row.id for row in db.execute(text(query), [params]).all()}
+        logger.info("getting existing invoices $$$$$$$$$$$$$$$$$$$$ %s", Payload(found))
+
+        # repeated invoices inside the same ledger are registered once, invoices without both GSTINs never match
+        first_ordinal = {}
+        new_invoices = []
+        for ordinal, (invoice_datas, row) in enumerate(zip(invoice_data, rows)):
+            if ordinal in found:
+                continue
+            key = (row['invoice_no'], row['seller_id_no'], row['buyer_id_no'], row['parsed_date'],
+                   str(row['invoice_amt']))
+            if not (row['seller_id_no'] and row['buyer_id_no']):
+                key = ordinal
+            if key in first_ordinal:
+                continue
+            first_ordinal[key] = ordinal
+            new_invoices.append({
+                'invoice_no': row['invoice_no'],
+                'invoice_date': row['parsed_date'],
+                'invoice_amt': row['invoice_amt'],
+                'seller_gstin': row['seller_id_no'],
+                'buyer_gstin': row['buyer_id_no'],
+                'invoice_hash': utils.create_signature(invoice_datas, merchant_key),
+                'financial_year': financial_year,
+                'extra_data': {
                     "sellerIdentifierData": invoice_datas.get('selleridentifierdata'),
                     "buyerIdentifierData": invoice_datas.get('buyeridentifierdata')
                 }
-                invoice_hash = utils.create_signature(invoice_datas, merchant_key)
-                invoice_create = models.Invoice(
-                    invoice_no=invoice_datas.get('invoiceNo'),
-                    invoice_date=parsed_date,
-                    invoice_amt=invoice_datas.get('invoiceAmt'),
-                    invoice_hash=invoice_hash,
-                    financial_year=financial_year,
-                    extra_data=extra_data
-                )
-                db.add(invoice_create)
-                db.commit()
-                db.refresh(invoice_create)
-                invoice_ids.append(str(invoice_create.id))
-
-                invoice_create.ledger.append(ledger_obj)
+            })
+
+        if new_invoices:
+            invoice_table = models.Invoice.__table__
+            created = db.execute(
+                invoice_table.insert().returning(invoice_table.c.id, sort_by_parameter_order=True),
+                new_invoices
+            ).scalars().all()
+            for ordinal, invoice_id in zip(first_ordinal.values(), created):
+                found[ordinal] = invoice_id
+            logger.info(">>>>>>>>>>>>>>>>> created invoices <<<<<<<<<<<<< %s", Payload(created))
 
-                db.commit()
-                db.refresh(invoice_create)
-            else:
-                logger.info(f"getting inside else means invoice found >>>>>>>>>>>>>> <<<<<<<<<<<<< {invoices.id}")
-                invoice_query = db.query(models.Invoice).filter(
-                    models.Invoice.id == invoices.id
-                ).first()
-
-                query = """
-                            select
-                                 ila.*
-                            from
-                                invoice_ledger_association ila
-                            where
-                                ila.ledger_id = :ledger_id and ila.invoice_id = :inv_id
-                            ;
-                        """
-                invoice_ledger_data = db.execute(text(query),
-                                                 [{'ledger_id': ledger_obj.id, 'inv_id': invoices.id}]
-                                                 ).first()
-                if not invoice_ledger_data:
-                    invoice_query.ledger.append(ledger_obj)
-                    db.commit()
-                    db.refresh(invoice_query)
+        invoice_ids = []
+        for ordinal, row in enumerate(rows):
+            if ordinal not in found:
+                key = (row['invoice_no'], row['seller_id_no'], row['buyer_id_no'], row['parsed_date'],
+                       str(row['invoice_amt']))
+                if not (row['seller_id_no'] and row['buyer_id_no']):
+                    key = ordinal
+                found[ordinal] = found[first_ordinal[key]]
+            invoice_ids.append(found[ordinal])
 
-                logger.info(f"getting {type(invoices.id)}")
-                invoice_ids.append(str(invoices.id))
+        query = """
+                    insert into invoice_ledger_association (invoice_id, ledger_id)
+                    select
+                        distinct v.invoice_id, cast(:ledger_id as integer)
+                    from
+                        unnest(cast(:invoice_ids as integer[])) as v(invoice_id)
+                    where
+                        not exists (
+                            select 1 from invoice_ledger_association ila
+                            where ila.ledger_id = :ledger_id and ila.invoice_id = v.invoice_id
+                        );
+                """
+        db.execute(text(query), [{'ledger_id': ledger_obj.id, 'invoice_ids': invoice_ids}])
+        db.commit()
 
-        return invoice_ids
+        return [str(invoice_id) for invoice_id in invoice_ids]
 
     @staticmethod
     def validate_ledger_hash(db, ledger_hash):
-        logger.info(f"getting leder hash $$$$$$$$$$$$$ {ledger_hash}")
+        logger.info("getting leder hash $$$$$$$$$$$$$ %s", Payload(ledger_hash))
         ledger_obj = db.query(models.Ledger).filter(
             models.Ledger.ledger_hash == ledger_hash
         ).first()
-        logger.info(f"getting ledger hash {ledger_obj}")
+        logger.info("getting ledger hash %s", Payload(ledger_obj))
         if ledger_obj:
             return True
         else:
@@ -222,7 +239,7 @@ class StatusCheck:
     def ledger_status(db, ledger_parm, merchant_obj):
         try:
             check_response = check_ledger(db, ledger_parm.ledgerNo, ledger_parm.requestId, merchant_obj.id)
-            logger.info(f"getting ledger data check response {check_response}")
+            logger.info("getting ledger data check response %s", Payload(check_response))
             if check_response.get('code') == 200:
 
                 query = """
@@ -238,7 +255,7 @@ class StatusCheck:
                                 l.ledger_id = :ledger_no
                             """
                 invoice_status = db.execute(text(query), [{'ledger_no': ledger_parm.ledgerNo}]).first()
-                logger.info(f"getting all status >>>>>>>>>>>>>>>>. {invoice_status[0]}")
+                logger.info("getting all status >>>>>>>>>>>>>>>>. %s", Payload(invoice_status[0]))
                 # status = []
                 # for invoice_status in all_data:
                 #     status.append(invoice_status.fund_status)
@@ -267,107 +284,47 @@ class StatusCheck:
 
 
 class Financing:
+    @staticmethod
+    def ledger_invoice_ids(db, ledger_no):
+        return db.execute(text("""
+            select ila.invoice_id
+            from invoice_ledger_association ila
+            inner join ledger l on ila.ledger_id = l.id
+            where l.ledger_id = :ledger_no
+        """), [{'ledger_no': ledger_no}]).scalars().all()
+
     @staticmethod
     def check_invoice(db, request_data, financial_year):
         logger.info(f" >>>>>>>>>>>>>> getting inside check invoice >>>>>>>>>>>>>>>>> ")
         json_request = jsonable_encoder(request_data)
-        query = """
-                                select
-                                array_agg(i.fund_status) as fund_stat, count(i.id) as invoice_count
-                            from
-                                invoice_ledger_association ila
-                            inner join ledger l on
-                                ila.ledger_id = l.id
-                            inner join invoice i on
-                                ila.invoice_id = i.id
-                            where
-                                l.ledger_id = :ledger_no
-                            """
-        invoice_data_status = db.execute(text(query), [{'ledger_no': json_request.get('ledgerNo')}]).first()
-
-        logger.info(f" >>>>>>>>> ledger request length &&&& {len(json_request.get('ledgerData'))} >>>>>>>> ")
-        logger.info(f" >>>>>>>>>>>>>> getting invoice count for ledger &&&&& {invoice_data_status.invoice_count}>>>>>>>>>>>>>>>>> ")
-        if len(json_request.get('ledgerData')) == invoice_data_status.invoice_count:
-            # all_datas = db.query(
-            #     models.Invoice
-            # ).join(models.Ledger).where(
-            #     models.Invoice.ledger_id == json_request.get('ledgerNo')
-            # ).all()
-
-            query = """
-                        select
-                        array_agg(i.fund_status) as fund_stat
-                    from
-                        invoice_ledger_association ila
-                    inner join ledger l on
-                        ila.ledger_id = l.id
-                    inner join invoice i on
-                        ila.invoice_id = i.id
-                    where
-                        l.ledger_id = :ledger_no
-                    ;
-                    """
-            invoice_status = db.execute(text(query), [{'ledger_no': json_request.get('ledgerNo')}]).first()
-            logger.info(f"getting all status >>>>>>>>>>>>>>>>. {invoice_status.fund_stat}")
-
-            # print(f"getting all_data >>>>>>>>>>>>>>>>>>>> {all_datas}")
-            # status = []
-            for ledger_data in json_request.get('ledgerData'):
-                logger.info(f"getting data >>>>>>>>>>>. {json_request.get('ledgerNo')} >>>>>>>>>>> "
-                            f"{ledger_data.get('invoiceNo')} >>>>>>>>>>>>>. {ledger_data.get('fundingAmt')}")
-                # all_data = db.query(
-                #     models.Invoice
-                # ).filter(
-                #     models.Invoice.ledger_id == json_request.get('ledgerNo'),
-                #     models.Invoice.invoice_no == ledger_data.get('invoiceNo'),
-                #     models.Invoice.invoice_amt == ledger_data.get('fundingAmt')
-                # ).first()
-                query = """
-                            select
-                                i.*
-                            from
-                                invoice_ledger_association ila
-                            inner join ledger l on
-                                ila.ledger_id = l.id
-                            inner join invoice i on
-                                ila.invoice_id = i.id
-                            where
-                                l.ledger_id  = :ledger_no and
-                                i.invoice_no = :invoice_no and 
-                                i.invoice_amt = :funding_amt and 
-                                (i.financial_year = :financial_year 
-                                or i.time_created >= NOW() - INTERVAL '180 days' AND i.invoice_date <= NOW());
-                        """
-
-                invoice_data = db.execute(text(query),
-                                          [{'ledger_no': json_request.get('ledgerNo'),
-                                            'invoice_no': ledger_data.get('invoiceNo'),
-                                            'funding_amt': ledger_data.get('fundingAmt'),
-                                            'financial_year': financial_year
-                                            }]
-                                          ).first()
-                logger.info(f" >>>>> getting all data for {ledger_data.get('invoiceNo')} >>>> {invoice_data}")
-                if not invoice_data:
-                    return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1011)}
-
-            # for invoice_status in all_datas:
-            #     status.append(invoice_status.fund_status)
-
-            if True in invoice_data_status[0]:
-                return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1004)}
-
-            for ledger_data in json_request.get('ledgerData'):
-                # all_datas = db.query(
-                #     models.Invoice
-                # ).filter(
-                #     models.Invoice.ledger_id == json_request.get('ledgerNo'),
-                #     models.Invoice.invoice_no == ledger_data.get('invoiceNo'),
-                #     models.Invoice.invoice_amt == ledger_data.get('fundingAmt'),
-                # ).first()
+        ledger_data = json_request.get('ledgerData') or []
+        logger.info(" >>>>>>>>> ledger request length &&&& %s >>>>>>>> ", Payload(len(ledger_data)))
+        if not ledger_data:
+            return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1010)}
 
-                query = """
+        params = {'ledger_no': json_request.get('ledgerNo'), 'financial_year': financial_year}
+        for ordinal, data in enumerate(ledger_data):
+            params.update({
+                f"ordinal_{ordinal}": ordinal,
+                f"invoice_no_{ordinal}": data.get('invoiceNo'),
+                f"funding_amt_{ordinal}": data.get('fundingAmt')
+            })
+        values = ",\n".join(
+            f"(:ordinal_{i}, cast(:invoice_no_{i} as text), cast(:funding_amt_{i} as numeric), "
+            f"cast(:funding_amt_{i} as varchar))"
+            for i in range(len(ledger_data))
+        )
+        # the ledger invoices stay locked until the funding update commits,
+        # a concurrent financing request for the same ledger waits here and then sees fund_status
+        query = f"""
+                    with ledger_invoice as (
                         select
-                            i.*
+                            i.id,
+                            i.invoice_no,
+                            i.invoice_amt,
+                            i.fund_status,
+                            (i.financial_year = :financial_year
+                            or i.created_at >= NOW() - INTERVAL '180 days' AND i.invoice_date <= NOW()) as in_period
                         from
                             invoice_ledger_association ila
                         inner join ledger l on
@@ -375,44 +332,77 @@ class Financing:
                         inner join invoice i on
                             ila.invoice_id = i.id
                         where
-                            l.ledger_id  = :ledger_no and
-                            i.invoice_no = :invoice_no and 
-                            i.invoice_amt = :funding_amt
-                        ;
-                        """
-
-                invoice_data = db.execute(text(query),
-                                          [{'ledger_no': json_request.get('ledgerNo'),
-                                            'invoice_no': ledger_data.get('invoiceNo'),
-                                            'funding_amt': ledger_data.get('fundingAmt')
-                                            }]
-                                          ).first()
-                logger.info(f"getting id {invoice_data.id}")
-                fund_status = True
-                update_query = "UPDATE invoice SET fund_status = :fund_status, funded_amt = :funding_amt WHERE id = :inv_id;"
-                print(update_query)
-                db.execute(text(update_query),
-                           [{'fund_status': fund_status,
-                             'funding_amt': ledger_data.get('fundingAmt'),
-                             'inv_id': invoice_data.id
-                             }]
-                           )
-                db.commit()
-                # all_datas.fund_status = True
-                # all_datas.funded_amt = ledger_data.get('fundingAmt'),
-                # all_datas.extra_data = all_datas.extra_data.update({"financeData": ledger_data})
-                # db.commit()
-                # db.refresh(all_data)
-
-            return {"code": 200}
-        else:
+                            l.ledger_id = :ledger_no
+                        for update of i
+                    )
+                    select distinct on (v.ordinal)
+                        v.ordinal,
+                        v.funded_amt,
+                        li.id,
+                        (select count(*) from ledger_invoice) as invoice_count,
+                        (select coalesce(bool_or(fund_status), false) from ledger_invoice) as is_funded
+                    from
+                        (values {values}) as v(ordinal, invoice_no, funding_amt, funded_amt)
+                    left join ledger_invoice li on
+                        li.invoice_no = v.invoice_no
+                        and li.invoice_amt = v.funding_amt
+                        and li.in_period
+                    order by v.ordinal, li.id;
+                """
+        invoice_rows = db.execute(text(query), [params]).all()
+        invoice_count = invoice_rows[0].invoice_count
+        logger.info(" >>>>>>>>>>>>>> getting invoice count for ledger &&&&& %s>>>>>>>>>>>>>>>>> ",
+                    Payload(invoice_count))
+        if len(ledger_data) != invoice_count:
+            db.rollback()
             return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1010)}
 
+        missing = [ledger_data[row.ordinal].get('invoiceNo') for row in invoice_rows if row.id is None]
+        if missing:
+            logger.info(" >>>>> invoices not found in ledger %s >>>> %s",
+                        Payload(json_request.get('ledgerNo')), Payload(missing))
+            db.rollback()
+            return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1011)}
+
+        if invoice_rows[0].is_funded:
+            db.rollback()
+            return {"requestId": json_request.get('requestId'), **ErrorCodes.get_error_response(1004)}
+
+        update_params = {}
+        for row in invoice_rows:
+            update_params.update({f"inv_id_{row.ordinal}": row.id, f"funding_amt_{row.ordinal}": row.funded_amt})
+        update_values = ", ".join(
+            f"(:inv_id_{row.ordinal}, cast(:funding_amt_{row.ordinal} as varchar))" for row in invoice_rows
+        )
+        update_query = f"""
+                    update invoice i
+                    set
+                        fund_status = true,
+                        funded_amt = v.funded_amt
+                    from
+                        (values {update_values}) as v(id, funded_amt)
+                    where
+                        i.id = v.id;
+                """
+        db.execute(text(update_query), [update_params])
+        db.commit()
+        return {"code": 200}
+
     @staticmethod
     def fund_ledger(db, ledger_parm, merchant_obj, invoices_list, financial_year):
+        # invoices_list (the request's invoice numbers) stays in the signature for the callers, claims go by invoice id
+        claimed_invoices = []
         try:
             check_response = check_ledger(db, ledger_parm.ledgerNo, ledger_parm.requestId, merchant_obj.id)
             if check_response.get('code') == 200:
+                # the ledger's invoices are held until this request is done, a concurrent fund or cancel gets 1057
+                ledger_invoice_ids = Financing.ledger_invoice_ids(db, ledger_parm.ledgerNo)
+                if utils.add_cached_invoice_list(ledger_invoice_ids):
+                    return_response = {"requestId": ledger_parm.requestId, **ErrorCodes.get_error_response(1057)}
+                    response_hash = utils.create_ledger_hash(return_response, merchant_obj.merchant_secret)
+                    return_response.update({"signature": response_hash})
+                    return return_response
+                claimed_invoices = ledger_invoice_ids
                 check_invoice_response = Financing.check_invoice(db, ledger_parm, financial_year)
                 if check_invoice_response.get('code') == 200:
                     json_request = jsonable_encoder(ledger_parm)
@@ -446,59 +436,45 @@ class Financing:
                     return_response = {"requestId": ledger_parm.requestId, **ErrorCodes.get_error_response(1013)}
                     response_hash = utils.create_ledger_hash(return_response, merchant_obj.merchant_secret)
                     return_response.update({"signature": response_hash})
-                    invoice_cache = r.get('invoices')
-                    ast.literal_eval(invoice_cache)
-                    new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-                    r.set('invoices', str(new_invoice))
-                    invoice_cache = r.get('invoices')
-                    logger.info(f"final invoice caches>>>>>>>>>>>. {invoice_cache}")
                     return return_response
                 else:
                     response_hash = utils.create_ledger_hash(check_invoice_response, merchant_obj.merchant_secret)
                     check_invoice_response.update({"signature": response_hash})
-                    invoice_cache = r.get('invoices')
-                    ast.literal_eval(invoice_cache)
-                    new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-                    r.set('invoices', str(new_invoice))
-                    invoice_cache = r.get('invoices')
-                    logger.info(f"final invoice caches>>>>>>>>>>>. {invoice_cache}")
                     return check_invoice_response
             else:
                 response_hash = utils.create_ledger_hash(check_response, merchant_obj.merchant_secret)
                 check_response.update({"signature": response_hash})
-                invoice_cache = r.get('invoices')
-                ast.literal_eval(invoice_cache)
-                new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-                r.set('invoices', str(new_invoice))
-                invoice_cache = r.get('invoices')
-                logger.info(f"final invoice caches>>>>>>>>>>>. {invoice_cache}")
                 return check_response
 
         except Exception as e:
-            invoice_cache = r.get('invoices')
-            ast.literal_eval(invoice_cache)
-            new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in invoices_list]
-            r.set('invoices', str(new_invoice))
             logger.error(f"getting error while create student {e}")
+        finally:
+            # only what this request claimed, releasing anything else would unlock another request's invoices
+            if claimed_invoices:
+                utils.update_cached_invoice_list(claimed_invoices)
 
 
 class CancelLedger:
     @staticmethod
     def cancel(db, ledger_parm, merchant_obj):
+        claimed_invoices = []
         try:
             check_ledger_response = check_ledger(db, ledger_parm.ledgerNo, ledger_parm.requestId, merchant_obj.id)
             logger.info(check_ledger_response.get('code'))
             if check_ledger_response.get('code') == 200:
-                logger.info(f"getting if condition {check_ledger_response}")
+                logger.info("getting if condition %s", Payload(check_ledger_response))
                 all_fund_status, all_inv_list, live_inv_ids, old_inv_ids = CancelLedger.cancel_ledger(db, ledger_parm.ledgerNo)
-                logger.info(f"getting fund status ///////// {all_fund_status} invoice no ////////// {all_inv_list}")
+                logger.info("getting fund status ///////// %s invoice no ////////// %s",
+                            Payload(all_fund_status), Payload(all_inv_list))
                 if True in all_fund_status:
-                    invoice_cache = r.get('invoices')
-                    ast.literal_eval(invoice_cache)
-                    new_invoice = [i for i in ast.literal_eval(invoice_cache) if i not in all_inv_list]
-                    r.set('invoices', str(new_invoice))
-                    invoice_cache = r.get('invoices')
-                    logger.info(f"final invoice caches>>>>>>>>>>>. {invoice_cache}")
+                    # claimed by id, old_invoice keeps ids apart from invoice
+                    ledger_invoice_ids = list(live_inv_ids) + list(old_inv_ids)
+                    if utils.add_cached_invoice_list(ledger_invoice_ids):
+                        return_response = {"requestId": ledger_parm.requestId, **ErrorCodes.get_error_response(1057)}
+                        response_hash = utils.create_ledger_hash(return_response, merchant_obj.merchant_secret)
+                        return_response.update({"signature": response_hash})
+                        return return_response
+                    claimed_invoices = ledger_invoice_ids
                     extra_data = dict({"cancellationMessage": ledger_parm.cancellationReason})
                     # update_query = (
                     #     f"UPDATE invoice SET extra_data = extra_data || '{{\"financierMerchantId\": \"\"}}'::jsonb, "
@@ -628,7 +604,7 @@ class CancelLedger:
                                         db.commit()
                                         db.refresh(len_inv_ass_obj)
                                 except Exception as e:
-                                    logger.info(f"LenderInvoiceAssociation :: {e}")
+                                    logger.info("LenderInvoiceAssociation :: %s", Payload(e))
                                     pass
 
                                 inv_obj.fund_status = False
@@ -661,14 +637,12 @@ class CancelLedger:
                     ledger_obj = db.query(models.Ledger).filter(models.Ledger.ledger_id == ledger_parm.ledgerNo).first()
                     ledger_obj.extra_data = extra_data
                     ledger_obj.status = InvoiceStatus.NON_FUNDED
-                    logger.info(f"getting data >>>>>>>>>>>>>>>. {ledger_obj.id}")
+                    logger.info("getting data >>>>>>>>>>>>>>>. %s", Payload(ledger_obj.id))
                     db.commit()
                     db.refresh(ledger_obj)
                     return_response = {"requestId": ledger_parm.requestId, **ErrorCodes.get_error_response(200)}
                     response_hash = utils.create_ledger_hash(return_response, merchant_obj.merchant_secret)
                     return_response.update({"signature": response_hash})
-                    invoice_cache = r.get('invoices')
-                    logger.info(f"final invoice caches>>>>>>>>>>>. {invoice_cache}")
                     return return_response
                 else:
                     return_response = {"requestId": ledger_parm.requestId, **ErrorCodes.get_error_response(1006)}
@@ -681,11 +655,14 @@ class CancelLedger:
                 return check_ledger_response
         except Exception as e:
             print(f"getting error while create student {e}")
-            logger.info(f"CancelLedger cancel :: {traceback.format_exc()}")
+            logger.info("CancelLedger cancel :: %s", Payload(traceback.format_exc()))
+        finally:
+            if claimed_invoices:
+                utils.update_cached_invoice_list(claimed_invoices)
 
     @staticmethod
     def cancel_ledger(db, ledger_id):
-        logger.info(f"getting ledger check {ledger_id}")
+        logger.info("getting ledger check %s", Payload(ledger_id))
 
         query = """
             select 
@@ -717,7 +694,7 @@ class CancelLedger:
 
     @staticmethod
     def cancel_ledger1(db, ledger_id):
-        logger.info(f"getting ledger check {ledger_id}")
+        logger.info("getting ledger check %s", Payload(ledger_id))
         # all_data = db.query(
         #     models.Invoice
         # ).join(models.Ledger).where(
@@ -754,7 +731,7 @@ class CancelLedger:
 
 
 def check_ledger(db, ledger_id, request_id, merchant_id, grouping_id=None):
-    logger.info(f"getting ledger check {ledger_id}")
+    logger.info("getting ledger check %s", Payload(ledger_id))
     if grouping_id:
         ledger_data = db.query(models.Ledger).filter(
             models.Ledger.ledger_id == ledger_id,
@@ -771,7 +748,7 @@ def check_ledger(db, ledger_id, request_id, merchant_id, grouping_id=None):
             models.Ledger.ledger_id == ledger_id,
             models.Ledger.merchant_id == merchant_id
         ).first()
-        logger.info(f"getting ledger data {ledger_data}")
+        logger.info("getting ledger data %s", Payload(ledger_data))
         if ledger_data:
             return {'ledgerStatus': ledger_data.status, **ErrorCodes.get_error_response(200)}
         else:
@@ -801,7 +778,7 @@ def webhook_data(db, ledger_parm):
                     l.ledger_id  = :ledger_no; 
             """
     invoice_obj = db.execute(text(query), [{'ledger_no': ledger_parm.ledgerNo}]).first()
-    logger.info(f"getting response >>>>>>>>>>>>>>>> {invoice_obj}")
+    logger.info("getting response >>>>>>>>>>>>>>>> %s", Payload(invoice_obj))
     return {"requestId": ledger_parm.requestId,
             "ledgerNo": ledger_parm.ledgerNo,
             "ledgerData": invoice_obj.webhook_data if invoice_obj.webhook_data else []
@@ -810,47 +787,28 @@ def webhook_data(db, ledger_parm):
 
 def create_request_log(db, request_id, request_data, response_data, flag, api_url='', merchant_key=None):
     try:
-        # merchant_details = db.query(models.MerchantDetails).filter(models.MerchantDetails.merchant_key == merchant_key).first()
-        # if not merchant_details:
-        #     return {
-        #         "requestId": request_data.get('requestId'),
-        #         **ErrorCodes.get_error_response(1002)
-        #     }
-        # merchant_id_obj = merchant_details.id if merchant_details.id else ''
-        # merchant_id = str(merchant_id_obj).zfill(4)
-        # logger.info(f"merchant id create request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-        api_request_obj = db.query(
-            models.APIRequestLog
-        ).filter(
-            models.APIRequestLog.request_id == request_id
-        ).first()
-        logger.info(f"getting data iof api request log ################### {api_request_obj}")
         if flag == 'request':
-            if api_request_obj:
-                return {**ErrorCodes.get_error_response(1009)}
-            merchant_details = db.query(models.MerchantDetails).filter(models.MerchantDetails.merchant_key == merchant_key).first()
+            merchant_details = utils.MerchantCache.get(db, merchant_key)
             if not merchant_details:
                 return {
                     "requestId": request_data.get('requestId'),
                     **ErrorCodes.get_error_response(1002)
                 }
             merchant_id = merchant_details.id if merchant_details else ''
-            logger.info(f"merchant id create request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-            request_created = models.APIRequestLog(
+            logger.info("merchant id create request log >>>>>>>>>>>>>>>>>>>>>> %s", Payload(merchant_id))
+            if not utils.RequestLogWriter.insert(
+                db, models.APIRequestLog,
                 request_id=request_data.get('requestId'),
                 request_data=request_data,
                 api_url=api_url,
                 merchant_id=merchant_id
-            )
-            db.add(request_created)
-            db.commit()
-            db.refresh(request_created)
+            ):
+                return {**ErrorCodes.get_error_response(1009)}
             return {**ErrorCodes.get_error_response(200)}
         else:
-            api_request_obj.response_data = response_data
-            api_request_obj.updated_at = datetime.datetime.now()
-            db.commit()
-            db.refresh(api_request_obj)
+            utils.RequestLogWriter.update(
+                models.APIRequestLog, request_id, response_data=response_data, updated_at=datetime.datetime.now()
+            )
     except Exception as e:
         logger.error(f"getting error while creating request log >>>>>>>>>>>>>>> {e}")
         return {**ErrorCodes.get_error_response(500)}
@@ -859,38 +817,20 @@ def create_request_log(db, request_id, request_data, response_data, flag, api_ur
 # sftp user info requestlog
 def create_request_log_sftpuser(db, request_id, request_data, response_data, flag, api_url='', merchant_key=None):
     try:
-        api_request_obj = db.query(
-            models.APIRequestLog
-        ).filter(
-            models.APIRequestLog.request_id == request_id
-        ).first()
-        logger.info(f"getting data iof api request log ################### {api_request_obj}")
         if flag == 'request':
-            if api_request_obj:
-                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
-            # merchant_details = merchant_key
-            # if not merchant_details:
-            #     return {
-            #         "requestId": request_data.get('requestId'),
-            #         **ErrorCodes.get_error_response(1002)
-            #     }
-            # merchant_id = merchant_details
-            # logger.info(f"merchant_id request log >>>>>>>>>>>>>>>>>>>>>> {merchant_id}")
-            request_created = models.APIRequestLog(
+            if not utils.RequestLogWriter.insert(
+                db, models.APIRequestLog,
                 request_id=request_data.get('requestId'),
                 request_data=request_data,
                 api_url=api_url,
                 merchant_id=merchant_key
-            )
-            db.add(request_created)
-            db.commit()
-            db.refresh(request_created)
+            ):
+                return {"requestId": request_id, **ErrorCodes.get_error_response(1009)}
             return {"requestId": request_id, **ErrorCodes.get_error_response(200)}
         else:
-            api_request_obj.response_data = response_data
-            api_request_obj.updated_at = datetime.datetime.now()
-            db.commit()
-            db.refresh(api_request_obj)
+            utils.RequestLogWriter.update(
+                models.APIRequestLog, request_id, response_data=response_data, updated_at=datetime.datetime.now()
+            )
     except Exception as e:
         logger.error(f"getting error while creating request log >>>>>>>>>>>>>>> {e}")
         return {**ErrorCodes.get_error_response(500)}
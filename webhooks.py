@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from decouple import config as dconfig
+from sqlalchemy import text
+
+from database import get_db
+from log_utils import get_logger, Payload
+
+logger = get_logger(__name__)
+
+r = redis.Redis(host=dconfig('REDIS_HOST'), port=dconfig('REDIS_PORT', default=6379, cast=int), decode_responses=True)
+
+# connect / read timeout of a single webhook attempt
+WEBHOOK_CONNECT_TIMEOUT = dconfig('WEBHOOK_CONNECT_TIMEOUT', default=5, cast=float)
+WEBHOOK_READ_TIMEOUT = dconfig('WEBHOOK_READ_TIMEOUT', default=30, cast=float)
+# keep-alive connections kept per merchant host in every worker process
+WEBHOOK_POOL_SIZE = dconfig('WEBHOOK_POOL_SIZE', default=10, cast=int)
+# deliveries in flight per merchant across all workers, and how often a delivery waits for a free slot
+WEBHOOK_MERCHANT_CONCURRENCY = dconfig('WEBHOOK_MERCHANT_CONCURRENCY', default=4, cast=int)
+WEBHOOK_MAX_THROTTLED = dconfig('WEBHOOK_MAX_THROTTLED', default=50, cast=int)
+# attempts before a webhook is marked Failed, retries wait a random 0..min(max, base * 2 ** attempt) seconds
+WEBHOOK_MAX_ATTEMPTS = dconfig('WEBHOOK_MAX_ATTEMPTS', default=6, cast=int)
+WEBHOOK_BACKOFF_BASE = dconfig('WEBHOOK_BACKOFF_BASE', default=2, cast=float)
+WEBHOOK_BACKOFF_MAX = dconfig('WEBHOOK_BACKOFF_MAX', default=300, cast=float)
+# a host is skipped for WEBHOOK_CIRCUIT_RESET seconds after WEBHOOK_CIRCUIT_FAILURES failures in a row
+WEBHOOK_CIRCUIT_FAILURES = dconfig('WEBHOOK_CIRCUIT_FAILURES', default=5, cast=int)
+WEBHOOK_CIRCUIT_RESET = dconfig('WEBHOOK_CIRCUIT_RESET', default=60, cast=int)
+# webhook_status updates are buffered in redis and written WEBHOOK_STATUS_BATCH_SIZE at a time
+WEBHOOK_STATUS_BATCH_SIZE = dconfig('WEBHOOK_STATUS_BATCH_SIZE', default=200, cast=int)
+WEBHOOK_STATUS_KEY = 'webhook_status:pending'
+# "celery" sends every webhook from its own task, "async" queues them for run_async_worker
+WEBHOOK_WORKER_MODE = dconfig('WEBHOOK_WORKER_MODE', default='celery')
+# deliveries the async worker keeps in flight, and claims from redis at most per round trip
+WEBHOOK_ASYNC_CONCURRENCY = dconfig('WEBHOOK_ASYNC_CONCURRENCY', default=200, cast=int)
+WEBHOOK_ASYNC_BATCH_SIZE = dconfig('WEBHOOK_ASYNC_BATCH_SIZE', default=500, cast=int)
+WEBHOOK_ASYNC_POLL_INTERVAL = dconfig('WEBHOOK_ASYNC_POLL_INTERVAL', default=1, cast=float)
+# a claimed delivery goes back to the queue if its worker has not finished it within the lease
+WEBHOOK_ASYNC_LEASE = dconfig('WEBHOOK_ASYNC_LEASE', default=300, cast=int)
+# merchant webhook urls are kept by the async worker this long before they are looked up again
+WEBHOOK_ASYNC_URL_TTL = dconfig('WEBHOOK_ASYNC_URL_TTL', default=60, cast=int)
+WEBHOOK_QUEUE_KEY = 'webhook_deliveries'
+
+# retried responses, every other non 2xx status is a permanent failure
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class WebhookDispatcher:
+    SENT = 'Sent'
+    FAILED = 'Failed'
+    RETRY = 'Retry'
+    # no slot free for the merchant, retried without using up an attempt (up to WEBHOOK_MAX_THROTTLED times)
+    THROTTLED = 'Throttled'
+
+    # one sorted set of slot holders per merchant scored by expiry, a holder that died drops out on its own
+    ACQUIRE_SLOT = r.register_script("""
+        redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+        if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[2]) then
+            return 0
+        end
+        redis.call('zadd', KEYS[1], ARGV[3], ARGV[4])
+        redis.call('expire', KEYS[1], ARGV[5])
+        return 1
+    """)
+
+    sessions = {}
+    pid = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    @staticmethod
+    def session(host):
+        # one keep-alive pool per merchant host, a forked worker must not reuse the parent's sockets
+        with WebhookDispatcher.lock:
+            if WebhookDispatcher.pid != os.getpid():
+                WebhookDispatcher.sessions = {}
+                WebhookDispatcher.pid = os.getpid()
+            session = WebhookDispatcher.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEBHOOK_POOL_SIZE, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                WebhookDispatcher.sessions[host] = session
+            return session
+
+    @staticmethod
+    def backoff(attempt):
+        return random.uniform(0, min(WEBHOOK_BACKOFF_MAX, WEBHOOK_BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def acquire_slot(merchant_key):
+        # returns the holder token, or None when the merchant has no free slot
+        now = time.time()
+        lease = int(WEBHOOK_CONNECT_TIMEOUT + WEBHOOK_READ_TIMEOUT) * 2
+        token = uuid.uuid4().hex
+        acquired = WebhookDispatcher.ACQUIRE_SLOT(
+            keys=[f"webhook_slots:{merchant_key}"],
+            args=[now, WEBHOOK_MERCHANT_CONCURRENCY, now + lease, token, lease]
+        )
+        return token if acquired else None
+
+    @staticmethod
+    def release_slot(merchant_key, token):
+        r.zrem(f"webhook_slots:{merchant_key}", token)
+
+    @staticmethod
+    def retry_or_fail(attempt, countdown):
+        # every retried path uses up an attempt, a dead host ends up Failed like any other
+        if attempt + 1 < WEBHOOK_MAX_ATTEMPTS:
+            return WebhookDispatcher.RETRY, countdown
+        return WebhookDispatcher.FAILED, 0
+
+    @staticmethod
+    def circuit_open(host):
+        # returns the seconds left while the host is skipped, after that one trial request is let through
+        remaining = r.ttl(f"webhook_circuit:open:{host}")
+        if remaining and remaining > 0:
+            return remaining
+        failures = int(r.get(f"webhook_circuit:failures:{host}") or 0)
+        if failures >= WEBHOOK_CIRCUIT_FAILURES and not r.set(
+            f"webhook_circuit:trial:{host}", 1, nx=True, ex=int(WEBHOOK_CONNECT_TIMEOUT + WEBHOOK_READ_TIMEOUT)
+        ):
+            # wait for the trial request in flight to settle the circuit
+            return max(r.ttl(f"webhook_circuit:trial:{host}"), 1)
+        return 0
+
+    @staticmethod
+    def record_result(host, ok):
+        if ok:
+            r.delete(f"webhook_circuit:failures:{host}", f"webhook_circuit:trial:{host}")
+            return
+        failures, _ = r.pipeline().incr(f"webhook_circuit:failures:{host}").expire(
+            f"webhook_circuit:failures:{host}", WEBHOOK_CIRCUIT_RESET * 10
+        ).execute()
+        if failures >= WEBHOOK_CIRCUIT_FAILURES:
+            r.pipeline().set(f"webhook_circuit:open:{host}", 1, ex=WEBHOOK_CIRCUIT_RESET).delete(
+                f"webhook_circuit:trial:{host}"
+            ).execute()
+            logger.warning(f"WebhookDispatcher :: circuit open for {host} after {failures} failures")
+
+    @staticmethod
+    def deliver(merchant_key, url, attempt=0, throttled=0, **request_kwargs):
+        # one attempt, returns (outcome, seconds to wait before the next attempt)
+        if not url:
+            return WebhookDispatcher.FAILED, 0
+        host = WebhookDispatcher.host(url)
+        remaining = WebhookDispatcher.circuit_open(host)
+        if remaining:
+            return WebhookDispatcher.retry_or_fail(attempt, remaining + WebhookDispatcher.backoff(attempt))
+        token = WebhookDispatcher.acquire_slot(merchant_key)
+        if token is None:
+            if throttled + 1 >= WEBHOOK_MAX_THROTTLED:
+                return WebhookDispatcher.FAILED, 0
+            return WebhookDispatcher.THROTTLED, WebhookDispatcher.backoff(1)
+        status_code = None
+        try:
+            resp = WebhookDispatcher.session(host).post(
+                url, timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT), **request_kwargs
+            )
+            logger.info("Webhook url response %s :: data %s", resp.status_code, Payload(resp.content))
+            status_code = resp.status_code
+        except requests.RequestException as e:
+            logger.error(f"WebhookDispatcher :: {host} attempt {attempt} failed {e}")
+        finally:
+            WebhookDispatcher.release_slot(merchant_key, token)
+        return WebhookDispatcher.outcome(host, attempt, status_code)
+
+    @staticmethod
+    def outcome(host, attempt, status_code):
+        # status_code is None when no response came back
+        ok = status_code is not None and 200 <= status_code < 300
+        retry = status_code is None or status_code in RETRY_STATUS_CODES
+        # a 4xx means the merchant answered, only unreachable or failing hosts trip the circuit
+        WebhookDispatcher.record_result(host, ok or not retry)
+        if ok:
+            return WebhookDispatcher.SENT, 0
+        if retry:
+            return WebhookDispatcher.retry_or_fail(attempt, WebhookDispatcher.backoff(attempt))
+        return WebhookDispatcher.FAILED, 0
+
+    @staticmethod
+    def request_kwargs(table, webhook_data):
+        # bulk webhooks have always been form encoded, the rest are sent as json
+        if table == 'bulk_api_request_log':
+            return {'data': webhook_data}
+        return {'data': json.dumps(webhook_data), 'headers': {"content-type": "application/json"}}
+
+
+class WebhookStatusBuffer:
+    # table -> sql merging webhook_status into extra_data for every (request_id, status) pair
+    UPDATES = {
+        'post_processing_request': """
+            update post_processing_request ppr
+            set extra_data = coalesce(ppr.extra_data, '{}'::jsonb) || jsonb_build_object('webhook_status', v.status)
+            from unnest(cast(:request_ids as varchar[]), cast(:statuses as varchar[])) as v(request_id, status)
+            where ppr.request_id = v.request_id
+        """,
+        'bulk_api_request_log': """
+            update bulk_api_request_log bl
+            set extra_data = coalesce(bl.extra_data, '{}'::jsonb) || jsonb_build_object('webhook_status', v.status)
+            from unnest(cast(:request_ids as varchar[]), cast(:statuses as varchar[])) as v(request_id, status)
+            where bl.request_id = v.request_id
+        """,
+    }
+
+    @staticmethod
+    def add(table, request_id, status):
+        # the buffer lives in redis so statuses from every worker share a batch and survive a restart
+        pending, _ = r.pipeline().hset(WEBHOOK_STATUS_KEY, f"{table}:{request_id}", status).hlen(
+            WEBHOOK_STATUS_KEY
+        ).execute()
+        if pending >= WEBHOOK_STATUS_BATCH_SIZE:
+            WebhookStatusBuffer.flush()
+
+    @staticmethod
+    def flush():
+        flushing_key = f"{WEBHOOK_STATUS_KEY}:{uuid.uuid4().hex}"
+        try:
+            r.rename(WEBHOOK_STATUS_KEY, flushing_key)
+        except redis.ResponseError:
+            # nothing buffered, or another worker took the batch
+            return 0
+        statuses = r.hgetall(flushing_key)
+        try:
+            WebhookStatusBuffer.write(statuses)
+        except Exception as e:
+            logger.error(f"WebhookStatusBuffer :: flush failed {e}, requeued {len(statuses)} statuses")
+            # statuses written after the rename are newer, they are kept
+            pipe = r.pipeline()
+            for field, status in statuses.items():
+                pipe.hsetnx(WEBHOOK_STATUS_KEY, field, status)
+            pipe.execute()
+            return 0
+        finally:
+            r.delete(flushing_key)
+        logger.info("WebhookStatusBuffer :: flushed %s", Payload(len(statuses)))
+        return len(statuses)
+
+    @staticmethod
+    def write(statuses):
+        # {"<table>:<request_id>": status}, one update per table in a single transaction
+        groups = {}
+        for field, status in statuses.items():
+            table, request_id = field.split(':', 1)
+            groups.setdefault(table, ([], []))
+            groups[table][0].append(request_id)
+            groups[table][1].append(status)
+        db = next(get_db())
+        try:
+            for table, (request_ids, status_list) in groups.items():
+                db.execute(text(WebhookStatusBuffer.UPDATES[table]), [{
+                    'request_ids': request_ids, 'statuses': status_list
+                }])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class WebhookQueue:
+    # sorted set of json deliveries scored by the time they are due, claiming pushes the score out by the lease
+    CLAIM = r.register_script("""
+        local items = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'limit', 0, ARGV[2])
+        for _, item in ipairs(items) do
+            redis.call('zadd', KEYS[1], ARGV[3], item)
+        end
+        return items
+    """)
+
+    @staticmethod
+    def push(table, merchant_key, webhook_data, attempt=0, delay=0):
+        item = json.dumps({
+            'id': uuid.uuid4().hex, 'table': table, 'merchant_key': merchant_key,
+            'data': webhook_data, 'attempt': attempt
+        })
+        r.zadd(WEBHOOK_QUEUE_KEY, {item: time.time() + delay})
+
+    @staticmethod
+    def claim(count):
+        now = time.time()
+        items = WebhookQueue.CLAIM(keys=[WEBHOOK_QUEUE_KEY], args=[now, count, now + WEBHOOK_ASYNC_LEASE])
+        return [(item, json.loads(item)) for item in items]
+
+
+class ExecutorHttpClient:
+    # async facade over WebhookDispatcher's per-host keep-alive sessions, requests run on a thread pool
+    def __init__(self, max_workers=WEBHOOK_ASYNC_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='webhook-http')
+
+    async def post(self, url, **request_kwargs):
+        session = WebhookDispatcher.session(WebhookDispatcher.host(url))
+        resp = await asyncio.get_running_loop().run_in_executor(self.executor, partial(
+            session.post, url, timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT), **request_kwargs
+        ))
+        return resp.status_code
+
+    async def aclose(self):
+        self.executor.shutdown(wait=True)
+
+
+class AsyncWebhookWorker:
+    # any client with "async post(url, **request_kwargs) -> status code" and "async aclose()" can be passed in
+    def __init__(self, client=None):
+        self.client = client or ExecutorHttpClient()
+        self.merchant_slots = defaultdict(lambda: asyncio.Semaphore(WEBHOOK_MERCHANT_CONCURRENCY))
+        # merchant_key -> (url, monotonic time it expires)
+        self.webhook_urls = {}
+
+    @staticmethod
+    async def call(func, *args):
+        # redis and database calls stay off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    @staticmethod
+    def resolve_urls(merchant_keys):
+        import utils
+
+        db = next(get_db())
+        try:
+            return {merchant_key: utils.get_webhook_url(db, merchant_key) for merchant_key in merchant_keys}
+        finally:
+            db.close()
+
+    async def deliver(self, member, item, url):
+        attempt = item['attempt']
+        if not url:
+            return member, item, WebhookDispatcher.FAILED, 0
+        host = WebhookDispatcher.host(url)
+        try:
+            remaining = await self.call(WebhookDispatcher.circuit_open, host)
+            if remaining:
+                return (member, item, *WebhookDispatcher.retry_or_fail(
+                    attempt, remaining + WebhookDispatcher.backoff(attempt)
+                ))
+            status_code = None
+            # concurrency per merchant is limited within this worker, the merchant waits instead of retrying
+            async with self.merchant_slots[item['merchant_key']]:
+                try:
+                    status_code = await self.client.post(
+                        url, **WebhookDispatcher.request_kwargs(item['table'], item['data'])
+                    )
+                except Exception as e:
+                    logger.error(f"AsyncWebhookWorker :: {host} attempt {attempt} failed {e}")
+            outcome, countdown = await self.call(WebhookDispatcher.outcome, host, attempt, status_code)
+            return member, item, outcome, countdown
+        except Exception as e:
+            logger.error(f"AsyncWebhookWorker :: delivery {item['id']} failed {e}")
+            return (member, item, *WebhookDispatcher.retry_or_fail(attempt, WebhookDispatcher.backoff(attempt)))
+
+    @staticmethod
+    def complete(results):
+        # final statuses in one bulk update, then the batch leaves the queue, a crash in between redelivers it
+        statuses = {
+            f"{item['table']}:{item['data'].get('requestId')}": outcome
+            for _, item, outcome, _ in results
+            if outcome in (WebhookDispatcher.SENT, WebhookDispatcher.FAILED)
+        }
+        if statuses:
+            WebhookStatusBuffer.write(statuses)
+        pipe = r.pipeline()
+        for member, item, outcome, countdown in results:
+            pipe.zrem(WEBHOOK_QUEUE_KEY, member)
+            if outcome in (WebhookDispatcher.RETRY, WebhookDispatcher.THROTTLED):
+                retry_item = dict(item, attempt=item['attempt'] + (outcome == WebhookDispatcher.RETRY))
+                pipe.zadd(WEBHOOK_QUEUE_KEY, {json.dumps(retry_item): time.time() + countdown})
+        pipe.execute()
+        logger.info("AsyncWebhookWorker :: completed %s, statuses written %s", len(results), len(statuses))
+
+    async def write(self, done):
+        try:
+            await self.call(self.complete, done)
+            return True
+        except Exception as e:
+            # kept for the next round, the leases hold the deliveries meanwhile
+            logger.error(f"AsyncWebhookWorker :: writing {len(done)} results failed {e}")
+            return False
+
+    async def claim(self, count):
+        try:
+            claimed = await self.call(WebhookQueue.claim, count)
+            now = time.monotonic()
+            missing = {
+                item['merchant_key'] for _, item in claimed
+                if self.webhook_urls.get(item['merchant_key'], (None, 0))[1] <= now
+            }
+            if missing:
+                expires = now + WEBHOOK_ASYNC_URL_TTL
+                self.webhook_urls.update({
+                    merchant_key: (url, expires)
+                    for merchant_key, url in (await self.call(self.resolve_urls, missing)).items()
+                })
+            return claimed
+        except Exception as e:
+            # anything claimed comes back once its lease runs out
+            logger.error(f"AsyncWebhookWorker :: claim failed {e}")
+            return []
+
+    async def run(self, stop=None):
+        # runs until stop (an asyncio.Event) is set, then drains the deliveries already in flight
+        loop = asyncio.get_running_loop()
+        in_flight, done = set(), []
+        last_write = loop.time()
+        try:
+            while True:
+                stopping = stop is not None and stop.is_set()
+                free = WEBHOOK_ASYNC_CONCURRENCY - len(in_flight)
+                refill = min(WEBHOOK_ASYNC_BATCH_SIZE, WEBHOOK_ASYNC_CONCURRENCY) // 2
+                if not stopping and (not in_flight or free >= refill):
+                    claimed = await self.claim(min(free, WEBHOOK_ASYNC_BATCH_SIZE))
+                    for member, item in claimed:
+                        url = self.webhook_urls.get(item['merchant_key'], (None, 0))[0]
+                        in_flight.add(asyncio.ensure_future(self.deliver(member, item, url)))
+                if in_flight:
+                    finished, in_flight = await asyncio.wait(
+                        in_flight, timeout=WEBHOOK_ASYNC_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    done.extend(task.result() for task in finished)
+                elif stopping:
+                    break
+                else:
+                    await asyncio.sleep(WEBHOOK_ASYNC_POLL_INTERVAL)
+                due = loop.time() - last_write >= WEBHOOK_ASYNC_POLL_INTERVAL
+                if done and (len(done) >= WEBHOOK_ASYNC_BATCH_SIZE or due or stopping):
+                    last_write = loop.time()
+                    if await self.write(done):
+                        done = []
+            if done:
+                await self.write(done)
+        finally:
+            await self.client.aclose()
+
+
+def run_async_worker():
+    logger.info("AsyncWebhookWorker :: started")
+    asyncio.run(AsyncWebhookWorker().run())
+
+
+### run async webhook worker :: python webhooks.py (with WEBHOOK_WORKER_MODE=async)
+if __name__ == '__main__':
+    run_async_worker()